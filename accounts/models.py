@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from PIL import Image
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
 
 
 class User(AbstractUser):
@@ -22,7 +28,7 @@ class User(AbstractUser):
     reputation = models.IntegerField(default=0)
     post_count = models.IntegerField(default=0)
     thread_count = models.IntegerField(default=0)
-    last_seen = models.DateTimeField(auto_now=True)
+    last_seen = models.DateTimeField(default=timezone.now)
     is_banned = models.BooleanField(default=False)
     ban_reason = models.TextField(blank=True)
     signature = models.TextField(max_length=200, blank=True)
@@ -37,15 +43,32 @@ class User(AbstractUser):
     
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        cache.delete(user_cache_key(self.pk))
         
         # Resize avatar if it exists
-        if self.avatar:
+        update_fields = kwargs.get('update_fields')
+        if self.avatar and (update_fields is None or 'avatar' in update_fields):
+            # Pillow нужен только здесь, не при загрузке моделей
+            from PIL import Image
             img = Image.open(self.avatar.path)
             if img.height > 300 or img.width > 300:
                 output_size = (300, 300)
                 img.thumbnail(output_size)
                 img.save(self.avatar.path)
     
+    def delete(self, *args, **kwargs):
+        cache.delete(user_cache_key(self.pk))
+        return super().delete(*args, **kwargs)
+    
+    def touch_last_seen(self):
+        """Обновление last_seen не чаще раза в LAST_SEEN_UPDATE_INTERVAL секунд, узким UPDATE"""
+        interval = getattr(settings, 'LAST_SEEN_UPDATE_INTERVAL', 300)
+        if not cache.add(f'last_seen:{self.pk}', 1, timeout=interval):
+            return False
+        self.last_seen = timezone.now()
+        User.objects.filter(pk=self.pk).update(last_seen=self.last_seen)
+        return True
+    
     def is_moderator(self):
         return self.role in ['moderator', 'admin']
     
@@ -57,10 +80,10 @@ class User(AbstractUser):
     
     def update_stats(self):
         """Обновление статистики пользователя"""
-        from forum.models import Thread, Post
-        self.thread_count = Thread.objects.filter(author=self).count()
-        self.post_count = Post.objects.filter(author=self).count()
-        self.save()
+        from forum.models import Thread, Post, ArchivedThread, ArchivedPost
+        self.thread_count = Thread.objects.filter(author=self).count() + ArchivedThread.objects.filter(author=self).count()
+        self.post_count = Post.objects.filter(author=self).count() + ArchivedPost.objects.filter(author=self).count()
+        self.save(update_fields=['thread_count', 'post_count'])
 
 
 class UserProfile(models.Model):
@@ -1,6 +1,16 @@
-from django.test import TestCase
+import gzip
+import json
+
+from django.test import TestCase, RequestFactory
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from forum.models import Category, Thread, Post, PrivateMessage
+from .middleware import CachedAuthenticationMiddleware
+from .models import UserProfile, user_cache_key
 
 User = get_user_model()
 
@@ -36,3 +46,101 @@ class UserModelTest(TestCase):
         profile = UserProfile.objects.create(user=self.user)
         self.assertEqual(profile.user, self.user)
         self.assertTrue(profile.email_notifications)
+
+
+class CachedAuthTest(TestCase):
+    """Тесты кеширования пользователя и троттлинга last_seen"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+    
+    def load_user(self):
+        request = RequestFactory().get('/')
+        request.COOKIES['sessionid'] = self.session_key
+        SessionMiddleware(lambda r: None).process_request(request)
+        CachedAuthenticationMiddleware(lambda r: None).process_request(request)
+        with CaptureQueriesContext(connection) as ctx:
+            user = request.user
+            user.is_authenticated
+        return user, [q['sql'] for q in ctx.captured_queries]
+    
+    def test_user_loaded_from_cache(self):
+        """Тест: повторный запрос не делает SELECT пользователя"""
+        user, queries = self.load_user()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(any('accounts_user' in sql for sql in queries))
+        user, queries = self.load_user()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertFalse(any('accounts_user' in sql for sql in queries))
+    
+    def test_cache_invalidated_on_save(self):
+        """Тест: сохранение пользователя сбрасывает кеш"""
+        self.load_user()
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.role = 'moderator'
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        user, _ = self.load_user()
+        self.assertEqual(user.role, 'moderator')
+    
+    def test_password_change_logs_out(self):
+        """Тест: смена пароля делает сессию недействительной и с кешем"""
+        self.load_user()
+        cached = cache.get(user_cache_key(self.user.pk))
+        cached.set_password('another-pass-456')
+        cache.set(user_cache_key(self.user.pk), cached)
+        user, _ = self.load_user()
+        self.assertFalse(user.is_authenticated)
+    
+    def test_last_seen_throttled(self):
+        """Тест: last_seen пишется не чаще раза в интервал"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(self.user.touch_last_seen())
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('"last_seen"', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('"email"', ctx.captured_queries[0]['sql'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(self.user.touch_last_seen())
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+
+class DataExportTest(TestCase):
+    """Тесты выгрузки данных пользователя"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        category = Category.objects.create(name='Category', slug='category')
+        thread = Thread.objects.create(title='Thread', category=category, author=self.other, content='Текст')
+        Post.objects.create(thread=thread, author=self.user, content='Мой ответ')
+        Post.objects.create(thread=thread, author=self.other, content='Чужой ответ')
+        PrivateMessage.objects.create(sender=self.other, recipient=self.user, subject='Привет', content='Секрет')
+    
+    def test_requires_login(self):
+        """Тест: выгрузка только для авторизованных"""
+        response = self.client.get(reverse('accounts:data_export'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_export_streams_own_data(self):
+        """Тест: в выгрузке только данные пользователя, ответ потоковый"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('accounts:data_export'), {'compress': 'gzip'})
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        by_dataset = {}
+        for record in records:
+            by_dataset.setdefault(record['dataset'], []).append(record)
+        self.assertEqual([user['email'] for user in by_dataset['users']], ['test@example.com'])
+        self.assertEqual([post['content'] for post in by_dataset['posts']], ['Мой ответ'])
+        self.assertEqual([message['content'] for message in by_dataset['messages']], ['Секрет'])
+        self.assertNotIn('threads', by_dataset)
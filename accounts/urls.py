@@ -19,4 +19,5 @@ urlpatterns = [
     # Профиль
     path('profile/<str:username>/', views.profile, name='profile'),
     path('profile-edit/', views.profile_edit, name='profile_edit'),
+    path('profile-export/', views.data_export, name='data_export'),
 ]
@@ -3,7 +3,12 @@ from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
 
+from forum import activity, export
+from forum.ratelimit import ratelimit
 from .forms import SignupForm, UserUpdateForm, ProfileUpdateForm
 from .models import UserProfile
 
@@ -33,14 +38,18 @@ def signup(request):
 
 def profile(request, username):
     """Просмотр профиля пользователя"""
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(User.objects.select_related('stat'), username=username)
     
     # Создать профиль если не существует
     profile, created = UserProfile.objects.get_or_create(user=user)
+    # Репутация, категории и лента - из предпосчитанных агрегатов
+    stat, top_categories = activity.profile_stats(user)
     
     context = {
         'profile_user': user,
         'profile': profile,
+        'stat': stat,
+        'top_categories': top_categories,
     }
     return render(request, 'accounts/profile.html', context)
 
@@ -69,3 +78,16 @@ def profile_edit(request):
         'profile_form': profile_form,
     }
     return render(request, 'accounts/profile_edit.html', context)
+
+
+@login_required
+@ratelimit('export', methods=('GET',))
+def data_export(request):
+    """Скачать все свои данные одним файлом JSON Lines (по запросу GDPR)"""
+    compress = 'gzip' if request.GET.get('compress') == 'gzip' else None
+    filename = f'{request.user.username}-{timezone.now():%Y%m%d}.jsonl' + export.EXTENSIONS.get(compress, '')
+    response = StreamingHttpResponse(export.user_export(request.user, compress=compress),
+                                     content_type='application/gzip' if compress else 'application/x-ndjson')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Cache-Control'] = 'private, no-store'
+    return response
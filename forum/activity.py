@@ -0,0 +1,127 @@
+"""Агрегаты профиля: репутация, активность по категориям и лента последних действий.
+
+Профиль не считает ничего на запрос: полученные лайки и последние темы и
+сообщения хранятся в ``UserStat``, число тем и сообщений по категориям - в
+``UserCategoryStat``. Новая тема, сообщение, лайк и их удаление меняют
+агрегаты автора сразу, узкими UPDATE в той же транзакции (методы
+``UserStat.record*``). Профиль читает их двумя запросами: пользователь вместе
+с ``UserStat`` и несколько самых активных категорий по индексу.
+
+Удаление тем и сообщений (в том числе каскадом, см. forum/signals.py) и
+скрытие модератором обновляют агрегаты через ``UserStat.forget``. Генератор
+данных событий не порождает, поэтому есть полный пересчет
+``rebuild_user_stats``. Агрегаты пользователя, у которого еще нет
+``UserStat``, считаются при первом просмотре его профиля.
+
+Репутация (``User.reputation``) - полученные лайки минус дизлайки, без
+реакций на собственные сообщения; лайки сообщений из архива сохраняются.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from accounts.models import user_cache_key
+from .models import Thread, Post, Like, ArchivedThread, ArchivedPost, UserStat, UserCategoryStat
+
+TOP_CATEGORIES = 5
+
+
+def _scoped(queryset, field, user_ids):
+    return queryset if user_ids is None else queryset.filter(**{f'{field}__in': user_ids})
+
+
+def _category_counts(user_ids):
+    """{(пользователь, категория): [тем, сообщений]}"""
+    counts = defaultdict(lambda: [0, 0])
+    sources = ((Thread, 'category', 0), (ArchivedThread, 'category', 0),
+               (Post, 'thread__category', 1), (ArchivedPost, 'thread__category', 1))
+    for model, category, index in sources:
+        rows = (_scoped(model.objects, 'author', user_ids).order_by().values('author', category)
+                .annotate(n=Count('pk')).values_list('author', category, 'n'))
+        for author_id, category_id, n in rows:
+            counts[author_id, category_id][index] += n
+    return counts
+
+
+def _reactions(user_ids):
+    """{автор: [лайков, дизлайков]} без реакций на свои сообщения"""
+    received = defaultdict(lambda: [0, 0])
+    rows = (_scoped(Like.objects.exclude(user=F('post__author')), 'post__author', user_ids).order_by()
+            .values('post__author', 'like_type').annotate(n=Count('pk')).values_list('post__author', 'like_type', 'n'))
+    for author_id, like_type, n in rows:
+        received[author_id][0 if like_type == 1 else 1] += n
+    for author_id, likes in _scoped(ArchivedPost.objects, 'author', user_ids).values_list('author', 'likes').iterator():
+        for user_id, like_type, created_at in likes:
+            if user_id != author_id:
+                received[author_id][0 if like_type == 1 else 1] += 1
+    return received
+
+
+def _recent(user_ids):
+    """{пользователь: лента} из последних RECENT_SIZE тем и сообщений каждого"""
+    rank = Window(RowNumber(), partition_by=F('author'), order_by=[F('created_at').desc(), F('pk').desc()])
+    entries = defaultdict(list)
+    threads = (_scoped(Thread.objects.filter(is_active=True), 'author', user_ids).annotate(rank=rank)
+               .filter(rank__lte=UserStat.RECENT_SIZE).only('author_id', 'title', 'slug', 'created_at'))
+    for thread in threads:
+        entries[thread.author_id].append(
+            UserStat.entry('thread', thread.pk, thread.title, thread.slug, thread.created_at))
+    posts = (_scoped(Post.objects.filter(is_active=True, thread__is_active=True), 'author', user_ids)
+             .annotate(rank=rank).filter(rank__lte=UserStat.RECENT_SIZE)
+             .select_related('thread').only('author_id', 'created_at', 'thread__title', 'thread__slug'))
+    for post in posts:
+        entries[post.author_id].append(
+            UserStat.entry('post', post.pk, post.thread.title, post.thread.slug, post.created_at))
+    return {user_id: sorted(items, key=lambda item: item['at'], reverse=True)[:UserStat.RECENT_SIZE]
+            for user_id, items in entries.items()}
+
+
+def rebuild_user_stats(user_ids=None):
+    """Пересчитать агрегаты пользователей с нуля (None - всех); возвращает число пользователей"""
+    User = get_user_model()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    users = list(_scoped(User.objects.all(), 'pk', user_ids).only('pk', 'reputation'))
+    ids = None if user_ids is None else [user.pk for user in users]
+    categories = _category_counts(ids)
+    received = _reactions(ids)
+    recent = _recent(ids)
+    with transaction.atomic():
+        _scoped(UserStat.objects.all(), 'user', ids).delete()
+        _scoped(UserCategoryStat.objects.all(), 'user', ids).delete()
+        UserStat.objects.bulk_create([
+            UserStat(user_id=user.pk, likes_received=received[user.pk][0], dislikes_received=received[user.pk][1],
+                     recent=recent.get(user.pk, []))
+            for user in users
+        ], batch_size=500)
+        UserCategoryStat.objects.bulk_create([
+            UserCategoryStat(user_id=user_id, category_id=category_id, thread_count=threads, post_count=posts)
+            for (user_id, category_id), (threads, posts) in categories.items()
+        ], batch_size=500)
+        for user in users:
+            user.reputation = received[user.pk][0] - received[user.pk][1]
+        User.objects.bulk_update(users, ['reputation'], batch_size=500)
+    # bulk_update минует User.save и его сброс кеша
+    cache.delete_many([user_cache_key(user.pk) for user in users])
+    return len(users)
+
+
+def profile_stats(user):
+    """(UserStat, самые активные категории) для профиля.
+
+    user должен быть загружен с select_related('stat'); без агрегатов они
+    считаются сейчас.
+    """
+    try:
+        stat = user.stat
+    except UserStat.DoesNotExist:
+        rebuild_user_stats([user.pk])
+        stat = UserStat.objects.get(pk=user.pk)
+        user.reputation = stat.likes_received - stat.dislikes_received
+    categories = list(UserCategoryStat.objects.filter(Q(post_count__gt=0) | Q(thread_count__gt=0), user=user)
+                      .select_related('category').order_by('-post_count', '-thread_count')[:TOP_CATEGORIES])
+    return stat, categories
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Thread, Post, Like, Attachment, Report, PrivateMessage
+from .models import Category, Thread, Post, Like, Attachment, Report, PrivateMessage, ArchivedThread
+from .signals import batched
 
 
 @admin.register(Category)
@@ -12,12 +13,17 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Thread)
 class ThreadAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'author', 'views', 'is_pinned', 'is_locked', 'is_active', 'created_at')
+    list_display = ('title', 'category', 'author', 'views', 'reply_count', 'is_pinned', 'is_locked', 'is_active', 'created_at')
     list_filter = ('category', 'is_pinned', 'is_locked', 'is_active', 'created_at')
     search_fields = ('title', 'content', 'author__username')
     prepopulated_fields = {'slug': ('title',)}
     raw_id_fields = ('author',)
     date_hierarchy = 'created_at'
+    
+    def delete_queryset(self, request, queryset):
+        # Пересчеты после удаления - один раз на весь список
+        with batched():
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(Post)
@@ -27,6 +33,10 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('content', 'author__username', 'thread__title')
     raw_id_fields = ('thread', 'author')
     date_hierarchy = 'created_at'
+    
+    def delete_queryset(self, request, queryset):
+        with batched():
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(Like)
@@ -61,3 +71,13 @@ class PrivateMessageAdmin(admin.ModelAdmin):
     search_fields = ('subject', 'sender__username', 'recipient__username')
     raw_id_fields = ('sender', 'recipient')
     date_hierarchy = 'created_at'
+
+
+@admin.register(ArchivedThread)
+class ArchivedThreadAdmin(admin.ModelAdmin):
+    list_display = ('title', 'category', 'author', 'reply_count', 'is_active', 'last_post_at', 'archived_at')
+    list_filter = ('category', 'is_active')
+    search_fields = ('title', 'author__username')
+    raw_id_fields = ('author',)
+    date_hierarchy = 'archived_at'
+    readonly_fields = [field.name for field in ArchivedThread._meta.fields]
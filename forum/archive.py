@@ -0,0 +1,267 @@
+"""Архив старых и скрытых тем.
+
+Темы без активности дольше ``ARCHIVE_AFTER_DAYS`` дней и скрытые темы старше
+``INACTIVE_AFTER_DAYS`` дней переносятся вместе с сообщениями в
+``ArchivedThread``/``ArchivedPost`` с теми же id, а HTML сообщений
+замораживается при переносе. Горячие таблицы и их индексы содержат только
+живые темы; ``thread_detail`` при промахе по slug читает архив, так что ссылки
+продолжают работать.
+
+Перенос и восстановление идут пачками: каждая пачка - отдельная короткая
+транзакция, поэтому блокировки не держатся на время всего прогона. Лайки,
+вложения, закрытые жалобы (история модерации), теги и подписки сохраняются в
+JSON архивной записи и возвращаются при восстановлении; уведомления о
+перенесенных темах удаляются. Slug архивной темы остается занятым
+(``Thread.free_slug``), поэтому ее ссылки не перехватит новая тема.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from taggit.models import Tag, TaggedItem
+
+from moderation.services import refresh_open_report_counts
+from notifications.models import ThreadSubscription, Notification, NotificationState
+from . import trending
+from .models import Thread, Post, Like, Attachment, Blob, Report, ArchivedThread, ArchivedPost
+from .rendering import render_many
+from .signals import batched
+from .similar import rebuild_index
+from .tags import refresh_tag_stats
+
+User = get_user_model()
+
+ARCHIVE_AFTER_DAYS = 365
+INACTIVE_AFTER_DAYS = 30
+BATCH_SIZE = 100
+
+
+def archive_candidates(now=None, after_days=ARCHIVE_AFTER_DAYS, inactive_days=INACTIVE_AFTER_DAYS):
+    """Темы для переноса: давно без ответов или давно скрытые.
+
+    Закрепленные темы и темы с открытыми жалобами остаются в горячих таблицах.
+    """
+    now = now or timezone.now()
+    return (Thread.objects
+            .filter(Q(last_post_at__lt=now - timedelta(days=after_days))
+                    | Q(is_active=False, updated_at__lt=now - timedelta(days=inactive_days)))
+            .exclude(is_pinned=True)
+            .exclude(posts__open_report_count__gt=0))
+
+
+def _refresh_authors(author_ids):
+    for user in User.objects.filter(pk__in=author_ids):
+        user.update_stats()
+
+
+def archive_threads(thread_ids):
+    """Перенести темы в архив одной транзакцией; возвращает число тем"""
+    content_type = ContentType.objects.get_for_model(Thread)
+    with transaction.atomic():
+        threads = list(Thread.objects.select_for_update().filter(pk__in=thread_ids))
+        if not threads:
+            return 0
+        ids = [thread.pk for thread in threads]
+        posts = list(Post.objects.filter(thread_id__in=ids))
+        post_ids = [post.pk for post in posts]
+
+        likes = defaultdict(list)
+        for post_id, user_id, like_type, created_at in (Like.objects.filter(post_id__in=post_ids)
+                                                        .values_list('post_id', 'user_id', 'like_type', 'created_at')):
+            likes[post_id].append([user_id, like_type, created_at.isoformat()])
+        reports = defaultdict(list)
+        for report in Report.objects.filter(post_id__in=post_ids).order_by('pk'):
+            reports[report.post_id].append([
+                report.reporter_id, report.report_type, report.description, report.status, report.moderator_id,
+                report.moderator_note, report.created_at.isoformat(),
+                report.resolved_at.isoformat() if report.resolved_at else None,
+            ])
+        attachments = defaultdict(list)
+        for attachment in Attachment.objects.filter(post_id__in=post_ids):
+            attachments[attachment.post_id].append([attachment.file.name, attachment.filename, attachment.size,
+                                                    attachment.uploaded_at.isoformat(), attachment.blob_id])
+        tags = defaultdict(list)
+        for object_id, name in (TaggedItem.objects.filter(content_type=content_type, object_id__in=ids)
+                                .values_list('object_id', 'tag__name')):
+            tags[object_id].append(name)
+        subscribers = defaultdict(list)
+        for thread_id, user_id in ThreadSubscription.objects.filter(thread_id__in=ids).values_list('thread_id', 'user_id'):
+            subscribers[thread_id].append(user_id)
+        recipients = set(Notification.objects.filter(Q(thread_id__in=ids) | Q(post_id__in=post_ids))
+                         .values_list('recipient_id', flat=True))
+
+        thread_html = render_many(thread.content for thread in threads)
+        post_html = render_many(post.content for post in posts)
+        ArchivedThread.objects.bulk_create([
+            ArchivedThread(
+                id=thread.pk, title=thread.title, slug=thread.slug, category_id=thread.category_id,
+                author_id=thread.author_id, content=thread.content, content_html=html,
+                views=thread.views, is_pinned=thread.is_pinned, is_locked=thread.is_locked,
+                is_active=thread.is_active, created_at=thread.created_at, updated_at=thread.updated_at,
+                reply_count=thread.reply_count, last_post_at=thread.last_post_at,
+                tags=tags[thread.pk], subscribers=subscribers[thread.pk],
+            )
+            for thread, html in zip(threads, thread_html)
+        ])
+        ArchivedPost.objects.bulk_create([
+            ArchivedPost(
+                id=post.pk, thread_id=post.thread_id, author_id=post.author_id, content=post.content,
+                content_html=html, position=post.position, is_edited=post.is_edited, edited_at=post.edited_at,
+                is_active=post.is_active, created_at=post.created_at, updated_at=post.updated_at,
+                like_count=sum(1 for like in likes[post.pk] if like[1] == 1),
+                dislike_count=sum(1 for like in likes[post.pk] if like[1] == -1),
+                likes=likes[post.pk], attachments=attachments[post.pk], reports=reports[post.pk],
+            )
+            for post, html in zip(posts, post_html)
+        ], batch_size=500)
+        # Архив держит свои ссылки на файлы; ссылки удаляемых вложений снимает
+        # post_delete, так что ref_count в сумме не меняется
+        Blob.change_refs([item[4] for items in attachments.values() for item in items if item[4]], 1)
+
+        # Каскадом удаляются сообщения, лайки, жалобы, вложения, привязки тегов,
+        # подписки и уведомления; LSH-бакеты и счетчики тегов и файлов пересчитываются
+        # один раз на пачку (forum/signals.py). Агрегаты профиля архив учитывает сам
+        with batched(ignore={'activity'}):
+            Thread.objects.filter(pk__in=ids).delete()
+
+        NotificationState.refresh(recipients)
+        _refresh_authors({thread.author_id for thread in threads} | {post.author_id for post in posts})
+    return len(threads)
+
+
+def _unique_slug(slug, pk):
+    """Slug мог занять новая тема, пока старая была в архиве"""
+    return f'{slug[:180]}-{pk}' if Thread.objects.filter(slug=slug).exists() else slug
+
+
+def restore_threads(thread_ids):
+    """Вернуть темы из архива одной транзакцией; возвращает число тем"""
+    content_type = ContentType.objects.get_for_model(Thread)
+    with transaction.atomic():
+        archived = list(ArchivedThread.objects.select_for_update().filter(pk__in=thread_ids))
+        if not archived:
+            return 0
+        ids = [thread.pk for thread in archived]
+        posts = list(ArchivedPost.objects.filter(thread_id__in=ids))
+        sequences = defaultdict(int)
+        for post in posts:
+            sequences[post.thread_id] = max(sequences[post.thread_id], post.position)
+
+        threads = [
+            Thread(
+                id=thread.pk, title=thread.title, slug=_unique_slug(thread.slug, thread.pk),
+                category_id=thread.category_id, author_id=thread.author_id, content=thread.content,
+                views=thread.views, is_pinned=thread.is_pinned, is_locked=thread.is_locked,
+                is_active=thread.is_active, created_at=thread.created_at, updated_at=thread.updated_at,
+                last_post_at=thread.last_post_at, post_sequence=sequences[thread.pk],
+                **trending.initial_scores(thread.created_at),
+            )
+            for thread in archived
+        ]
+        restored_posts = [
+            Post(
+                id=post.pk, thread_id=post.thread_id, author_id=post.author_id, content=post.content,
+                is_edited=post.is_edited, edited_at=post.edited_at, is_active=post.is_active,
+                position=post.position, created_at=post.created_at, updated_at=post.updated_at,
+            )
+            for post in posts
+        ]
+        likes = [
+            Like(post_id=post.pk, user_id=user_id, like_type=like_type, created_at=parse_datetime(created_at))
+            for post in posts for user_id, like_type, created_at in post.likes
+        ]
+        attachments = [
+            Attachment(post_id=post.pk, file=name, filename=filename, size=size, uploaded_at=parse_datetime(uploaded_at),
+                       blob_id=blob_id[0] if blob_id else None)
+            for post in posts for name, filename, size, uploaded_at, *blob_id in post.attachments
+        ]
+        reports = [
+            Report(post_id=post.pk, reporter_id=reporter_id, report_type=report_type, description=description,
+                   status=status, moderator_id=moderator_id, moderator_note=note,
+                   created_at=parse_datetime(created_at), resolved_at=resolved_at and parse_datetime(resolved_at))
+            for post in posts
+            for reporter_id, report_type, description, status, moderator_id, note, created_at, resolved_at
+            in post.reports
+        ]
+        for model, objs, fields in ((Thread, threads, ['created_at', 'updated_at']),
+                                    (Post, restored_posts, ['created_at', 'updated_at']),
+                                    (Like, likes, ['created_at']),
+                                    (Attachment, attachments, ['uploaded_at']),
+                                    (Report, reports, ['created_at'])):
+            if not objs:
+                continue
+            dates = [[getattr(obj, name) for name in fields] for obj in objs]
+            model.objects.bulk_create(objs, batch_size=500)
+            # bulk_create проставляет auto_now/auto_now_add, bulk_update возвращает исходные даты
+            for obj, values in zip(objs, dates):
+                for name, value in zip(fields, values):
+                    setattr(obj, name, value)
+            model.objects.bulk_update(objs, fields, batch_size=500)
+        # bulk_create не вызывает Attachment.save: ссылки вернувшихся вложений
+        # добавляются здесь, ссылки архива снимает post_delete ArchivedPost
+        Blob.change_refs([attachment.blob_id for attachment in attachments if attachment.blob_id], 1)
+
+        names = {name for thread in archived for name in thread.tags}
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+        for name in names - set(tags):
+            tags[name] = Tag.objects.create(name=name)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type=content_type, object_id=thread.pk, tag=tags[name])
+            for thread in archived for name in thread.tags
+        ], ignore_conflicts=True)
+        ThreadSubscription.objects.bulk_create([
+            ThreadSubscription(thread_id=thread.pk, user_id=user_id)
+            for thread in archived for user_id in thread.subscribers
+        ], ignore_conflicts=True)
+
+        with batched():
+            ArchivedThread.objects.filter(pk__in=ids).delete()
+        Thread.refresh_post_stats(ids)
+        refresh_open_report_counts([post.pk for post in posts if post.reports])
+        refresh_tag_stats(tag.pk for tag in tags.values())
+        _refresh_authors({thread.author_id for thread in archived} | {post.author_id for post in posts})
+    rebuild_index('thread', Thread.objects.filter(pk__in=ids))
+    rebuild_index('post', Post.objects.filter(thread_id__in=ids))
+    return len(archived)
+
+
+def rerender_threads(thread_ids, processes=None):
+    """Заново отрендерить замороженный HTML архивных тем и их сообщений.
+
+    Нужен после изменения рендера (расширения Markdown, правила санитайзера);
+    processes > 1 рендерит в пуле процессов.
+    """
+    threads = list(ArchivedThread.objects.filter(pk__in=thread_ids).only('pk', 'content'))
+    posts = list(ArchivedPost.objects.filter(thread_id__in=thread_ids).only('pk', 'content'))
+    html = render_many([item.content for item in threads + posts], processes=processes)
+    for item, content_html in zip(threads + posts, html):
+        item.content_html = content_html
+    with transaction.atomic():
+        ArchivedThread.objects.bulk_update(threads, ['content_html'])
+        ArchivedPost.objects.bulk_update(posts, ['content_html'], batch_size=500)
+    return len(threads)
+
+
+def run_in_batches(action, queryset, batch_size=BATCH_SIZE, limit=None, pause=None):
+    """Применить action к id из queryset пачками по batch_size в порядке pk.
+
+    pause(n) вызывается после каждой пачки (например, чтобы дать реплике
+    догнать мастер). Возвращает общее число перенесенных тем.
+    """
+    total = 0
+    last_pk = 0
+    while limit is None or total < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total)
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True).distinct()[:size])
+        if not ids:
+            break
+        total += action(ids)
+        last_pk = ids[-1]
+        if pause is not None:
+            pause(total)
+    return total
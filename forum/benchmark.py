@@ -0,0 +1,193 @@
+"""Измерение задержек и количества SQL-запросов ключевых страниц форума"""
+import math
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .models import Category, Thread, Post, PrivateMessage, TagStat
+
+User = get_user_model()
+
+
+@dataclass
+class Scenario:
+    """Один измеряемый запрос"""
+    name: str
+    url: str
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    user: object = None
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов через execute_wrapper, без ограничения лога запросов"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, pct):
+    """Перцентиль с линейной интерполяцией между соседними значениями"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def bench_host():
+    """Хост, который пропустит проверка ALLOWED_HOSTS"""
+    for host in settings.ALLOWED_HOSTS:
+        if host and '*' not in host and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def make_client():
+    return Client(HTTP_HOST=bench_host(), raise_request_exception=False)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_scenarios(search_term=None):
+    """Подбор самых тяжелых объектов сгенерированного набора данных"""
+    scenarios = []
+
+    scenarios.append(Scenario('index', reverse('forum:index')))
+
+    category = (Category.objects.filter(is_active=True)
+                .annotate(n=Count('threads')).order_by('-n').first())
+    if category:
+        url = reverse('forum:category_detail', kwargs={'slug': category.slug})
+        last_page = max(1, math.ceil(category.n / settings.THREADS_PER_PAGE))
+        scenarios.append(Scenario('category_detail', url))
+        scenarios.append(Scenario('category_detail_deep', f'{url}?page={last_page}'))
+
+    thread = (Thread.objects.filter(is_active=True)
+              .annotate(n=Count('posts')).order_by('-n').first())
+    if thread:
+        scenarios.append(Scenario('thread_detail', reverse('forum:thread_detail', kwargs={'slug': thread.slug})))
+
+    stat = TagStat.objects.filter(thread_count__gt=0).select_related('tag').order_by('-thread_count').first()
+    if stat:
+        scenarios.append(Scenario('tag_detail', reverse('forum:tag_detail', kwargs={'slug': stat.tag.slug})))
+
+    if search_term is None:
+        post = Post.objects.order_by('pk').first()
+        words = [w.strip('.,!?') for w in post.content.split()] if post else []
+        search_term = next((w for w in words if len(w) > 3), 'forum')
+    scenarios.append(Scenario('search', reverse('forum:search'),
+                              data={'q': search_term, 'search_in': 'all'}))
+
+    liker = User.objects.order_by('-post_count').first()
+    post = Post.objects.filter(is_active=True).order_by('pk').first()
+    if liker and post:
+        scenarios.append(Scenario('post_like', reverse('forum:post_like', kwargs={'pk': post.pk}),
+                                  method='post', data={'type': 1}, user=liker))
+
+    recipient = (PrivateMessage.objects.values('recipient')
+                 .annotate(n=Count('pk')).order_by('-n').first())
+    if recipient:
+        scenarios.append(Scenario('messages_inbox', reverse('forum:messages_inbox'),
+                                  user=User.objects.get(pk=recipient['recipient'])))
+    return scenarios
+
+
+def run_scenario(scenario, iterations=20, warmup=2):
+    """Прогон сценария: задержки в миллисекундах, число запросов и коды ответов"""
+    client = make_client()
+    if scenario.user is not None:
+        client.force_login(scenario.user)
+    request = getattr(client, scenario.method)
+
+    timings = []
+    queries = []
+    statuses = {}
+    for i in range(warmup + iterations):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = request(scenario.url, scenario.data, secure=True)
+            elapsed = (time.perf_counter() - started) * 1000
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        queries.append(counter.count)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    return {
+        'url': scenario.url,
+        'method': scenario.method.upper(),
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': statistics.median(queries),
+        'queries_max': max(queries),
+        'status_codes': statuses,
+    }
+
+
+def run_benchmark(iterations=20, warmup=2, search_term=None, only=None):
+    results = {}
+    # Один пользователь лайкает одно сообщение сотни раз - лимит тут не при чем
+    with override_settings(RATE_LIMIT_ENABLED=False):
+        for scenario in build_scenarios(search_term):
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = run_scenario(scenario, iterations, warmup)
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'dataset': {
+                'categories': Category.objects.count(),
+                'threads': Thread.objects.count(),
+                'posts': Post.objects.count(),
+                'users': User.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(previous, current):
+    """Строки сравнения двух прогонов: p50, p95 и число запросов"""
+    lines = []
+    for name, now in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if not before:
+            lines.append(f'{name}: нет в базовом прогоне')
+            continue
+        parts = []
+        for key in ('p50_ms', 'p95_ms', 'queries'):
+            delta = now[key] - before[key]
+            change = f' ({delta / before[key]:+.0%})' if before[key] else ''
+            parts.append(f'{key} {before[key]} -> {now[key]}{change}')
+        lines.append(f'{name}: ' + ', '.join(parts))
+    return lines
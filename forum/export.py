@@ -0,0 +1,244 @@
+"""Потоковая выгрузка данных: дампы форума для аналитики и данные пользователя (GDPR).
+
+Таблицы читаются через ``values_list(...).iterator()``: на PostgreSQL это
+серверный курсор, строки приходят пачками по ``CHUNK_SIZE`` и сразу
+кодируются и пишутся, поэтому память не растет с размером форума. Кодировщики
+(JSONL, CSV) - генераторы, отдающие байты кусками по ``BUFFER_SIZE``; поверх
+них может стоять потоковое сжатие gzip или zstd. Один и тот же поток пишется
+в файл (команда ``export_data``) или уходит в ``StreamingHttpResponse``
+(``/accounts/profile-export/``).
+
+Parquet пишется только в файл группами строк по ``ROW_GROUP_SIZE``, сжатие
+делает сам формат. ``pyarrow`` (Parquet) и ``zstandard`` (zstd) -
+необязательные зависимости и импортируются только при выборе этих форматов.
+
+Поля из ``private`` (email, текст личных сообщений) попадают только в выгрузку
+данных самого пользователя или в дамп с ``include_private``.
+"""
+import csv
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from functools import reduce
+from itertools import chain
+from operator import or_
+
+from django.apps import apps
+from django.db.models import Q
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+ROW_GROUP_SIZE = 50000
+FORMATS = ('jsonl', 'csv', 'parquet')
+COMPRESSIONS = ('gzip', 'zstd')
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class ExportError(Exception):
+    """Выгрузку в этом формате сделать нельзя"""
+
+
+@dataclass
+class Dataset:
+    """Выгружаемая таблица"""
+    model: str
+    fields: tuple
+    private: tuple = ()
+    # Поля, по которым запись относится к пользователю
+    owner: tuple = ()
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    def columns(self, private=False):
+        return self.fields + self.private if private else self.fields
+
+    def rows(self, user=None, include_private=False):
+        """(колонки, итератор кортежей) в порядке pk"""
+        queryset = self.get_model().objects.order_by('pk')
+        if user is not None:
+            queryset = queryset.filter(reduce(or_, (Q(**{name: user.pk}) for name in self.owner)))
+        columns = self.columns(private=user is not None or include_private)
+        return columns, queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+
+DATASETS = {
+    'users': Dataset('accounts.User',
+                     ('id', 'username', 'role', 'reputation', 'post_count', 'thread_count', 'is_active',
+                      'is_banned', 'date_joined', 'last_seen'),
+                     private=('email', 'first_name', 'last_name', 'bio', 'location', 'website', 'signature'),
+                     owner=('pk',)),
+    'threads': Dataset('forum.Thread',
+                       ('id', 'category_id', 'author_id', 'title', 'slug', 'content', 'views', 'reply_count',
+                        'is_pinned', 'is_locked', 'is_active', 'created_at', 'updated_at'),
+                       owner=('author',)),
+    'posts': Dataset('forum.Post',
+                     ('id', 'thread_id', 'author_id', 'position', 'content', 'is_active', 'is_edited',
+                      'created_at', 'edited_at'),
+                     owner=('author',)),
+    'archived_threads': Dataset('forum.ArchivedThread',
+                                ('id', 'category_id', 'author_id', 'title', 'slug', 'content', 'views',
+                                 'reply_count', 'is_active', 'created_at', 'archived_at'),
+                                owner=('author',)),
+    'archived_posts': Dataset('forum.ArchivedPost',
+                              ('id', 'thread_id', 'author_id', 'position', 'content', 'is_active', 'is_edited',
+                               'created_at', 'edited_at'),
+                              owner=('author',)),
+    'reactions': Dataset('forum.Like', ('id', 'post_id', 'user_id', 'like_type', 'created_at'), owner=('user',)),
+    'messages': Dataset('forum.PrivateMessage',
+                        ('id', 'sender_id', 'recipient_id', 'is_read', 'created_at', 'read_at'),
+                        private=('subject', 'content'),
+                        owner=('sender', 'recipient')),
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _buffered(lines):
+    """Строки -> куски байтов не меньше BUFFER_SIZE"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def jsonl_chunks(columns, rows, dataset=None):
+    """JSON Lines; dataset добавляет в каждую запись поле с именем таблицы"""
+    prefix = {'dataset': dataset} if dataset else {}
+    return _buffered(
+        json.dumps({**prefix, **dict(zip(columns, map(_plain, row)))}, ensure_ascii=False) + '\n'
+        for row in rows
+    )
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: writerow возвращает готовую строку"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(columns, rows):
+    writer = csv.writer(_Echo())
+    lines = (writer.writerow([_plain(value) for value in row]) for row in rows)
+    return _buffered(chain([writer.writerow(columns)], lines))
+
+
+def compressor(method):
+    """Потоковый компрессор с compress()/flush()"""
+    if method == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ExportError('Для сжатия zstd установите пакет zstandard')
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ExportError(f'Неизвестное сжатие: {method}')
+
+
+def compressed(chunks, method=None):
+    if method is None:
+        yield from chunks
+        return
+    stream = compressor(method)
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+def user_export(user, compress=None):
+    """Все данные пользователя одним потоком JSON Lines (поле dataset - имя таблицы)"""
+    def chunks():
+        for name, dataset in DATASETS.items():
+            columns, rows = dataset.rows(user=user)
+            yield from jsonl_chunks(columns, rows, dataset=name)
+    return compressed(chunks(), compress)
+
+
+def _arrow_schema(dataset, columns):
+    import pyarrow as pa
+    types = {
+        'BooleanField': pa.bool_(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+        'DateField': pa.date32(),
+        'FloatField': pa.float64(),
+    }
+    meta = dataset.get_model()._meta
+    schema = []
+    for name in columns:
+        internal = meta.get_field(name).get_internal_type()
+        if internal in types:
+            schema.append(pa.field(name, types[internal]))
+        elif 'Integer' in internal or internal in ('AutoField', 'BigAutoField', 'ForeignKey'):
+            schema.append(pa.field(name, pa.int64()))
+        else:
+            schema.append(pa.field(name, pa.string()))
+    return pa.schema(schema)
+
+
+def _write_parquet(path, dataset, columns, rows, compress):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Для Parquet установите пакет pyarrow')
+    schema = _arrow_schema(dataset, columns)
+    with pq.ParquetWriter(path, schema, compression=compress or 'none') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist([dict(zip(columns, item)) for item in batch], schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, item)) for item in batch], schema))
+
+
+def _counted(rows, stats):
+    for row in rows:
+        stats['rows'] += 1
+        yield row
+
+
+def export_dataset(name, directory, fmt='jsonl', compress=None, user=None, include_private=False):
+    """Записать таблицу name в файл каталога directory; возвращает {path, rows, bytes}"""
+    if fmt not in FORMATS:
+        raise ExportError(f'Неизвестный формат: {fmt}')
+    if compress is not None and compress not in COMPRESSIONS:
+        raise ExportError(f'Неизвестное сжатие: {compress}')
+    dataset = DATASETS[name]
+    stats = {'rows': 0}
+    columns, rows = dataset.rows(user=user, include_private=include_private)
+    rows = _counted(rows, stats)
+    path = os.path.join(directory, f'{name}.{fmt}')
+    if fmt != 'parquet':
+        path += EXTENSIONS.get(compress, '')
+    # Недописанный файл не должен выглядеть готовым дампом
+    tmp = f'{path}.tmp'
+    try:
+        if fmt == 'parquet':
+            _write_parquet(tmp, dataset, columns, rows, compress)
+        else:
+            chunks = jsonl_chunks(columns, rows) if fmt == 'jsonl' else csv_chunks(columns, rows)
+            with open(tmp, 'wb') as f:
+                for chunk in compressed(chunks, compress):
+                    f.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {'path': path, 'rows': stats['rows'], 'bytes': os.path.getsize(path)}
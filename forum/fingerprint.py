@@ -0,0 +1,71 @@
+"""Дешевое обнаружение повторных сообщений по отпечаткам текста.
+
+Текст нормализуется, режется на шинглы из ``SHINGLE_SIZE`` слов, от каждого
+берется 64-битный хеш, а отпечатком служат ``FINGERPRINT_SIZE`` наименьших
+хешей (bottom-k sketch). Доля общих хешей среди наименьших у объединения
+оценивает сходство Жаккара, поэтому мелкие правки текста дубликат не скрывают.
+Последние отпечатки каждого пользователя лежат в кеше.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+SHINGLE_SIZE = 4
+FINGERPRINT_SIZE = 32
+RECENT_FINGERPRINTS = 20
+
+_markup_re = re.compile(r'[^\w\s]+')
+
+
+def normalize(text):
+    return _markup_re.sub(' ', text.lower()).split()
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def shingle_hashes(text):
+    """Множество 64-битных хешей шинглов текста"""
+    words = normalize(text)
+    if len(words) < SHINGLE_SIZE:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return {_hash(s) for s in shingles}
+
+
+def fingerprint(text):
+    """Отсортированный кортеж наименьших хешей шинглов текста"""
+    return tuple(sorted(shingle_hashes(text))[:FINGERPRINT_SIZE])
+
+
+def similarity(a, b):
+    """Оценка сходства Жаккара по двум отпечаткам"""
+    if not a or not b:
+        return 0.0
+    union = sorted(set(a) | set(b))[:FINGERPRINT_SIZE]
+    common = set(a) & set(b)
+    return sum(1 for h in union if h in common) / len(union)
+
+
+def _cache_key(user):
+    return f'fingerprints:{user.pk}'
+
+
+def is_duplicate(user, text):
+    """Похож ли текст на одно из недавних сообщений пользователя"""
+    threshold = getattr(settings, 'DUPLICATE_THRESHOLD', 0.8)
+    current = fingerprint(text)
+    return any(similarity(current, tuple(previous)) >= threshold
+               for previous in cache.get(_cache_key(user), []))
+
+
+def remember(user, text):
+    """Запомнить отпечаток опубликованного текста"""
+    key = _cache_key(user)
+    recent = cache.get(key, [])
+    recent.append(fingerprint(text))
+    cache.set(key, recent[-RECENT_FINGERPRINTS:], timeout=getattr(settings, 'DUPLICATE_WINDOW', 3600))
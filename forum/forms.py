@@ -1,5 +1,6 @@
 from django import forms
 from .models import Thread, Post, Report, PrivateMessage
+from .tags import refresh_tag_stats
 
 
 class ThreadForm(forms.ModelForm):
@@ -13,6 +14,13 @@ class ThreadForm(forms.ModelForm):
             'category': forms.Select(attrs={'class': 'form-control'}),
             'content': forms.Textarea(attrs={'class': 'form-control', 'rows': 10, 'placeholder': 'Содержание темы (поддерживается Markdown)'}),
         }
+    
+    def _save_m2m(self):
+        # Счетчики тегов пересчитываются только для добавленных и снятых тегов
+        before = set(self.instance.tags.values_list('pk', flat=True))
+        super()._save_m2m()
+        after = set(self.instance.tags.values_list('pk', flat=True))
+        refresh_tag_stats(before ^ after)
 
 
 class PostForm(forms.ModelForm):
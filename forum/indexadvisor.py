@@ -0,0 +1,172 @@
+"""Анализ планов запросов рабочей нагрузки бенчмарка.
+
+Сценарии ``benchmark.build_scenarios`` прогоняются по одному разу, все
+SELECT/UPDATE/DELETE перехватываются через ``execute_wrapper``, и для каждого
+уникального запроса снимается план (``EXPLAIN QUERY PLAN`` в SQLite,
+``EXPLAIN (FORMAT JSON)`` в PostgreSQL). В отчет попадают полные просмотры
+таблиц, сортировки без индекса и неуникальные индексы затронутых таблиц, которые
+не встретились ни в одном плане.
+
+Сценарии пишут в базу (лайк, счетчик просмотров), поэтому прогон идет в
+транзакции, которая откатывается: анализ не меняет данные и повторные
+запуски видят ту же базу.
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from .benchmark import build_scenarios, make_client
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+_sqlite_index_re = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+_sqlite_scan_re = re.compile(r'^SCAN (\S+)(?: AS \S+)?(?: USING (?:COVERING )?INDEX \S+)?$')
+
+
+class IndexAdvisorError(Exception):
+    """Планы запросов для этой СУБД снять нельзя"""
+
+
+@dataclass
+class Plan:
+    """План одного запроса"""
+    sql: str
+    scenarios: set = field(default_factory=set)
+    seq_scans: set = field(default_factory=set)
+    indexes: set = field(default_factory=set)
+    sorts: bool = False
+    lines: list = field(default_factory=list)
+
+
+class QueryRecorder:
+    """Сохраняет уникальные запросы сценария вместе с параметрами"""
+
+    def __init__(self):
+        self.scenario = None
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if not many and sql.lstrip().upper().startswith(EXPLAINED):
+            entry = self.queries.setdefault(sql, [params, set()])
+            entry[1].add(self.scenario)
+        return result
+
+
+def capture_workload(scenarios):
+    """{sql: [params, {сценарии}]} для одного прогона каждого сценария"""
+    recorder = QueryRecorder()
+    with override_settings(RATE_LIMIT_ENABLED=False), transaction.atomic():
+        for scenario in scenarios:
+            client = make_client()
+            if scenario.user is not None:
+                client.force_login(scenario.user)
+            recorder.scenario = scenario.name
+            with connection.execute_wrapper(recorder):
+                getattr(client, scenario.method)(scenario.url, scenario.data, secure=True)
+        transaction.set_rollback(True)
+    return recorder.queries
+
+
+def _aliases(sql):
+    """Псевдонимы таблиц запроса (T4 -> accounts_user)"""
+    return {alias: table for table, alias in re.findall(r'"(\w+)" (T\d+)\b', sql)}
+
+
+def explain_sqlite(cursor, sql, params, plan):
+    aliases = _aliases(sql)
+    scans = set()
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    for row in cursor.fetchall():
+        detail = row[-1]
+        plan.lines.append(detail)
+        index = _sqlite_index_re.search(detail)
+        if index:
+            plan.indexes.add(index.group(1))
+        scan = _sqlite_scan_re.match(detail)
+        if scan:
+            scans.add(aliases.get(scan.group(1), scan.group(1)))
+        if 'TEMP B-TREE FOR ORDER BY' in detail:
+            plan.sorts = True
+    # SCAN по индексу в нужном порядке с LIMIT останавливается на первых строках,
+    # иначе это полный просмотр, даже если он идет по индексу
+    if plan.sorts or ' LIMIT ' not in sql:
+        plan.seq_scans |= scans
+
+
+def explain_postgresql(cursor, sql, params, plan):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+    result = cursor.fetchone()[0]
+    stack = [result[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get('Plans', []))
+        plan.lines.append(f"{node['Node Type']} {node.get('Relation Name', '')} {node.get('Index Name', '')}".strip())
+        if node['Node Type'] == 'Seq Scan':
+            plan.seq_scans.add(node['Relation Name'])
+        if 'Index Name' in node:
+            plan.indexes.add(node['Index Name'])
+        if node['Node Type'] in ('Sort', 'Incremental Sort'):
+            plan.sorts = True
+
+
+EXPLAINERS = {
+    'sqlite': explain_sqlite,
+    'postgresql': explain_postgresql,
+}
+
+
+def table_indexes(cursor, table):
+    """Неуникальные индексы таблицы (уникальные нужны для ограничений, а не для чтения)"""
+    constraints = connection.introspection.get_constraints(cursor, table)
+    return {name for name, info in constraints.items()
+            if info['index'] and not info['unique'] and not info['primary_key']}
+
+
+def analyze(scenarios=None, min_rows=1000):
+    """Отчет по планам запросов рабочей нагрузки.
+
+    Полные просмотры таблиц меньше ``min_rows`` строк не считаются проблемой:
+    для маленьких таблиц это самый дешевый план.
+    """
+    explain = EXPLAINERS.get(connection.vendor)
+    if explain is None:
+        raise IndexAdvisorError(f'EXPLAIN для {connection.vendor} не поддерживается')
+    if scenarios is None:
+        scenarios = build_scenarios()
+    queries = capture_workload(scenarios)
+
+    plans = []
+    tables = {model._meta.db_table for model in apps.get_models()}
+    touched = set()
+    with connection.cursor() as cursor:
+        for sql, (params, names) in queries.items():
+            plan = Plan(sql=sql, scenarios=names)
+            explain(cursor, sql, params, plan)
+            plans.append(plan)
+            touched.update(table for table in tables if f'"{table}"' in sql)
+
+        sizes = {}
+        for table in {t for plan in plans for t in plan.seq_scans} & tables:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            sizes[table] = cursor.fetchone()[0]
+
+        used = {index for plan in plans for index in plan.indexes}
+        unused = {table: sorted(table_indexes(cursor, table) - used) for table in sorted(touched)}
+
+    seq_scans = []
+    for plan in plans:
+        for table in sorted(plan.seq_scans):
+            if sizes.get(table, 0) >= min_rows:
+                seq_scans.append({'table': table, 'rows': sizes[table],
+                                  'scenarios': sorted(plan.scenarios), 'sql': plan.sql})
+    return {
+        'database': connection.vendor,
+        'queries': len(plans),
+        'seq_scans': seq_scans,
+        'sorts': [{'scenarios': sorted(plan.scenarios), 'sql': plan.sql} for plan in plans if plan.sorts],
+        'unused_indexes': {table: names for table, names in unused.items() if names},
+        'used_indexes': sorted(used),
+    }
@@ -0,0 +1,369 @@
+"""Нагрузочное тестирование смешанным трафиком чтения и записи.
+
+Виртуальные пользователи выполняют взвешенные сценарии (анонимное чтение,
+чтение авторизованным пользователем, запись) либо прямо через WSGI-приложение
+в текущем процессе, либо по HTTP к локально запущенному серверу. Внешние
+сервисы не нужны.
+"""
+import http.client
+import io
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .benchmark import bench_host, percentile
+from .models import Category, Thread, Post
+
+User = get_user_model()
+
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Доли трафика по умолчанию: 90% анонимное чтение, 8% чтение с авторизацией, 2% запись
+DEFAULT_MIX = {
+    'anon_read': 90,
+    'member_read': 8,
+    'member_reply': 0.8,
+    'member_like': 0.8,
+    'member_message': 0.4,
+}
+
+CSRF_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+class InProcessDriver:
+    """Вызов WSGI-приложения напрямую, с полным стеком middleware"""
+
+    def __init__(self, secure=False):
+        self.app = WSGIHandler()
+        self.host = self.netloc = bench_host()
+        self.secure = secure
+
+    def request(self, method, path, body=b'', headers=None):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '443' if self.secure else '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'https' if self.secure else 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in (headers or {}).items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ[key] = value
+            else:
+                environ[f'HTTP_{key}'] = value
+
+        captured = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            captured['status'] = int(status.split(' ', 1)[0])
+            captured['headers'] = response_headers
+
+        result = self.app(environ, start_response)
+        try:
+            size = sum(len(chunk) for chunk in result)
+        finally:
+            # close() отправляет request_finished, как настоящий сервер
+            if hasattr(result, 'close'):
+                result.close()
+        cookies = [value for name, value in captured['headers'] if name.lower() == 'set-cookie']
+        return captured['status'], size, cookies
+
+
+class HttpDriver:
+    """HTTP-запросы к локальному серверу, одно keep-alive соединение на поток"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.secure = parts.scheme == 'https'
+        self.netloc = parts.netloc
+        self.host = parts.hostname
+        self.port = parts.port
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            conn = self.local.conn = cls(self.host, self.port, timeout=30)
+        return conn
+
+    def request(self, method, path, body=b'', headers=None):
+        headers = dict(headers or {})
+        headers.setdefault('Host', self.netloc)
+        conn = self.connection()
+        try:
+            conn.request(method, path, body=body or None, headers=headers)
+            response = conn.getresponse()
+            size = len(response.read())
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+        return response.status, size, response.headers.get_all('Set-Cookie') or []
+
+
+@dataclass
+class StepStats:
+    """Накопленная статистика одного шага сценария"""
+    latencies: list = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    exceptions: int = 0
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.exceptions += other.exceptions
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+def histogram(latencies):
+    buckets = {f'<={bound}ms': 0 for bound in HISTOGRAM_BUCKETS}
+    buckets[f'>{HISTOGRAM_BUCKETS[-1]}ms'] = 0
+    for value in latencies:
+        for bound in HISTOGRAM_BUCKETS:
+            if value <= bound:
+                buckets[f'<={bound}ms'] += 1
+                break
+        else:
+            buckets[f'>{HISTOGRAM_BUCKETS[-1]}ms'] += 1
+    return buckets
+
+
+@dataclass
+class Fixtures:
+    """Объекты, по которым ходят виртуальные пользователи"""
+    categories: list
+    threads: list
+    posts: list
+    users: list
+    sessions: list
+
+    @classmethod
+    def load(cls, sessions=50, sample=2000):
+        users = list(User.objects.filter(is_active=True, is_banned=False)
+                     .order_by('-post_count')[:max(sessions, 2)])
+        return cls(
+            categories=list(Category.objects.filter(is_active=True).values_list('slug', flat=True)),
+            threads=list(Thread.objects.filter(is_active=True, is_locked=False)
+                         .order_by('-updated_at').values_list('slug', flat=True)[:sample]),
+            posts=list(Post.objects.filter(is_active=True).order_by('-pk').values_list('pk', flat=True)[:sample]),
+            users=[u.pk for u in users],
+            sessions=[login_cookies(u) for u in users[:sessions]],
+        )
+
+
+def login_cookies(user):
+    """Сессия авторизованного пользователя и CSRF-cookie без прохождения формы входа"""
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return {
+        settings.SESSION_COOKIE_NAME: session.session_key,
+        settings.CSRF_COOKIE_NAME: get_random_string(32, CSRF_CHARS),
+    }
+
+
+class VirtualUser:
+    """Один поток нагрузки: выбирает сценарии по весам и копит статистику"""
+
+    def __init__(self, driver, fixtures, mix, rng):
+        self.driver = driver
+        self.fixtures = fixtures
+        self.journeys = list(mix)
+        self.weights = [mix[name] for name in self.journeys]
+        self.rng = rng
+        self.stats = {}
+        self.cookies = {}
+        self.requests = 0
+
+    def record(self, name, latency=None, status=None):
+        stats = self.stats.setdefault(name, StepStats())
+        if status is None:
+            stats.exceptions += 1
+        else:
+            stats.latencies.append(latency)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def call(self, name, method, path, data=None):
+        headers = {}
+        body = b''
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if method == 'POST':
+            body = urlencode(data or {}).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies.get(settings.CSRF_COOKIE_NAME, '')
+            scheme = 'https' if self.driver.secure else 'http'
+            headers['Referer'] = f'{scheme}://{self.driver.netloc}/'
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            status, _, set_cookies = self.driver.request(method, path, body, headers)
+        except Exception:
+            self.record(name)
+            return None
+        self.record(name, (time.perf_counter() - started) * 1000, status)
+        for raw in set_cookies:
+            for morsel in SimpleCookie(raw).values():
+                if morsel.value:
+                    self.cookies[morsel.key] = morsel.value
+                else:
+                    self.cookies.pop(morsel.key, None)
+        return status
+
+    def thread_path(self, page=None):
+        path = reverse('forum:thread_detail', kwargs={'slug': self.rng.choice(self.fixtures.threads)})
+        return f'{path}?page={page}' if page else path
+
+    def run_once(self):
+        journey = self.rng.choices(self.journeys, weights=self.weights)[0]
+        if journey == 'anon_read':
+            self.cookies = {}
+        elif self.fixtures.sessions:
+            self.cookies = dict(self.rng.choice(self.fixtures.sessions))
+        else:
+            return
+        getattr(self, f'journey_{journey}')()
+
+    def journey_anon_read(self):
+        self.call('index', 'GET', reverse('forum:index'))
+        if self.fixtures.categories:
+            path = reverse('forum:category_detail', kwargs={'slug': self.rng.choice(self.fixtures.categories)})
+            # Каждый пятый читатель листает в конец категории
+            self.call('category_detail', 'GET', path + ('?page=9999' if self.rng.random() < 0.2 else ''))
+        if self.fixtures.threads:
+            self.call('thread_detail', 'GET', self.thread_path())
+            if self.rng.random() < 0.3:
+                self.call('thread_detail_page', 'GET', self.thread_path(page=self.rng.choice([2, 3, 9999])))
+        if self.rng.random() < 0.05:
+            self.call('search', 'GET', reverse('forum:search') + '?' + urlencode({'q': 'форум', 'search_in': 'all'}))
+
+    def journey_member_read(self):
+        self.call('index', 'GET', reverse('forum:index'))
+        if self.fixtures.threads:
+            self.call('thread_detail', 'GET', self.thread_path())
+        if self.rng.random() < 0.3:
+            self.call('messages_inbox', 'GET', reverse('forum:messages_inbox'))
+
+    def journey_member_reply(self):
+        if self.fixtures.threads:
+            path = self.thread_path()
+            self.call('thread_detail', 'GET', path)
+            self.call('post_reply', 'POST', path, {'content': f'Нагрузочный ответ {self.rng.random()}'})
+
+    def journey_member_like(self):
+        if self.fixtures.posts:
+            pk = self.rng.choice(self.fixtures.posts)
+            self.call('post_like', 'POST', reverse('forum:post_like', kwargs={'pk': pk}),
+                      {'type': self.rng.choice([1, 1, 1, -1])})
+
+    def journey_member_message(self):
+        if self.fixtures.users:
+            self.call('message_send', 'POST', reverse('forum:message_send'), {
+                'recipient': self.rng.choice(self.fixtures.users),
+                'subject': 'Нагрузочный тест',
+                'content': f'Сообщение {self.rng.random()}',
+            })
+
+
+def run_load(driver, fixtures, mix=None, concurrency=8, duration=30.0, max_requests=None, seed=None):
+    """Запускает потоки нагрузки и возвращает сводный отчет"""
+    mix = mix or DEFAULT_MIX
+    seeder = random.Random(seed)
+    workers = [VirtualUser(driver, fixtures, mix, random.Random(seeder.random())) for _ in range(concurrency)]
+    deadline = time.monotonic() + duration
+    budget = [max_requests]
+    lock = threading.Lock()
+
+    def has_budget():
+        if budget[0] is None:
+            return True
+        with lock:
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+            return True
+
+    def loop(worker):
+        from django.db import connections
+        try:
+            while time.monotonic() < deadline and has_budget():
+                worker.run_once()
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(w,), daemon=True) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    steps = {}
+    for worker in workers:
+        for name, stats in worker.stats.items():
+            steps.setdefault(name, StepStats()).merge(stats)
+    return build_report(steps, elapsed, concurrency, mix)
+
+
+def build_report(steps, elapsed, concurrency, mix):
+    total = errors = rejected = 0
+    report_steps = {}
+    for name, stats in sorted(steps.items()):
+        count = len(stats.latencies) + stats.exceptions
+        step_errors = stats.exceptions + sum(c for s, c in stats.statuses.items() if s >= 500)
+        step_rejected = sum(c for s, c in stats.statuses.items() if 400 <= s < 500)
+        total += count
+        errors += step_errors
+        rejected += step_rejected
+        report_steps[name] = {
+            'requests': count,
+            'errors': step_errors,
+            'rejected': step_rejected,
+            'error_rate': round(step_errors / count, 4) if count else 0,
+            'p50_ms': round(percentile(stats.latencies, 50) or 0, 2),
+            'p95_ms': round(percentile(stats.latencies, 95) or 0, 2),
+            'p99_ms': round(percentile(stats.latencies, 99) or 0, 2),
+            'status_codes': {str(s): c for s, c in sorted(stats.statuses.items())},
+            'histogram': histogram(stats.latencies),
+        }
+    return {
+        'duration_s': round(elapsed, 2),
+        'concurrency': concurrency,
+        'mix': mix,
+        'requests': total,
+        'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+        'errors': errors,
+        'rejected': rejected,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'steps': report_steps,
+    }
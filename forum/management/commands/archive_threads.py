@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forum import archive
+from forum.models import ArchivedThread
+
+
+class Command(BaseCommand):
+    help = 'Перенос старых и скрытых тем в архив (или восстановление) пачками в коротких транзакциях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=archive.ARCHIVE_AFTER_DAYS,
+                            help='Архивировать темы без сообщений дольше N дней')
+        parser.add_argument('--inactive-days', type=int, default=archive.INACTIVE_AFTER_DAYS,
+                            help='Архивировать скрытые темы, не менявшиеся N дней')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE)
+        parser.add_argument('--limit', type=int, default=None, help='Остановиться после N тем')
+        parser.add_argument('--sleep', type=float, default=0, help='Пауза между пачками в секундах')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать темы')
+        parser.add_argument('--restore', action='store_true', help='Вернуть темы из архива')
+        parser.add_argument('--ids', type=int, nargs='*', help='id тем для восстановления')
+        parser.add_argument('--category', default=None, help='Восстановить все темы категории (slug)')
+        parser.add_argument('--rerender', action='store_true',
+                            help='Заново отрендерить HTML архивных тем (после изменения рендера Markdown)')
+        parser.add_argument('--processes', type=int, default=None, help='Процессов для --rerender')
+
+    def handle(self, *args, **options):
+        if options['rerender']:
+            queryset = ArchivedThread.objects.all()
+            if options['ids']:
+                queryset = queryset.filter(pk__in=options['ids'])
+            if options['category']:
+                queryset = queryset.filter(category__slug=options['category'])
+
+            def action(ids):
+                return archive.rerender_threads(ids, processes=options['processes'])
+            verb = 'Перерендерено'
+        elif options['restore']:
+            if not options['ids'] and not options['category']:
+                raise CommandError('Для восстановления укажите --ids или --category')
+            queryset = ArchivedThread.objects.all()
+            if options['ids']:
+                queryset = queryset.filter(pk__in=options['ids'])
+            if options['category']:
+                queryset = queryset.filter(category__slug=options['category'])
+            action, verb = archive.restore_threads, 'Восстановлено'
+        else:
+            queryset = archive.archive_candidates(after_days=options['older_than_days'],
+                                                  inactive_days=options['inactive_days'])
+            action, verb = archive.archive_threads, 'Перенесено в архив'
+
+        if options['dry_run']:
+            self.stdout.write(f'Тем: {queryset.values("pk").distinct().count()}')
+            return
+
+        def pause(total):
+            self.stdout.write(f'{verb}: {total}')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        total = archive.run_in_batches(action, queryset, batch_size=options['batch_size'],
+                                       limit=options['limit'], pause=pause)
+        self.stdout.write(self.style.SUCCESS(f'{verb} тем: {total}'))
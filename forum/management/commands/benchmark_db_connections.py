@@ -0,0 +1,90 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+from django.urls import reverse
+
+from forum.benchmark import percentile
+from forum.loadtest import InProcessDriver
+from forum.models import Category
+
+POSTGRESQL_ENGINE = 'django.db.backends.postgresql'
+POOL_ENGINE = 'forumsite.db_backends.postgresql_pool'
+
+
+class Command(BaseCommand):
+    help = 'Задержка запросов: новое соединение на каждый запрос, постоянное соединение и пул соединений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--path', default=None, help='URL для замера (по умолчанию первая категория)')
+        parser.add_argument('--database', default='default')
+
+    def variants(self, alias):
+        """(название, ENGINE, CONN_MAX_AGE) - сравниваемые режимы на тех же настройках подключения"""
+        engine = connections.settings[alias]['ENGINE']
+        if engine not in (POSTGRESQL_ENGINE, POOL_ENGINE):
+            return [('direct', engine, 0), ('persistent', engine, 600)]
+        return [('direct', POSTGRESQL_ENGINE, 0), ('persistent', POSTGRESQL_ENGINE, 600), ('pool', POOL_ENGINE, 0)]
+
+    def make_connection(self, alias, engine, max_age):
+        settings_dict = {**connections.settings[alias], 'ENGINE': engine, 'CONN_MAX_AGE': max_age}
+        if engine == POOL_ENGINE:
+            settings_dict.setdefault('POOL', {'MIN_SIZE': 1, 'MAX_SIZE': 2})
+        else:
+            settings_dict.pop('POOL', None)
+        return load_backend(engine).DatabaseWrapper(settings_dict, alias)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        path = options['path']
+        if path is None:
+            category = Category.objects.filter(is_active=True).first()
+            path = category.get_absolute_url() if category else reverse('forum:search')
+        driver = InProcessDriver(secure=getattr(settings, 'SECURE_SSL_REDIRECT', False))
+        original = connections[alias]
+
+        self.stdout.write(
+            f"{original.vendor}, ENGINE={original.settings_dict['ENGINE']}, "
+            f"DB_POOL_MODE={getattr(settings, 'DB_POOL_MODE', 'none')}"
+        )
+        if original.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('Режим pool есть только для PostgreSQL; для осмысленных '
+                                                 'цифр нужен PostgreSQL по сети, а не SQLite'))
+        original.close()
+
+        for label, engine, max_age in self.variants(alias):
+            # Каждый режим - отдельное соединение с теми же параметрами, подставленное
+            # вместо connections[alias] на время замера
+            connection = self.make_connection(alias, engine, max_age)
+            connections[alias] = connection
+            try:
+                # Время получения соединения: TCP, TLS и аутентификация или выдача из пула
+                connect_times = []
+                for _ in range(min(options['requests'], 50)):
+                    connection.close()
+                    started = time.perf_counter()
+                    connection.ensure_connection()
+                    connect_times.append((time.perf_counter() - started) * 1000)
+                connection.close()
+
+                latencies = []
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    status, _, _ = driver.request('GET', path)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{label:<11} connect p50={percentile(connect_times, 50):.2f}ms '
+                    f'p95={percentile(connect_times, 95):.2f}ms | '
+                    f'request p50={percentile(latencies, 50):.2f}ms p95={percentile(latencies, 95):.2f}ms '
+                    f'mean={statistics.fmean(latencies):.2f}ms (последний статус {status})'
+                )
+            finally:
+                connection.close()
+                if engine == POOL_ENGINE:
+                    from forumsite.db_backends.postgresql_pool.base import close_pools
+                    close_pools()
+                connections[alias] = original
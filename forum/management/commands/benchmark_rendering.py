@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.models import Post
+from forum.rendering import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность рендера Markdown (сообщений в секунду): markdownify, пул экземпляров, пул процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000, help='Сколько сообщений взять из базы')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--processes', type=int, default=None, help='Процессов для варианта с пулом (по умолчанию по числу CPU)')
+        parser.add_argument('--output', default=None, help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        texts = list(Post.objects.order_by('-pk').values_list('content', flat=True)[:options['posts']])
+        if not texts:
+            raise CommandError('В базе нет сообщений; заполните ее командой generate_forum')
+        report = benchmark(texts, repeat=options['repeat'], processes=options['processes'])
+        baseline = report['markdownify']
+        self.stdout.write(self.style.SUCCESS(f'Сообщений: {len(texts)}, лучший из {options["repeat"]} прогонов'))
+        for name, rate in report.items():
+            self.stdout.write(f'  {name:24} {rate:10.0f} сообщ./с  x{rate / baseline:.2f}')
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({'posts': len(texts), 'posts_per_sec': report},
+                                                          ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
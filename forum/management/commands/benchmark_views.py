@@ -0,0 +1,52 @@
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.benchmark import run_benchmark, compare
+
+
+class Command(BaseCommand):
+    help = 'Замер p50/p95 и числа запросов для основных страниц, результат сохраняется в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--search-term', default=None)
+        parser.add_argument('--only', nargs='*', help='Запустить только указанные сценарии')
+        parser.add_argument('--output', default=None,
+                            help='Путь к JSON (по умолчанию benchmarks/<время>-<коммит>.json)')
+        parser.add_argument('--compare', default=None, help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            search_term=options['search_term'],
+            only=options['only'],
+        )
+
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"{name:<22} p50={result['p50_ms']:>9.2f}ms p95={result['p95_ms']:>9.2f}ms "
+                f"queries={result['queries']:<4} codes={result['status_codes']}"
+            )
+
+        output = options['output']
+        if output is None:
+            suffix = report['meta']['revision'] or 'local'
+            output = Path(settings.BASE_DIR) / 'benchmarks' / f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}.json"
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+        if options['compare']:
+            try:
+                previous = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {exc}')
+            for line in compare(previous, report):
+                self.stdout.write(line)
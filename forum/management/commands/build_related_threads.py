@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from forum.related import build_related, build_related_since_last_run, TOP_K
+
+
+class Command(BaseCommand):
+    help = 'Пакетный пересчет похожих тем по тегам, участникам и тексту'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Пересчитать все активные темы')
+        parser.add_argument('--since-hours', type=float, default=24,
+                            help='Пересчитать темы, обновленные за последние N часов')
+        parser.add_argument('--since-last-run', action='store_true',
+                            help='Пересчитать темы, обновленные после прошлого такого запуска (как задача по расписанию)')
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['since_last_run']:
+            total = build_related_since_last_run(top_k=options['top_k'], batch_size=options['batch_size'])
+        else:
+            since = None if options['all'] else timezone.now() - timedelta(hours=options['since_hours'])
+            total = build_related(since=since, top_k=options['top_k'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано тем: {total}'))
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from forum.uploads import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Удаление брошенных загрузок и файлов вложений без ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Не трогать сессии и файлы моложе этого числа часов')
+
+    def handle(self, *args, **options):
+        sessions, blobs = collect_garbage(grace=timedelta(hours=options['grace_hours']))
+        self.stdout.write(self.style.SUCCESS(f'Удалено сессий: {sessions}, файлов: {blobs}'))
@@ -0,0 +1,281 @@
+import random
+import secrets
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.text import slugify
+from faker import Faker
+from taggit.models import Tag, TaggedItem
+
+from forum.models import Category, Thread, Post, Like, PrivateMessage
+from forum.similar import rebuild_index
+from forum.tags import refresh_tag_stats
+
+User = get_user_model()
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Временно отключает auto_now/auto_now_add, чтобы bulk_create сохранил заданные даты"""
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def zipf_cum_weights(n, exponent):
+    """Накопленные веса распределения Ципфа для random.choices"""
+    return list(accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетического форума заданного размера для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=5000)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=200, help='Размер словаря тегов')
+        parser.add_argument('--max-tags', type=int, default=4, help='Максимум тегов на тему')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель Ципфа для активности пользователей и популярности тем')
+        parser.add_argument('--like-alpha', type=float, default=1.6,
+                            help='Параметр Парето для числа реакций на сообщение (меньше - сильнее перекос)')
+        parser.add_argument('--max-likes', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории в днях')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--locale', default='ru_RU')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--skip-minhash', action='store_true',
+                            help='Не строить MinHash-индекс похожих сообщений')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.token = secrets.token_hex(3)
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+
+        fake = Faker(options['locale'])
+        if options['seed'] is not None:
+            fake.seed_instance(options['seed'])
+        # Faker медленный, поэтому тексты собираются из заранее сгенерированного пула
+        self.sentences = [fake.sentence(nb_words=12) for _ in range(2000)]
+        self.titles = [fake.sentence(nb_words=6).rstrip('.') for _ in range(1000)]
+        self.names = [fake.user_name() for _ in range(1000)]
+        self.words = [fake.word() for _ in range(200)]
+
+        with explicit_timestamps(User, Category, Thread, Post, Like, PrivateMessage):
+            user_ids = self.create_users(options['users'])
+            category_ids = self.create_categories(options['categories'])
+            user_weights = zipf_cum_weights(len(user_ids), options['skew'])
+            threads = self.create_threads(options['threads'], category_ids, user_ids, user_weights)
+            self.create_tags(options, threads)
+            self.create_posts(options, threads, user_ids, user_weights)
+            self.create_messages(options['messages'], user_ids, user_weights)
+
+        self.update_user_stats()
+        call_command('recompute_trending', stdout=self.stdout)
+        if not options['skip_minhash']:
+            threads = Thread.objects.filter(category_id__in=category_ids)
+            rebuild_index('thread', threads, self.batch_size)
+            rebuild_index('post', Post.objects.filter(thread__category_id__in=category_ids), self.batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Готово, префикс данных: {self.token}'))
+
+    def random_time(self, start=None):
+        start = start or self.start
+        return start + (self.now - start) * self.rng.random()
+
+    def text(self, min_sentences=1, max_sentences=5):
+        return ' '.join(self.rng.choices(self.sentences, k=self.rng.randint(min_sentences, max_sentences)))
+
+    def bulk_create(self, model, objs):
+        created = []
+        for offset in range(0, len(objs), self.batch_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(objs[offset:offset + self.batch_size]))
+        return created
+
+    def create_users(self, count):
+        password = make_password('benchmark')
+        users = []
+        ids = []
+        for i in range(count):
+            username = f'{self.rng.choice(self.names)}_{self.token}_{i}'
+            joined = self.random_time()
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                password=password,
+                date_joined=joined,
+                last_seen=joined,
+            ))
+            if len(users) >= self.batch_size:
+                ids.extend(u.pk for u in self.bulk_create(User, users))
+                users = []
+        ids.extend(u.pk for u in self.bulk_create(User, users))
+        self.stdout.write(f'Пользователи: {len(ids)}')
+        return ids
+
+    def create_categories(self, count):
+        categories = [
+            Category(
+                name=f'{self.rng.choice(self.words).capitalize()} {i}',
+                slug=f'bench-{self.token}-{i}',
+                description=self.rng.choice(self.sentences),
+                order=i,
+                created_at=self.start,
+            )
+            for i in range(count)
+        ]
+        ids = [c.pk for c in self.bulk_create(Category, categories)]
+        self.stdout.write(f'Категории: {len(ids)}')
+        return ids
+
+    def create_threads(self, count, category_ids, user_ids, user_weights):
+        category_weights = zipf_cum_weights(len(category_ids), 0.8)
+        threads = []
+        for i in range(count):
+            title = self.rng.choice(self.titles)
+            created = self.random_time()
+            threads.append(Thread(
+                title=title,
+                slug=f'{slugify(title)[:150] or "thread"}-{self.token}-{i}',
+                category_id=self.rng.choices(category_ids, cum_weights=category_weights)[0],
+                author_id=self.rng.choices(user_ids, cum_weights=user_weights)[0],
+                content=self.text(2, 8),
+                views=int(self.rng.paretovariate(1.2) * 20),
+                is_pinned=self.rng.random() < 0.01,
+                created_at=created,
+                updated_at=created,
+                last_post_at=created,
+            ))
+        threads = self.bulk_create(Thread, threads)
+        self.stdout.write(f'Темы: {len(threads)}')
+        return threads
+
+    def create_tags(self, options, threads):
+        if not options['tags'] or not options['max_tags']:
+            return
+        tags = self.bulk_create(Tag, [
+            Tag(name=f'{self.rng.choice(self.words)}-{self.token}-{i}', slug=f'bench-{self.token}-{i}')
+            for i in range(options['tags'])
+        ])
+        # Популярность тегов тоже по Ципфу: несколько массовых тегов и длинный хвост
+        tag_weights = zipf_cum_weights(len(tags), options['skew'])
+        content_type = ContentType.objects.get_for_model(Thread)
+        items = []
+        for thread in threads:
+            chosen = {tag.pk for tag in self.rng.choices(tags, cum_weights=tag_weights,
+                                                         k=self.rng.randint(0, options['max_tags']))}
+            items.extend(TaggedItem(content_type=content_type, object_id=thread.pk, tag_id=pk) for pk in chosen)
+        self.bulk_create(TaggedItem, items)
+        refresh_tag_stats(tag.pk for tag in tags)
+        self.stdout.write(f'Теги: {len(tags)}, привязок: {len(items)}')
+
+    def create_posts(self, options, threads, user_ids, user_weights):
+        # Популярность тем распределена по Ципфу: несколько тем-гигантов и длинный хвост
+        order = list(range(len(threads)))
+        self.rng.shuffle(order)
+        picks = self.rng.choices(order, cum_weights=zipf_cum_weights(len(order), options['skew']), k=options['posts'])
+        per_thread = Counter(picks)
+
+        posts_total = likes_total = 0
+        pending = []
+        touched = []
+        for index, thread in enumerate(threads):
+            count = per_thread.get(index, 0)
+            if not count:
+                continue
+            times = sorted(self.random_time(thread.created_at) for _ in range(count))
+            for position, created in enumerate(times, 1):
+                pending.append(Post(
+                    thread_id=thread.pk,
+                    position=position,
+                    author_id=self.rng.choices(user_ids, cum_weights=user_weights)[0],
+                    content=self.text(),
+                    created_at=created,
+                    updated_at=created,
+                ))
+            thread.updated_at = times[-1]
+            thread.post_sequence = count
+            touched.append(thread)
+            if len(pending) >= self.batch_size:
+                likes_total += self.flush_posts(pending, user_ids, options)
+                posts_total += len(pending)
+                pending = []
+        likes_total += self.flush_posts(pending, user_ids, options)
+        posts_total += len(pending)
+
+        for offset in range(0, len(touched), self.batch_size):
+            batch = touched[offset:offset + self.batch_size]
+            Thread.objects.bulk_update(batch, ['updated_at', 'post_sequence'])
+            Thread.refresh_post_stats([thread.pk for thread in batch])
+        self.stdout.write(f'Сообщения: {posts_total}, реакции: {likes_total}')
+
+    def flush_posts(self, posts, user_ids, options):
+        if not posts:
+            return 0
+        with transaction.atomic():
+            posts = Post.objects.bulk_create(posts)
+            likes = []
+            for post in posts:
+                count = min(int(self.rng.paretovariate(options['like_alpha'])) - 1, options['max_likes'], len(user_ids))
+                for user_id in self.rng.sample(user_ids, count):
+                    likes.append(Like(
+                        post_id=post.pk,
+                        user_id=user_id,
+                        like_type=1 if self.rng.random() < 0.85 else -1,
+                        created_at=self.random_time(post.created_at),
+                    ))
+            Like.objects.bulk_create(likes, batch_size=self.batch_size)
+        return len(likes)
+
+    def create_messages(self, count, user_ids, user_weights):
+        messages = []
+        for _ in range(count):
+            sender_id, recipient_id = self.rng.choices(user_ids, cum_weights=user_weights, k=2)
+            created = self.random_time()
+            messages.append(PrivateMessage(
+                sender_id=sender_id,
+                recipient_id=recipient_id,
+                subject=self.rng.choice(self.titles)[:200],
+                content=self.text(),
+                is_read=self.rng.random() < 0.7,
+                created_at=created,
+            ))
+        self.bulk_create(PrivateMessage, messages)
+        self.stdout.write(f'Личные сообщения: {count}')
+
+    def update_user_stats(self):
+        """Пересчет счетчиков одним UPDATE вместо каскада Post.save"""
+        def counter(model):
+            return Coalesce(Subquery(
+                model.objects.filter(author=OuterRef('pk'))
+                .order_by().values('author').annotate(c=Count('pk')).values('c')
+            ), Value(0))
+
+        User.objects.filter(username__contains=f'_{self.token}_').update(
+            thread_count=counter(Thread),
+            post_count=counter(Post),
+        )
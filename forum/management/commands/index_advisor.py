@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.benchmark import build_scenarios
+from forum.indexadvisor import IndexAdvisorError, analyze
+
+
+class Command(BaseCommand):
+    help = ('Прогон сценариев бенчмарка с EXPLAIN каждого запроса: полные просмотры таблиц, '
+            'сортировки без индекса и неиспользуемые индексы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Не сообщать о полном просмотре таблиц меньше этого размера')
+        parser.add_argument('--search-term', default=None)
+        parser.add_argument('--only', nargs='*', help='Проверить только указанные сценарии')
+        parser.add_argument('--output', default=None, help='Сохранить отчет в JSON')
+        parser.add_argument('--strict', action='store_true',
+                            help='Завершиться с ошибкой, если найдены полные просмотры (для CI после migrate)')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in build_scenarios(options['search_term'])
+                     if not options['only'] or s.name in options['only']]
+        try:
+            report = analyze(scenarios, min_rows=options['min_rows'])
+        except IndexAdvisorError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"Запросов: {report['queries']}, индексов в планах: {len(report['used_indexes'])}")
+        for scan in report['seq_scans']:
+            self.stdout.write(self.style.WARNING(
+                f"SEQ SCAN {scan['table']} ({scan['rows']} строк) в {', '.join(scan['scenarios'])}: {scan['sql'][:200]}"
+            ))
+        for sort in report['sorts']:
+            self.stdout.write(f"SORT в {', '.join(sort['scenarios'])}: {sort['sql'][:200]}")
+        for table, names in report['unused_indexes'].items():
+            self.stdout.write(f"Не использованы индексы {table}: {', '.join(names)}")
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
+        if options['strict'] and report['seq_scans']:
+            raise CommandError(f"Полных просмотров таблиц: {len(report['seq_scans'])}")
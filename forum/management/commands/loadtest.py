@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from forum.loadtest import DEFAULT_MIX, Fixtures, HttpDriver, InProcessDriver, run_load
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise CommandError(f'Неизвестный сценарий "{name}", доступны: {", ".join(DEFAULT_MIX)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Некорректный вес для "{name}": {weight}')
+    return mix
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест смешанным трафиком: пропускная способность, ошибки и гистограммы задержек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None,
+                            help='Адрес локального сервера; без него приложение вызывается в текущем процессе')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30.0, help='Длительность в секундах')
+        parser.add_argument('--requests', type=int, default=None, help='Остановиться после N сценариев')
+        parser.add_argument('--mix', type=parse_mix, default=None,
+                            help='Веса сценариев, например anon_read=90,member_read=8,member_reply=2')
+        parser.add_argument('--sessions', type=int, default=50, help='Число авторизованных виртуальных пользователей')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', default=None, help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            driver = HttpDriver(options['url'])
+        else:
+            driver = InProcessDriver(secure=getattr(settings, 'SECURE_SSL_REDIRECT', False))
+
+        fixtures = Fixtures.load(sessions=options['sessions'])
+        if not fixtures.threads:
+            raise CommandError('Нет тем для нагрузки, сначала запустите generate_forum')
+
+        report = run_load(
+            driver, fixtures,
+            mix=options['mix'],
+            concurrency=options['concurrency'],
+            duration=options['duration'],
+            max_requests=options['requests'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(
+            f"{report['requests']} запросов за {report['duration_s']}с: "
+            f"{report['throughput_rps']} rps, ошибок {report['errors']} ({report['error_rate']:.2%}), "
+            f"отклонено {report['rejected']}"
+        )
+        for name, step in report['steps'].items():
+            self.stdout.write(
+                f"  {name:<20} n={step['requests']:<6} err={step['errors']:<4} "
+                f"p50={step['p50_ms']:>8.2f}ms p95={step['p95_ms']:>8.2f}ms p99={step['p99_ms']:>8.2f}ms "
+                f"codes={step['status_codes']}"
+            )
+            buckets = ' '.join(f'{k}:{v}' for k, v in step['histogram'].items() if v)
+            self.stdout.write(f'    {buckets}')
+
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f'Отчет сохранен в {output}'))
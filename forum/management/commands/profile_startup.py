@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from forum.startup import profile_startup
+
+
+class Command(BaseCommand):
+    help = 'Время холодного старта воркера (django.setup + URLconf) и время импорта по модулям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Число холодных запусков для медианы')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--output', default=None, help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        report = profile_startup(repeat=options['repeat'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Старт: медиана {report['boot_ms']:.0f} мс, минимум {report['min_ms']:.0f} мс "
+            f"({report['runs']} запусков, модулей: {report['modules']})"
+        ))
+        self.stdout.write(f"Сборка мусора за старт: {report['gc_ms']:.1f} мс (в разбивку ниже не входит)")
+        self.stdout.write('Пакеты (собственное время импорта, мс):')
+        for name, ms in report['packages'][:options['top']]:
+            self.stdout.write(f'  {ms:8.1f}  {name}')
+        self.stdout.write('Модули (собственное / с зависимостями, мс):')
+        for name, own, cumulative in report['slowest'][:options['top']]:
+            self.stdout.write(f'  {own:8.1f} {cumulative:8.1f}  {name}')
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
@@ -0,0 +1,50 @@
+import json
+from dataclasses import asdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from forum.benchmark import build_scenarios
+from forum.templateprofile import profile_scenarios
+
+
+class Command(BaseCommand):
+    help = ('Прогон сценариев бенчмарка с профилем рендера: время и SQL-запросы '
+            'по шаблонам, блокам и переменным шаблонов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='*', help='Профилировать только указанные сценарии')
+        parser.add_argument('--search-term', default=None)
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--min-ms', type=float, default=0.5,
+                            help='Не показывать переменные без запросов быстрее этого времени')
+        parser.add_argument('--output', default=None, help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in build_scenarios(options['search_term'])
+                     if not options['only'] or s.name in options['only']]
+        if not settings.TEMPLATE_CACHE:
+            self.stdout.write(self.style.WARNING('TEMPLATE_CACHE выключен: время шаблонов включает их разбор'))
+        profiles = profile_scenarios(scenarios)
+
+        report = {}
+        for name, profiler in profiles.items():
+            rows = profiler.report(min_ms=options['min_ms'])
+            report[name] = [asdict(entry) for entry in rows]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: SQL-запросов за запрос {profiler.queries}'))
+            self.stdout.write('    собств. мс  всего мс  вызовов  запросов  что')
+            for entry in rows[:options['top']]:
+                line = (f'    {entry.own * 1000:10.2f} {entry.total * 1000:9.2f} {entry.calls:8d} '
+                        f'{entry.own_queries:9d}  {entry.kind} {entry.name} ({entry.template})')
+                self.stdout.write(self.style.WARNING(line) if entry.own_queries else line)
+            for entry in rows:
+                if entry.kind == 'variable' and entry.own_queries:
+                    self.stdout.write(self.style.WARNING(
+                        f'    SQL из {{{{ {entry.name} }}}} в {entry.template}: '
+                        f'{entry.own_queries} запросов за {entry.calls} вызовов; {entry.sql[0][:160]}'
+                    ))
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Отчет сохранен в {options['output']}"))
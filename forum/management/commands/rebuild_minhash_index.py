@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Thread, Post
+from forum.similar import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересчет MinHash-сигнатур и LSH-бакетов тем и сообщений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['thread', 'post'], action='append',
+                            help='Что индексировать (по умолчанию все)')
+        parser.add_argument('--missing', action='store_true', help='Только объекты без сигнатуры')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or ['thread', 'post']:
+            queryset = (Thread if kind == 'thread' else Post).objects.all()
+            if options['missing']:
+                queryset = queryset.filter(minhash__isnull=True)
+            total = rebuild_index(kind, queryset, options['batch_size'])
+            self.stdout.write(f'{kind}: {total}')
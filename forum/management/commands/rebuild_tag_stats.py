@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from forum.tags import rebuild_tag_stats
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет числа тем по тегам и облака тегов'
+
+    def handle(self, *args, **options):
+        total = rebuild_tag_stats()
+        self.stdout.write(self.style.SUCCESS(f'Тегов: {total}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from forum.models import Thread
+
+
+class Command(BaseCommand):
+    help = 'Пересчет числа ответов и последнего сообщения тем'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        last_pk = 0
+        while True:
+            ids = list(Thread.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                total += Thread.refresh_post_stats(ids)
+            last_pk = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано тем: {total}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from forum.activity import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет репутации, активности по категориям и ленты профилей'
+
+    def handle(self, *args, **options):
+        total = rebuild_user_stats()
+        self.stdout.write(self.style.SUCCESS(f'Пользователей: {total}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from forum import trending
+
+
+class Command(BaseCommand):
+    help = 'Пакетный пересчет рейтингов тем (горячие, растущие, за неделю) по всем событиям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        total = trending.recompute_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано тем: {total}'))
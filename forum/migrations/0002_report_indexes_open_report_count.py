@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_open_reports(apps, schema_editor):
+    Post = apps.get_model("forum", "Post")
+    Report = apps.get_model("forum", "Report")
+    open_reports = (
+        Report.objects.filter(post=OuterRef("pk"), status__in=("pending", "reviewed"))
+        .order_by()
+        .values("post")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Post.objects.filter(reports__isnull=False).update(
+        open_report_count=Coalesce(Subquery(open_reports), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="open_report_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Открытые жалобы"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["status", "created_at"], name="forum_repor_status_72c486_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(
+                fields=["post", "status"], name="forum_repor_post_id_fd54d5_idx"
+            ),
+        ),
+        migrations.RunPython(count_open_reports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0002_report_indexes_open_report_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="minhash",
+            field=models.BinaryField(null=True, verbose_name="MinHash-сигнатура"),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="minhash",
+            field=models.BinaryField(null=True, verbose_name="MinHash-сигнатура"),
+        ),
+        migrations.CreateModel(
+            name="LSHBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("thread", "Тема"), ("post", "Сообщение")],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("band", models.PositiveSmallIntegerField()),
+                ("bucket", models.BigIntegerField()),
+            ],
+            options={
+                "verbose_name": "LSH-бакет",
+                "verbose_name_plural": "LSH-бакеты",
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "band", "bucket"],
+                        name="forum_lshbu_kind_c2055c_idx",
+                    )
+                ],
+                "unique_together": {("kind", "object_id", "band")},
+            },
+        ),
+    ]
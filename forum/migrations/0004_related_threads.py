@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0003_minhash_lsh_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedThread",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="forum.thread",
+                    ),
+                ),
+                (
+                    "thread",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_links",
+                        to="forum.thread",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Похожая тема",
+                "verbose_name_plural": "Похожие темы",
+                "ordering": ["rank"],
+                "unique_together": {("thread", "rank")},
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:48
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_tagged_threads(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    TaggedItem = apps.get_model("taggit", "TaggedItem")
+    Thread = apps.get_model("forum", "Thread")
+    TagStat = apps.get_model("forum", "TagStat")
+    content_type = ContentType.objects.filter(app_label="forum", model="thread").first()
+    if content_type is None:
+        return
+    counts = (
+        TaggedItem.objects.filter(
+            content_type=content_type,
+            object_id__in=Thread.objects.filter(is_active=True).values("pk"),
+        )
+        .values("tag_id")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+    TagStat.objects.bulk_create(
+        [TagStat(tag_id=row["tag_id"], thread_count=row["n"]) for row in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "taggit",
+            "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx",
+        ),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("forum", "0004_related_threads"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagStat",
+            fields=[
+                (
+                    "tag",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stat",
+                        serialize=False,
+                        to="taggit.tag",
+                    ),
+                ),
+                (
+                    "thread_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Тем"),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика тега",
+                "verbose_name_plural": "Статистика тегов",
+                "indexes": [
+                    models.Index(
+                        fields=["-thread_count"], name="forum_tagst_thread__078d05_idx"
+                    )
+                ],
+            },
+        ),
+        # Страница тега ищет темы по (tag_id, content_type_id) и сразу получает object_id
+        migrations.RunSQL(
+            "CREATE INDEX forum_taggeditem_tag_ct_obj "
+            "ON taggit_taggeditem (tag_id, content_type_id, object_id)",
+            "DROP INDEX forum_taggeditem_tag_ct_obj",
+        ),
+        migrations.RunPython(count_tagged_threads, migrations.RunPython.noop),
+    ]
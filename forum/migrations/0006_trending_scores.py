@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0005_tag_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thread",
+            name="hot_score",
+            field=models.FloatField(
+                default=0, editable=False, verbose_name="Горячесть"
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="rising_score",
+            field=models.FloatField(default=0, editable=False, verbose_name="Рост"),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="weekly_score",
+            field=models.FloatField(
+                default=0, editable=False, verbose_name="Активность за неделю"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-hot_score"],
+                name="thread_hot_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-rising_score"],
+                name="thread_rising_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-weekly_score"],
+                name="thread_weekly_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-hot_score"],
+                name="thread_category_hot_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-rising_score"],
+                name="thread_category_rising_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-weekly_score"],
+                name="thread_category_weekly_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:59
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_thread_stats(apps, schema_editor):
+    Thread = apps.get_model("forum", "Thread")
+    Post = apps.get_model("forum", "Post")
+    posts = Post.objects.filter(thread=OuterRef("pk"), is_active=True)
+    last = posts.order_by("-created_at", "-pk")
+    counts = posts.order_by().values("thread").annotate(n=Count("pk")).values("n")
+    Thread.objects.update(
+        reply_count=Coalesce(Subquery(counts), Value(0)),
+        last_post=Subquery(last.values("pk")[:1]),
+        last_post_author=Subquery(last.values("author")[:1]),
+        last_post_at=Coalesce(Subquery(last.values("created_at")[:1]), F("created_at")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("forum", "0006_trending_scores"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thread",
+            name="last_post",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="forum.post",
+                verbose_name="Последнее сообщение",
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="last_post_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="Последняя активность",
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="last_post_author",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Автор последнего сообщения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="reply_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Ответов"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["thread", "created_at"],
+                name="post_thread_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-is_pinned", "-last_post_at"],
+                name="thread_category_last_post_idx",
+            ),
+        ),
+        migrations.RunPython(fill_thread_stats, migrations.RunPython.noop),
+    ]
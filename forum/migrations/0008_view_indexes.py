@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0007_thread_last_post"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="like",
+            index=models.Index(fields=["post", "like_type"], name="like_post_type_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="privatemessage",
+            index=models.Index(
+                fields=["recipient", "-created_at"], name="message_inbox_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-last_post_at"],
+                name="thread_category_activity_idx",
+            ),
+        ),
+    ]
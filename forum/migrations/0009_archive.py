@@ -0,0 +1,157 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("forum", "0008_view_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedThread",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("title", models.CharField(max_length=200, verbose_name="Заголовок")),
+                ("slug", models.SlugField(max_length=200, unique=True)),
+                ("content", models.TextField(verbose_name="Содержание")),
+                ("content_html", models.TextField(verbose_name="HTML")),
+                ("views", models.IntegerField(default=0, verbose_name="Просмотры")),
+                (
+                    "is_pinned",
+                    models.BooleanField(default=False, verbose_name="Закреплена"),
+                ),
+                (
+                    "is_locked",
+                    models.BooleanField(default=False, verbose_name="Заблокирована"),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(default=True, verbose_name="Активна"),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Создана")),
+                ("updated_at", models.DateTimeField(verbose_name="Обновлена")),
+                (
+                    "reply_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Ответов"),
+                ),
+                (
+                    "last_post_at",
+                    models.DateTimeField(verbose_name="Последняя активность"),
+                ),
+                ("tags", models.JSONField(default=list, verbose_name="Теги")),
+                (
+                    "subscribers",
+                    models.JSONField(default=list, verbose_name="Подписчики"),
+                ),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="В архиве с"),
+                ),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_threads",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_threads",
+                        to="forum.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивная тема",
+                "verbose_name_plural": "Архивные темы",
+                "ordering": ["-last_post_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedPost",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("content", models.TextField(verbose_name="Содержание")),
+                ("content_html", models.TextField(verbose_name="HTML")),
+                (
+                    "is_edited",
+                    models.BooleanField(default=False, verbose_name="Отредактировано"),
+                ),
+                (
+                    "edited_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Отредактировано в"
+                    ),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(default=True, verbose_name="Активно"),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(verbose_name="Обновлено")),
+                (
+                    "like_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Нравится"),
+                ),
+                (
+                    "dislike_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Не нравится"),
+                ),
+                ("likes", models.JSONField(default=list, verbose_name="Лайки")),
+                (
+                    "attachments",
+                    models.JSONField(default=list, verbose_name="Вложения"),
+                ),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_posts",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор",
+                    ),
+                ),
+                (
+                    "thread",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="posts",
+                        to="forum.archivedthread",
+                        verbose_name="Тема",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивное сообщение",
+                "verbose_name_plural": "Архивные сообщения",
+                "ordering": ["created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="archivedthread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-last_post_at"],
+                name="archived_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedpost",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["thread", "created_at"],
+                name="archived_post_thread_idx",
+            ),
+        ),
+    ]
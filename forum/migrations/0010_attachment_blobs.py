@@ -0,0 +1,112 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("forum", "0009_archive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="attachment",
+            name="file",
+            field=models.FileField(max_length=255, upload_to="attachments/%Y/%m/%d/"),
+        ),
+        migrations.AlterField(
+            model_name="attachment",
+            name="size",
+            field=models.BigIntegerField(),
+        ),
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("file", models.FileField(max_length=255, upload_to="")),
+                ("size", models.BigIntegerField()),
+                ("ref_count", models.IntegerField(default=0, verbose_name="Ссылок")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Файл",
+                "verbose_name_plural": "Файлы",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("ref_count__lte", 0)),
+                        fields=["created_at"],
+                        name="blob_unreferenced_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="attachments",
+                to="forum.blob",
+            ),
+        ),
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("filename", models.CharField(max_length=255)),
+                ("size", models.BigIntegerField()),
+                ("offset", models.BigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upload_sessions",
+                        to="forum.post",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upload_sessions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка",
+                "verbose_name_plural": "Загрузки",
+                "indexes": [
+                    models.Index(
+                        fields=["updated_at"], name="forum_uploa_updated_04d5c8_idx"
+                    )
+                ],
+            },
+        ),
+    ]
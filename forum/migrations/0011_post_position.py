@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def number_posts(model, sequences=None):
+    """Пронумеровать сообщения каждой темы по порядку (created_at, pk)"""
+    batch = []
+    thread_id = position = None
+    for post in model.objects.order_by("thread_id", "created_at", "pk").only("pk", "thread_id").iterator():
+        if post.thread_id != thread_id:
+            thread_id, position = post.thread_id, 0
+        position += 1
+        post.position = position
+        if sequences is not None:
+            sequences[thread_id] = position
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_update(batch, ["position"])
+            batch = []
+    model.objects.bulk_update(batch, ["position"])
+
+
+def fill_positions(apps, schema_editor):
+    Thread = apps.get_model("forum", "Thread")
+    sequences = {}
+    number_posts(apps.get_model("forum", "Post"), sequences)
+    number_posts(apps.get_model("forum", "ArchivedPost"))
+    threads = [Thread(pk=pk, post_sequence=sequence) for pk, sequence in sequences.items()]
+    Thread.objects.bulk_update(threads, ["post_sequence"], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0010_attachment_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedpost",
+            name="position",
+            field=models.PositiveIntegerField(default=0, verbose_name="Номер в теме"),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="position",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Номер в теме"
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="post_sequence",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Номер последнего сообщения"
+            ),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="archivedpost",
+            constraint=models.UniqueConstraint(
+                fields=("thread", "position"), name="archived_post_position_uniq"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="post",
+            constraint=models.UniqueConstraint(
+                fields=("thread", "position"), name="post_thread_position_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_user_last_seen_default"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("forum", "0011_post_position"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStat",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stat",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "likes_received",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Получено лайков"
+                    ),
+                ),
+                (
+                    "dislikes_received",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Получено дизлайков"
+                    ),
+                ),
+                (
+                    "recent",
+                    models.JSONField(default=list, verbose_name="Последняя активность"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Статистика пользователя",
+                "verbose_name_plural": "Статистика пользователей",
+            },
+        ),
+        migrations.CreateModel(
+            name="UserCategoryStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("thread_count", models.IntegerField(default=0, verbose_name="Тем")),
+                (
+                    "post_count",
+                    models.IntegerField(default=0, verbose_name="Сообщений"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_stats",
+                        to="forum.category",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="category_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Активность в категории",
+                "verbose_name_plural": "Активность в категориях",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-post_count"], name="user_category_top_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="usercategorystat",
+            constraint=models.UniqueConstraint(
+                fields=("user", "category"), name="user_category_stat_uniq"
+            ),
+        ),
+    ]
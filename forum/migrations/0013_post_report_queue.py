@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:58
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+
+
+def fill_first_reported(apps, schema_editor):
+    Post = apps.get_model("forum", "Post")
+    Report = apps.get_model("forum", "Report")
+    first_open = (
+        Report.objects.filter(post=OuterRef("pk"), status__in=("pending", "reviewed"))
+        .order_by()
+        .values("post")
+        .annotate(first=Min("created_at"))
+        .values("first")
+    )
+    Post.objects.filter(open_report_count__gt=0).update(first_reported_at=Subquery(first_open))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0012_user_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="first_reported_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Первая открытая жалоба",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("open_report_count__gt", 0)),
+                fields=["first_reported_at", "id"],
+                name="post_report_queue_idx",
+            ),
+        ),
+        migrations.RunPython(fill_first_reported, migrations.RunPython.noop),
+    ]
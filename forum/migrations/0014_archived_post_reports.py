@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0013_post_report_queue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedpost",
+            name="reports",
+            field=models.JSONField(default=list, verbose_name="Жалобы"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forum", "0014_archived_post_reports"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="thread",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-last_post_at"],
+                name="thread_last_post_idx",
+            ),
+        ),
+    ]
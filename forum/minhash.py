@@ -0,0 +1,61 @@
+"""MinHash-сигнатуры текстов и LSH-бакеты для поиска похожих сообщений.
+
+Сигнатура - ``NUM_PERM`` 32-битных минимумов хешей шинглов (см.
+``fingerprint.shingle_hashes``) под независимыми перестановками
+``(a * x + b) mod p``; доля совпавших позиций двух сигнатур оценивает сходство
+Жаккара. В БД сигнатура хранится упакованной в ``NUM_PERM * 4`` байт.
+
+Для поиска сигнатура режется на ``BANDS`` полос по ``ROWS`` значений, хеш полосы
+становится ключом бакета: тексты со сходством s совпадают хотя бы в одной
+полосе с вероятностью ``1 - (1 - s**ROWS)**BANDS`` (около 0.5 при s = 0.5 и
+больше 0.99 при s = 0.8), так что кандидаты находятся по индексу, без перебора.
+"""
+import hashlib
+import random
+import struct
+
+from .fingerprint import shingle_hashes
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SIGNATURE_BYTES = NUM_PERM * 4
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20240131)  # Параметры фиксированы: сигнатуры хранятся в БД
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_packer = struct.Struct(f'<{NUM_PERM}I')
+_packer_rows = struct.Struct(f'<{ROWS}I')
+
+
+def signature(text):
+    """MinHash-сигнатура текста: кортеж из NUM_PERM целых"""
+    hashes = [h & _PRIME for h in shingle_hashes(text)]
+    if not hashes:
+        return (_MAX_HASH,) * NUM_PERM
+    return tuple(min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS)
+
+
+def pack(sig):
+    return _packer.pack(*sig)
+
+
+def unpack(data):
+    return _packer.unpack(bytes(data))
+
+
+def similarity(a, b):
+    """Оценка сходства Жаккара по двум сигнатурам"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def band_buckets(sig):
+    """Пары (номер полосы, ключ бакета) для LSH-индекса"""
+    buckets = []
+    for band in range(BANDS):
+        rows = _packer_rows.pack(*sig[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
@@ -1,10 +1,31 @@
-from django.db import models
+import mimetypes
+import uuid
+from collections import Counter, defaultdict
+
+from django.db import models, transaction
+from django.db.models import F, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.text import slugify
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from taggit.managers import TaggableManager
 from markdownx.models import MarkdownxField
-from markdownx.utils import markdownify
+
+from . import minhash, trending
+from .pagination import page_of
+
+
+def render_markdown(text):
+    """Markdown -> безопасный HTML, см. forum.rendering"""
+    from .rendering import render
+    return render(text)
+
+
+# Вложения, для которых в теме показывается уменьшенная копия
+IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
 
 
 class Category(models.Model):
@@ -37,11 +58,34 @@ class Category(models.Model):
         return self.threads.filter(is_active=True).count()
     
     def post_count(self):
-        return sum(thread.posts.count() for thread in self.threads.filter(is_active=True))
+        return self.threads.filter(is_active=True).aggregate(n=Sum('reply_count'))['n'] or 0
     
     def last_post(self):
-        posts = Post.objects.filter(thread__category=self, thread__is_active=True).order_by('-created_at')
-        return posts.first() if posts.exists() else None
+        thread = (self.threads.filter(is_active=True, last_post__isnull=False)
+                  .select_related('last_post__author', 'last_post__thread').order_by('-last_post_at').first())
+        return thread.last_post if thread else None
+    
+    @classmethod
+    def with_stats(cls, categories):
+        """Категории со счетчиками и последним сообщением за три запроса.
+
+        Для списка категорий вместо thread_count/post_count/last_post, которые
+        делают по запросу на каждую категорию.
+        """
+        active = models.Q(threads__is_active=True)
+        latest = (Thread.objects.filter(category=OuterRef('pk'), is_active=True, last_post__isnull=False)
+                  .order_by('-last_post_at').values('pk')[:1])
+        categories = list(categories.annotate(
+            active_thread_count=Count('threads', filter=active),
+            active_post_count=Coalesce(Sum('threads__reply_count', filter=active), 0),
+            latest_thread_id=Subquery(latest),
+        ))
+        threads = (Thread.objects.select_related('last_post__author', 'last_post__thread')
+                   .in_bulk([category.latest_thread_id for category in categories if category.latest_thread_id]))
+        for category in categories:
+            thread = threads.get(category.latest_thread_id)
+            category.latest_post = thread.last_post if thread else None
+        return categories
 
 
 class Thread(models.Model):
@@ -57,6 +101,19 @@ class Thread(models.Model):
     is_active = models.BooleanField('Активна', default=True)
     created_at = models.DateTimeField('Создана', auto_now_add=True)
     updated_at = models.DateTimeField('Обновлена', auto_now=True)
+    minhash = models.BinaryField('MinHash-сигнатура', null=True, editable=False)
+    hot_score = models.FloatField('Горячесть', default=0, editable=False)
+    rising_score = models.FloatField('Рост', default=0, editable=False)
+    weekly_score = models.FloatField('Активность за неделю', default=0, editable=False)
+    # Денормализация последнего ответа: списки тем не обращаются к таблице сообщений
+    reply_count = models.PositiveIntegerField('Ответов', default=0, editable=False)
+    # Последний выданный Post.position (см. forum/pagination.py)
+    post_sequence = models.PositiveIntegerField('Номер последнего сообщения', default=0, editable=False)
+    last_post = models.ForeignKey('Post', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                  related_name='+', verbose_name='Последнее сообщение')
+    last_post_author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                         editable=False, related_name='+', verbose_name='Автор последнего сообщения')
+    last_post_at = models.DateTimeField('Последняя активность', default=timezone.now, editable=False)
     tags = TaggableManager(blank=True)
     
     class Meta:
@@ -66,33 +123,121 @@ class Thread(models.Model):
         indexes = [
             models.Index(fields=['-created_at']),
             models.Index(fields=['-updated_at']),
+            # Список тем категории (category_detail)
+            models.Index(fields=['category', '-is_pinned', '-last_post_at'], name='thread_category_last_post_idx',
+                         condition=models.Q(is_active=True)),
+            # Последние темы на главной (index)
+            models.Index(fields=['-last_post_at'], name='thread_last_post_idx', condition=models.Q(is_active=True)),
+            # Последнее сообщение категории (Category.last_post)
+            models.Index(fields=['category', '-last_post_at'], name='thread_category_activity_idx',
+                         condition=models.Q(is_active=True)),
+            # Рейтинги (forum/trending.py): глобально и по категории, только активные темы
+            models.Index(fields=['-hot_score'], name='thread_hot_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['-rising_score'], name='thread_rising_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['-weekly_score'], name='thread_weekly_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['category', '-hot_score'], name='thread_category_hot_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['category', '-rising_score'], name='thread_category_rising_idx',
+                         condition=models.Q(is_active=True)),
+            models.Index(fields=['category', '-weekly_score'], name='thread_category_weekly_idx',
+                         condition=models.Q(is_active=True)),
         ]
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Прежняя видимость: скрытие и возврат темы меняют счетчики тегов
+        instance._loaded_is_active = dict(zip(field_names, values)).get('is_active')
+        return instance
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+        if self._state.adding and self.slug:
+            self.slug = self.free_slug(self.slug)
+        if self._state.adding and not self.hot_score:
+            for field, value in trending.initial_scores(self.created_at or timezone.now()).items():
+                setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        reindex = update_fields is None or {'title', 'content'} & set(update_fields)
+        if reindex:
+            self.minhash = minhash.pack(minhash.signature(self.minhash_text()))
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'minhash'}
+        adding = self._state.adding
+        visibility_changed = (not adding and (update_fields is None or 'is_active' in update_fields)
+                              and getattr(self, '_loaded_is_active', None) not in (None, self.is_active))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if reindex:
+                LSHBucket.index('thread', self.pk, self.minhash)
+            if visibility_changed:
+                from .signals import schedule
+                schedule('tags', self.tags.values_list('pk', flat=True))
+                if not self.is_active:
+                    UserStat.forget([(self.author_id, self.category_id, 'thread', self.pk)] + [
+                        (author_id, self.category_id, 'post', pk)
+                        for author_id, pk in self.posts.values_list('author_id', 'pk')
+                    ], uncount=False)
+            if adding:
+                UserStat.record(self.author_id, self.category_id, 'thread',
+                                UserStat.entry('thread', self.pk, self.title, self.slug, self.created_at))
+        self._loaded_is_active = self.is_active
         # Update author stats
         self.author.update_stats()
     
+    @classmethod
+    def free_slug(cls, slug):
+        """slug или slug-2, slug-3...: не занятый ни живой, ни архивной темой.
+
+        Slug архивной темы зарезервирован - ее старые ссылки не должны вести на
+        новую тему.
+        """
+        base = slug[:190]
+        candidate, n = base, 1
+        while (cls.objects.filter(slug=candidate).exists()
+               or ArchivedThread.objects.filter(slug=candidate).exists()):
+            n += 1
+            candidate = f'{base}-{n}'
+        return candidate
+    
+    def minhash_text(self):
+        return f'{self.title}\n{self.content}'
+    
     def get_absolute_url(self):
         return reverse('forum:thread_detail', kwargs={'slug': self.slug})
     
     def formatted_markdown(self):
-        return markdownify(self.content)
-    
-    def post_count(self):
-        return self.posts.count()
+        return render_markdown(self.content)
     
-    def last_post(self):
-        return self.posts.order_by('-created_at').first()
+    def related_threads(self):
+        return [link.related for link in
+                self.related_links.filter(related__is_active=True).select_related('related__category')]
     
     def increment_views(self):
         self.views += 1
-        self.save(update_fields=['views'])
+        # Узкий UPDATE без save(): просмотр не должен пересчитывать статистику автора
+        Thread.objects.filter(pk=self.pk).update(views=F('views') + 1, **trending.event_updates(trending.VIEW_WEIGHT))
+    
+    def record_activity(self, weight, when=None):
+        Thread.objects.filter(pk=self.pk).update(**trending.event_updates(weight, when))
+    
+    @classmethod
+    def refresh_post_stats(cls, thread_ids=None):
+        """Пересчитать число ответов и последний ответ тем одним UPDATE (None - все темы)"""
+        posts = Post.objects.filter(thread=OuterRef('pk'), is_active=True)
+        last = posts.order_by('-created_at', '-pk')
+        threads = cls.objects.all() if thread_ids is None else cls.objects.filter(pk__in=thread_ids)
+        return threads.update(
+            reply_count=Coalesce(Subquery(posts.order_by().values('thread').annotate(n=Count('pk')).values('n')),
+                                 Value(0)),
+            last_post=Subquery(last.values('pk')[:1]),
+            last_post_author=Subquery(last.values('author')[:1]),
+            last_post_at=Coalesce(Subquery(last.values('created_at')[:1]), F('created_at')),
+        )
 
 
 class Post(models.Model):
@@ -103,6 +248,11 @@ class Post(models.Model):
     is_edited = models.BooleanField('Отредактировано', default=False)
     edited_at = models.DateTimeField('Отредактировано в', null=True, blank=True)
     is_active = models.BooleanField('Активно', default=True)
+    open_report_count = models.PositiveIntegerField('Открытые жалобы', default=0)
+    # Время самой старой открытой жалобы: ключ очереди модерации (moderation/services.py)
+    first_reported_at = models.DateTimeField('Первая открытая жалоба', null=True, blank=True, editable=False)
+    minhash = models.BinaryField('MinHash-сигнатура', null=True, editable=False)
+    position = models.PositiveIntegerField('Номер в теме', default=0, editable=False)
     created_at = models.DateTimeField('Создано', auto_now_add=True)
     updated_at = models.DateTimeField('Обновлено', auto_now=True)
     
@@ -110,26 +260,359 @@ class Post(models.Model):
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
         ordering = ['created_at']
+        constraints = [
+            # Страницы темы и ссылки на сообщения (forum/pagination.py)
+            models.UniqueConstraint(fields=['thread', 'position'], name='post_thread_position_uniq'),
+        ]
         indexes = [
             models.Index(fields=['created_at']),
+            # Сообщения темы и ее последний ответ (Thread.refresh_post_stats)
+            models.Index(fields=['thread', 'created_at'], name='post_thread_created_idx',
+                         condition=models.Q(is_active=True)),
+            # Очередь модерации: keyset по (first_reported_at, id) только среди сообщений с жалобами
+            models.Index(fields=['first_reported_at', 'id'], name='post_report_queue_idx',
+                         condition=models.Q(open_report_count__gt=0)),
         ]
     
     def __str__(self):
         return f"Post by {self.author.username} in {self.thread.title}"
     
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update thread's updated_at
-        self.thread.updated_at = self.created_at
-        self.thread.save(update_fields=['updated_at'])
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        reindex = update_fields is None or 'content' in update_fields
+        if reindex:
+            self.minhash = minhash.pack(minhash.signature(self.minhash_text()))
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'minhash'}
+        with transaction.atomic():
+            if adding and not self.position:
+                # UPDATE блокирует строку темы до конца транзакции: номера не повторятся
+                threads = Thread.objects.filter(pk=self.thread_id)
+                threads.update(post_sequence=F('post_sequence') + 1)
+                self.position = threads.values_list('post_sequence', flat=True).get()
+            super().save(*args, **kwargs)
+            if reindex:
+                LSHBucket.index('post', self.pk, self.minhash)
+            if adding:
+                # Счетчики темы, последний ответ и рейтинги - одним UPDATE
+                updates = trending.event_updates(trending.POST_WEIGHT, self.created_at)
+                if self.is_active:
+                    updates.update(reply_count=F('reply_count') + 1, last_post=self.pk,
+                                   last_post_author=self.author_id, last_post_at=self.created_at)
+                Thread.objects.filter(pk=self.thread_id).update(updated_at=self.created_at, **updates)
+                UserStat.record(self.author_id, self.thread.category_id, 'post',
+                                UserStat.entry('post', self.pk, self.thread.title, self.thread.slug, self.created_at))
+            elif update_fields is None or 'is_active' in update_fields:
+                Thread.refresh_post_stats([self.thread_id])
         # Update author stats
         self.author.update_stats()
     
+    # Счетчики темы и агрегаты автора при удалении (в том числе списком и
+    # каскадом) обновляет post_delete в forum/signals.py
+    
     def formatted_markdown(self):
-        return markdownify(self.content)
+        return render_markdown(self.content)
+    
+    def minhash_text(self):
+        return self.content
+    
+    def get_absolute_url(self):
+        # Постоянная ссылка: post_permalink перенаправит на страницу темы
+        return reverse('forum:post_permalink', kwargs={'pk': self.pk})
+    
+    def get_page_url(self):
+        """Адрес страницы темы с этим сообщением"""
+        page = page_of(self.position)
+        query = f'?page={page}' if page > 1 else ''
+        return f"{self.thread.get_absolute_url()}{query}#post-{self.id}"
+
+
+class LSHBucket(models.Model):
+    """LSH-бакеты MinHash-сигнатур тем и сообщений (см. forum/minhash.py)"""
+    KINDS = (
+        ('thread', 'Тема'),
+        ('post', 'Сообщение'),
+    )
+    
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = 'LSH-бакет'
+        verbose_name_plural = 'LSH-бакеты'
+        unique_together = ('kind', 'object_id', 'band')
+        indexes = [
+            models.Index(fields=['kind', 'band', 'bucket']),
+        ]
+    
+    @classmethod
+    def index(cls, kind, object_id, packed):
+        """Заменить бакеты объекта бакетами его сигнатуры"""
+        cls.objects.filter(kind=kind, object_id=object_id).delete()
+        cls.objects.bulk_create([
+            cls(kind=kind, object_id=object_id, band=band, bucket=bucket)
+            for band, bucket in minhash.band_buckets(minhash.unpack(packed))
+        ])
+    
+    @classmethod
+    def candidates(cls, kind, packed, limit=50, among=None):
+        """id объектов, совпавших хотя бы в одной полосе, по числу совпадений.
+
+        among - queryset допустимых объектов (например, только активные темы):
+        скрытые и удаленные не занимают места среди limit кандидатов.
+        """
+        match = models.Q()
+        for band, bucket in minhash.band_buckets(minhash.unpack(packed)):
+            match |= models.Q(band=band, bucket=bucket)
+        buckets = cls.objects.filter(match, kind=kind)
+        if among is not None:
+            buckets = buckets.filter(object_id__in=among.values('pk'))
+        return list(buckets
+                    .values('object_id').annotate(hits=models.Count('id'))
+                    .order_by('-hits').values_list('object_id', flat=True)[:limit])
+
+
+class RelatedThread(models.Model):
+    """Похожая тема, рассчитанная пакетно (см. forum/related.py)"""
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        verbose_name = 'Похожая тема'
+        verbose_name_plural = 'Похожие темы'
+        ordering = ['rank']
+        unique_together = ('thread', 'rank')
+    
+    def __str__(self):
+        return f"{self.thread_id} -> {self.related_id} ({self.score:.2f})"
+
+
+class TagStat(models.Model):
+    """Денормализованное число активных тем с тегом (см. forum/tags.py)"""
+    tag = models.OneToOneField('taggit.Tag', on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    thread_count = models.PositiveIntegerField('Тем', default=0)
+    
+    class Meta:
+        verbose_name = 'Статистика тега'
+        verbose_name_plural = 'Статистика тегов'
+        indexes = [
+            models.Index(fields=['-thread_count']),
+        ]
+    
+    def __str__(self):
+        return f"{self.tag_id}: {self.thread_count}"
+
+
+class UserStat(models.Model):
+    """Агрегаты профиля пользователя, обновляемые по событиям (см. forum/activity.py).
+
+    Нет строки - агрегаты еще не посчитаны: события ее не создают, первый
+    просмотр профиля или ``rebuild_user_stats`` считает все с нуля.
+    """
+    RECENT_SIZE = 10
+    
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='stat')
+    likes_received = models.PositiveIntegerField('Получено лайков', default=0)
+    dislikes_received = models.PositiveIntegerField('Получено дизлайков', default=0)
+    # [{kind, id, title, slug, at}] - последние темы и сообщения, новые первыми
+    recent = models.JSONField('Последняя активность', default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+    
+    def __str__(self):
+        return f"{self.user_id}: +{self.likes_received}/-{self.dislikes_received}"
+    
+    @staticmethod
+    def entry(kind, pk, title, slug, at):
+        return {'kind': kind, 'id': pk, 'title': title, 'slug': slug, 'at': at.isoformat()}
+    
+    def recent_items(self):
+        """Лента для шаблона: дата как datetime, адрес темы или сообщения"""
+        items = []
+        for item in self.recent:
+            if item['kind'] == 'post':
+                url = reverse('forum:post_permalink', kwargs={'pk': item['id']})
+            else:
+                url = reverse('forum:thread_detail', kwargs={'slug': item['slug']}) if item['slug'] else None
+            items.append({**item, 'url': url, 'at': parse_datetime(item['at'])})
+        return items
+    
+    @classmethod
+    def record(cls, user_id, category_id, kind, entry):
+        """Новая тема или сообщение: счетчик категории и лента активности"""
+        stat = cls.objects.select_for_update().filter(pk=user_id).first()
+        if stat is None:
+            return
+        UserCategoryStat.bump(user_id, category_id, **{f'{kind}_count': 1})
+        stat.recent = [entry, *stat.recent][:cls.RECENT_SIZE]
+        stat.save(update_fields=['recent', 'updated_at'])
+    
+    @classmethod
+    def forget(cls, entries, uncount=True):
+        """Удаление (uncount) или скрытие тем и сообщений; entries - (автор, категория, kind, pk).
+
+        Скрытые остаются в счетчиках категорий, как и при полном пересчете, но
+        уходят из ленты.
+        """
+        removed = defaultdict(set)
+        counts = Counter()
+        for user_id, category_id, kind, pk in entries:
+            removed[user_id].add((kind, pk))
+            counts[user_id, category_id, kind] += 1
+        with transaction.atomic():
+            for stat in cls.objects.select_for_update().filter(pk__in=removed):
+                if uncount:
+                    for (user_id, category_id, kind), n in counts.items():
+                        if user_id == stat.pk:
+                            UserCategoryStat.bump(user_id, category_id, **{f'{kind}_count': -n})
+                    # Как при полном пересчете: категорий без тем и сообщений в профиле нет
+                    UserCategoryStat.objects.filter(user=stat.pk, thread_count__lte=0, post_count__lte=0).delete()
+                recent = [item for item in stat.recent if (item['kind'], item['id']) not in removed[stat.pk]]
+                if recent != stat.recent:
+                    stat.recent = recent
+                    stat.save(update_fields=['recent', 'updated_at'])
+    
+    @classmethod
+    def record_reaction(cls, author_id, user_id, old_type, new_type):
+        """Лайк поставлен (old_type=0), снят (new_type=0) или изменен; свои лайки не считаются"""
+        if author_id == user_id or old_type == new_type:
+            return
+        delta = {'likes_received': (new_type == 1) - (old_type == 1),
+                 'dislikes_received': (new_type == -1) - (old_type == -1)}
+        if cls.objects.filter(pk=author_id).update(**{name: F(name) + n for name, n in delta.items() if n}):
+            # Репутация - лайки минус дизлайки; UPDATE минует User.save, кеш сбрасывается здесь
+            from django.contrib.auth import get_user_model
+            from accounts.models import user_cache_key
+            reputation = delta['likes_received'] - delta['dislikes_received']
+            get_user_model().objects.filter(pk=author_id).update(reputation=F('reputation') + reputation)
+            cache.delete(user_cache_key(author_id))
+
+
+class UserCategoryStat(models.Model):
+    """Число тем и сообщений пользователя в категории (включая архив)"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='category_stats')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='user_stats')
+    thread_count = models.IntegerField('Тем', default=0)
+    post_count = models.IntegerField('Сообщений', default=0)
+    
+    class Meta:
+        verbose_name = 'Активность в категории'
+        verbose_name_plural = 'Активность в категориях'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category'], name='user_category_stat_uniq'),
+        ]
+        indexes = [
+            # Самые активные категории профиля
+            models.Index(fields=['user', '-post_count'], name='user_category_top_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} в {self.category_id}: {self.thread_count}/{self.post_count}"
+    
+    @classmethod
+    def bump(cls, user_id, category_id, **deltas):
+        updates = {name: F(name) + n for name, n in deltas.items()}
+        rows = cls.objects.filter(user_id=user_id, category_id=category_id)
+        if not rows.update(**updates):
+            cls.objects.bulk_create([cls(user_id=user_id, category_id=category_id)], ignore_conflicts=True)
+            rows.update(**updates)
+
+
+class ArchivedThread(models.Model):
+    """Тема в архиве: копия с тем же id и замороженным HTML (см. forum/archive.py)"""
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField('Заголовок', max_length=200)
+    slug = models.SlugField(unique=True, max_length=200)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='archived_threads',
+                                 verbose_name='Категория')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_threads',
+                               verbose_name='Автор')
+    content = models.TextField('Содержание')
+    content_html = models.TextField('HTML')
+    views = models.IntegerField('Просмотры', default=0)
+    is_pinned = models.BooleanField('Закреплена', default=False)
+    is_locked = models.BooleanField('Заблокирована', default=False)
+    is_active = models.BooleanField('Активна', default=True)
+    created_at = models.DateTimeField('Создана')
+    updated_at = models.DateTimeField('Обновлена')
+    reply_count = models.PositiveIntegerField('Ответов', default=0)
+    last_post_at = models.DateTimeField('Последняя активность')
+    tags = models.JSONField('Теги', default=list)
+    subscribers = models.JSONField('Подписчики', default=list)
+    archived_at = models.DateTimeField('В архиве с', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Архивная тема'
+        verbose_name_plural = 'Архивные темы'
+        ordering = ['-last_post_at']
+        indexes = [
+            models.Index(fields=['category', '-last_post_at'], name='archived_category_idx',
+                         condition=models.Q(is_active=True)),
+        ]
+    
+    def __str__(self):
+        return self.title
     
     def get_absolute_url(self):
-        return f"{self.thread.get_absolute_url()}#post-{self.id}"
+        return reverse('forum:thread_detail', kwargs={'slug': self.slug})
+
+
+class ArchivedPost(models.Model):
+    """Сообщение архивной темы; лайки, вложения и жалобы сохранены для восстановления"""
+    id = models.BigIntegerField(primary_key=True)
+    thread = models.ForeignKey(ArchivedThread, on_delete=models.CASCADE, related_name='posts', verbose_name='Тема')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_posts',
+                               verbose_name='Автор')
+    content = models.TextField('Содержание')
+    content_html = models.TextField('HTML')
+    is_edited = models.BooleanField('Отредактировано', default=False)
+    edited_at = models.DateTimeField('Отредактировано в', null=True, blank=True)
+    is_active = models.BooleanField('Активно', default=True)
+    created_at = models.DateTimeField('Создано')
+    updated_at = models.DateTimeField('Обновлено')
+    like_count = models.PositiveIntegerField('Нравится', default=0)
+    dislike_count = models.PositiveIntegerField('Не нравится', default=0)
+    likes = models.JSONField('Лайки', default=list)
+    attachments = models.JSONField('Вложения', default=list)
+    reports = models.JSONField('Жалобы', default=list)
+    position = models.PositiveIntegerField('Номер в теме', default=0)
+    
+    class Meta:
+        verbose_name = 'Архивное сообщение'
+        verbose_name_plural = 'Архивные сообщения'
+        ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['thread', 'position'], name='archived_post_position_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['thread', 'created_at'], name='archived_post_thread_idx',
+                         condition=models.Q(is_active=True)),
+        ]
+    
+    def __str__(self):
+        return f"Archived post {self.pk}"
+    
+    def get_absolute_url(self):
+        return reverse('forum:post_permalink', kwargs={'pk': self.pk})
+    
+    def get_page_url(self):
+        page = page_of(self.position)
+        query = f'?page={page}' if page > 1 else ''
+        return f"{self.thread.get_absolute_url()}{query}#post-{self.id}"
+    
+    @property
+    def blob_ids(self):
+        """Файлы, на которые ссылаются сохраненные вложения (старые записи без blob_id пропускаются)"""
+        return [item[4] for item in self.attachments if len(item) > 4 and item[4]]
 
 
 class Like(models.Model):
@@ -148,17 +631,68 @@ class Like(models.Model):
         verbose_name = 'Лайк'
         verbose_name_plural = 'Лайки'
         unique_together = ('post', 'user')
+        indexes = [
+            # Счетчики лайков и дизлайков сообщения (post_like) без чтения строк
+            models.Index(fields=['post', 'like_type'], name='like_post_type_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} -> {self.post.id} ({self.get_like_type_display()})"
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            # Смена типа: прежний нужен для репутации автора
+            old_type = 0 if adding else Like.objects.filter(pk=self.pk).values_list('like_type', flat=True).first() or 0
+            super().save(*args, **kwargs)
+            UserStat.record_reaction(self.post.author_id, self.user_id, old_type, self.like_type)
+        if adding and self.like_type == 1:
+            Thread.objects.filter(posts=self.post_id).update(
+                **trending.event_updates(trending.LIKE_WEIGHT, self.created_at)
+            )
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            UserStat.record_reaction(self.post.author_id, self.user_id, self.like_type, 0)
+        return result
+
+
+class Blob(models.Model):
+    """Файл, хранящийся один раз по SHA-256 содержимого (см. forum/uploads.py)"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField('Ссылок', default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+        indexes = [
+            models.Index(fields=['created_at'], name='blob_unreferenced_idx', condition=models.Q(ref_count__lte=0)),
+        ]
+    
+    def __str__(self):
+        return self.sha256
+    
+    @classmethod
+    def change_refs(cls, blob_ids, delta):
+        """Изменить ref_count на delta за каждое упоминание файла в blob_ids"""
+        by_count = defaultdict(list)
+        for pk, n in Counter(blob_ids).items():
+            by_count[n].append(pk)
+        for n, pks in by_count.items():
+            cls.objects.filter(pk__in=pks).update(ref_count=F('ref_count') + n * delta)
 
 
 class Attachment(models.Model):
     """Вложения к сообщениям"""
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='attachments')
-    file = models.FileField(upload_to='attachments/%Y/%m/%d/')
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
+    file = models.FileField(upload_to='attachments/%Y/%m/%d/', max_length=255)
     filename = models.CharField(max_length=255)
-    size = models.IntegerField()
+    size = models.BigIntegerField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -167,6 +701,43 @@ class Attachment(models.Model):
     
     def __str__(self):
         return self.filename
+    
+    def get_absolute_url(self):
+        return reverse('forum:attachment_download', kwargs={'pk': self.pk})
+    
+    @property
+    def is_image(self):
+        return (mimetypes.guess_type(self.filename)[0] or '') in IMAGE_TYPES
+    
+    def save(self, *args, **kwargs):
+        # Ссылку снимает post_delete в forum/signals.py: он срабатывает и при каскаде
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and self.blob_id:
+                Blob.objects.filter(pk=self.blob_id).update(ref_count=F('ref_count') + 1)
+
+
+class UploadSession(models.Model):
+    """Незавершенная загрузка вложения по частям"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Загрузка'
+        verbose_name_plural = 'Загрузки'
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
 
 
 class Report(models.Model):
@@ -184,6 +755,7 @@ class Report(models.Model):
         ('resolved', 'Решено'),
         ('rejected', 'Отклонено'),
     )
+    OPEN_STATUSES = ('pending', 'reviewed')
     
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reports')
     reporter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reports_made')
@@ -199,9 +771,23 @@ class Report(models.Model):
         verbose_name = 'Жалоба'
         verbose_name_plural = 'Жалобы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['post', 'status']),
+        ]
     
     def __str__(self):
         return f"Report on post {self.post.id} by {self.reporter.username}"
+    
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        # Счетчик открытых жалоб на сообщении, чтобы карточки не считали жалобы
+        if is_new and self.status in self.OPEN_STATUSES:
+            Post.objects.filter(pk=self.post_id).update(
+                open_report_count=F('open_report_count') + 1,
+                first_reported_at=Coalesce(F('first_reported_at'), Value(self.created_at)),
+            )
 
 
 class PrivateMessage(models.Model):
@@ -218,9 +804,13 @@ class PrivateMessage(models.Model):
         verbose_name = 'Личное сообщение'
         verbose_name_plural = 'Личные сообщения'
         ordering = ['-created_at']
+        indexes = [
+            # Входящие (messages_inbox): фильтр и сортировка одним индексом
+            models.Index(fields=['recipient', '-created_at'], name='message_inbox_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username} -> {self.recipient.username}: {self.subject}"
     
     def formatted_markdown(self):
-        return markdownify(self.content)
+        return render_markdown(self.content)
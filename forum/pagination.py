@@ -0,0 +1,70 @@
+"""Страницы темы по номеру сообщения в теме.
+
+У каждого сообщения есть ``position`` - порядковый номер в теме, который
+выдается при вставке из счетчика ``Thread.post_sequence`` и больше не
+меняется. Страница n темы - сообщения с номерами ``((n-1)*per_page,
+n*per_page]``, поэтому страница сообщения считается без запросов
+(``page_of``), а любая страница читается диапазоном по индексу
+``(thread, position)`` вместо OFFSET.
+
+Скрытые и удаленные сообщения номер не освобождают: на их странице будет
+меньше сообщений, зато ссылки на остальные не съезжают на другие страницы.
+Пропуск виден явно: ``PositionPage.hidden_count`` - сколько номеров диапазона
+страницы не показано, а ``start_index``/``end_index`` - номера сообщений, а не
+порядковые номера среди видимых.
+"""
+from math import ceil
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+
+
+def page_of(position, per_page=None):
+    """Номер страницы темы с сообщением position"""
+    per_page = per_page or settings.POSTS_PER_PAGE
+    return max(position - 1, 0) // per_page + 1
+
+
+class PositionPage(Page):
+    """Страница темы: диапазон номеров сообщений и число скрытых в нем"""
+
+    def start_index(self):
+        if not self.paginator.last_position:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return min(self.number * self.paginator.per_page, self.paginator.last_position)
+
+    @property
+    def hidden_count(self):
+        """Номера диапазона без видимого сообщения (скрытые и удаленные)"""
+        if not self.paginator.last_position:
+            return 0
+        return self.end_index() - self.start_index() + 1 - len(self)
+
+
+class PositionPaginator(Paginator):
+    """Paginator сообщений темы по диапазонам position.
+
+    count - число видимых сообщений (для заголовка), last_position - последний
+    выданный номер (по нему считаются страницы и диапазоны).
+    """
+
+    def __init__(self, object_list, per_page, count, last_position):
+        super().__init__(object_list, per_page)
+        self.count = count
+        self.last_position = last_position
+
+    @property
+    def num_pages(self):
+        return max(ceil(self.last_position / self.per_page), 1)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        posts = self.object_list.filter(position__gt=bottom, position__lte=bottom + self.per_page)
+        return self._get_page(posts.order_by('position'), number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return PositionPage(*args, **kwargs)
@@ -0,0 +1,135 @@
+"""Ограничение частоты действий пользователей.
+
+Счетчики скользящего окна хранятся в кеше (``RATE_LIMIT_CACHE``, Redis в
+продакшене): на каждое окно заводится ключ с атомарным ``incr``, а оценка
+числа действий за последние ``period`` секунд складывается из текущего окна и
+взвешенного по времени предыдущего. Если кеш недоступен, счетчики временно
+ведутся в памяти процесса, чтобы падение Redis не открывало дорогу флуду.
+
+Анонимы считаются по IP. За обратным прокси ``REMOTE_ADDR`` - адрес прокси,
+поэтому для запросов от адресов из ``RATE_LIMIT_TRUSTED_PROXIES`` клиент
+берется из ``X-Forwarded-For`` (первый справа адрес не из списка) или
+``X-Real-IP``. От остальных адресов заголовки не читаются: их подделает кто
+угодно.
+"""
+import ipaddress
+import logging
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import JsonResponse
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# Действие -> (число действий, период в секундах); settings.FORUM_RATE_LIMITS
+# переопределяет отдельные действия
+DEFAULT_RATE_LIMITS = {
+    'thread': (5, 600),
+    'post': (10, 60),
+    'like': (60, 60),
+    'report': (10, 3600),
+    'message': (10, 600),
+    'upload': (30, 3600),
+    'export': (3, 3600),
+}
+
+_fallback_cache = LocMemCache('forum-ratelimit', {'OPTIONS': {'MAX_ENTRIES': 100000}})
+
+
+def get_limit(action):
+    limits = {**DEFAULT_RATE_LIMITS, **getattr(settings, 'FORUM_RATE_LIMITS', {})}
+    return limits.get(action)
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy.strip(), strict=False) for proxy in proxies if proxy.strip())
+
+
+def is_trusted_proxy(address):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in network
+               for network in _networks(tuple(getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', ()))))
+
+
+def client_ip(request):
+    """Адрес клиента; за доверенным прокси - из его заголовков"""
+    remote = request.META.get('REMOTE_ADDR', '')
+    if not is_trusted_proxy(remote):
+        return remote
+    forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+    # Левые адреса мог вписать сам клиент; правые добавили наши прокси
+    for address in reversed([address for address in forwarded if address]):
+        if not is_trusted_proxy(address):
+            return address
+    return request.META.get('HTTP_X_REAL_IP', '').strip() or remote
+
+
+def identity(request):
+    """Ключ субъекта: пользователь, а для анонимов - IP-адрес"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def _hit(cache, key, period, now):
+    window = int(now // period)
+    current_key = f'{key}:{window}'
+    # Ключ живет два периода: следующее окно еще учитывает его с весом
+    cache.add(current_key, 0, timeout=period * 2)
+    current = cache.incr(current_key)
+    previous = cache.get(f'{key}:{window - 1}', 0)
+    elapsed = now / period - window
+    return previous * (1 - elapsed) + current
+
+
+def hit(action, ident, now=None):
+    """Учесть действие; возвращает оценку числа действий за период"""
+    count, period = get_limit(action)
+    key = f'rl:{action}:{ident}'
+    now = time.time() if now is None else now
+    try:
+        return _hit(caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')], key, period, now)
+    except Exception:
+        logger.warning('Rate limit cache unavailable, falling back to local memory', exc_info=True)
+        return _hit(_fallback_cache, key, period, now)
+
+
+def is_limited(request, action):
+    """Учесть действие запроса и проверить, превышен ли лимит"""
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True) or get_limit(action) is None:
+        return False
+    if request.user.is_authenticated and request.user.is_moderator():
+        return False
+    count, period = get_limit(action)
+    return hit(action, identity(request)) > count
+
+
+def ratelimit(action, methods=('POST',), json=False):
+    """Декоратор представления: при превышении лимита ответ 429.
+
+    Учитываются только запросы с методами из ``methods``, так что просмотр
+    формы не расходует лимит. ``json=True`` для AJAX-представлений.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods and is_limited(request, action):
+                count, period = get_limit(action)
+                if json:
+                    response = JsonResponse({'error': 'Слишком много запросов, попробуйте позже'}, status=429)
+                else:
+                    context = {'count': count, 'minutes': max(1, period // 60)}
+                    response = render(request, 'forum/rate_limited.html', context, status=429)
+                response['Retry-After'] = str(period)
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
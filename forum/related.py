@@ -0,0 +1,146 @@
+"""Пакетный расчет похожих тем.
+
+Каждая тема описывается тремя разреженными векторами: теги (через таблицу
+taggit), участники (автор темы и авторы ответов) и хешированный мешок слов
+заголовка и текста. Веса - IDF, строки нормированы, так что произведение
+матриц дает косинусную близость сразу для пачки тем против всех активных тем.
+Итоговая оценка - взвешенная сумма трех близостей; для каждой темы хранятся
+``TOP_K`` лучших, и страница темы читает их одним запросом.
+
+По расписанию (``forum.tasks.build_related``) пересчитываются темы,
+обновленные после прошлого запуска; его время хранится в кеше, и без него
+(первый запуск, кеш очищен) пересчитываются все темы.
+"""
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from taggit.models import TaggedItem
+
+from .fingerprint import normalize
+from .models import Thread, Post, RelatedThread
+
+TOP_K = 5
+TEXT_FEATURES = 1 << 18
+WEIGHTS = {'tags': 0.45, 'participants': 0.25, 'text': 0.3}
+MIN_SCORE = 0.05
+LAST_RUN_CACHE_KEY = 'forum:related:last-run'
+
+
+def _normalized(matrix):
+    """TF-IDF взвешивание столбцов и L2-нормировка строк"""
+    matrix = matrix.tocsr()
+    matrix.sum_duplicates()
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + matrix.shape[0]) / (1 + df)) + 1
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def _build(rows, cols, n_rows, n_cols, binary=True):
+    data = np.ones(len(rows), dtype=np.float32)
+    matrix = sparse.coo_matrix((data, (rows, cols)), shape=(n_rows, n_cols)).tocsr()
+    if binary:
+        matrix.data[:] = 1
+    return _normalized(matrix)
+
+
+def feature_matrices(thread_ids):
+    """Матрицы тегов, участников и текста; строка i соответствует thread_ids[i]"""
+    position = {pk: i for i, pk in enumerate(thread_ids)}
+
+    content_type = ContentType.objects.get_for_model(Thread)
+    rows, cols = [], []
+    for object_id, tag_id in TaggedItem.objects.filter(content_type=content_type).values_list('object_id', 'tag_id'):
+        if object_id in position:
+            rows.append(position[object_id])
+            cols.append(tag_id)
+    tags = _build(rows, cols, len(thread_ids), max(cols, default=0) + 1)
+
+    rows, cols = [], []
+    for thread_id, author_id in Thread.objects.filter(pk__in=thread_ids).values_list('pk', 'author_id').iterator():
+        rows.append(position[thread_id])
+        cols.append(author_id)
+    posts = Post.objects.filter(is_active=True, thread__is_active=True).values_list('thread_id', 'author_id').distinct()
+    for thread_id, author_id in posts.iterator():
+        if thread_id in position:
+            rows.append(position[thread_id])
+            cols.append(author_id)
+    participants = _build(rows, cols, len(thread_ids), max(cols, default=0) + 1)
+
+    rows, cols = [], []
+    for thread_id, title, content in Thread.objects.filter(pk__in=thread_ids).values_list('pk', 'title', 'content').iterator():
+        row = position[thread_id]
+        # Слова заголовка весят вдвое больше слов текста
+        for word in normalize(title) * 2 + normalize(content):
+            rows.append(row)
+            cols.append(zlib.crc32(word.encode()) % TEXT_FEATURES)
+    text = _build(rows, cols, len(thread_ids), TEXT_FEATURES, binary=False)
+
+    return {'tags': tags, 'participants': participants, 'text': text}
+
+
+def top_related(matrices, rows, top_k=TOP_K):
+    """Для строк rows - списки (позиция, оценка) лучших соседей без самой темы"""
+    scores = sum(WEIGHTS[name] * (matrix[rows] @ matrix.T) for name, matrix in matrices.items())
+    scores = scores.tocsr()
+    result = []
+    for i, row in enumerate(rows):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        columns, values = scores.indices[start:end], scores.data[start:end]
+        keep = (columns != row) & (values >= MIN_SCORE)
+        columns, values = columns[keep], values[keep]
+        if len(values) > top_k:
+            best = np.argpartition(-values, top_k)[:top_k]
+            columns, values = columns[best], values[best]
+        order = np.argsort(-values)
+        result.append(list(zip(columns[order].tolist(), values[order].tolist())))
+    return result
+
+
+def build_related(since=None, top_k=TOP_K, batch_size=500):
+    """Пересчитать похожие темы; since ограничивает пересчет темами, активными после него.
+
+    Кандидатами всегда служат все активные темы, так что недавняя тема может
+    получить в соседи старую. Списки давно не менявшихся тем обновляются при
+    полном прогоне (since=None). Возвращает число обработанных тем.
+    """
+    thread_ids = list(Thread.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+    if not thread_ids:
+        return 0
+    matrices = feature_matrices(thread_ids)
+
+    targets = Thread.objects.filter(is_active=True)
+    if since is not None:
+        targets = targets.filter(updated_at__gte=since)
+    position = {pk: i for i, pk in enumerate(thread_ids)}
+    target_rows = [position[pk] for pk in targets.order_by('pk').values_list('pk', flat=True)]
+
+    for offset in range(0, len(target_rows), batch_size):
+        rows = target_rows[offset:offset + batch_size]
+        links = []
+        for row, neighbours in zip(rows, top_related(matrices, rows, top_k)):
+            links.extend(
+                RelatedThread(thread_id=thread_ids[row], related_id=thread_ids[column], score=score, rank=rank)
+                for rank, (column, score) in enumerate(neighbours)
+            )
+        with transaction.atomic():
+            RelatedThread.objects.filter(thread_id__in=[thread_ids[row] for row in rows]).delete()
+            RelatedThread.objects.bulk_create(links)
+    return len(target_rows)
+
+
+def build_related_since_last_run(top_k=TOP_K, batch_size=500):
+    """Пересчитать темы, обновленные после прошлого такого запуска; возвращает число тем"""
+    # Время берется до пересчета: тема, измененная во время прогона, попадет в следующий
+    started = timezone.now()
+    total = build_related(since=cache.get(LAST_RUN_CACHE_KEY), top_k=top_k, batch_size=batch_size)
+    cache.set(LAST_RUN_CACHE_KEY, started, timeout=None)
+    return total
@@ -0,0 +1,246 @@
+"""Рендер Markdown сообщений в безопасный HTML.
+
+``markdownx.utils.markdownify`` на каждый вызов создает экземпляр
+``Markdown`` и заново загружает расширения - это большая часть времени
+рендера короткого сообщения. Здесь экземпляр создается один раз на поток и
+между сообщениями только сбрасывается (``reset()``), поэтому страница темы
+рендерит все свои сообщения одним вызовом ``render_many``.
+
+Markdown пропускает сырой HTML как есть, а шаблоны выводят результат через
+``|safe``, поэтому выход проходит через ``sanitize``: разрешенные теги и
+атрибуты пересобираются заново, из классов остаются только те, что выводят
+расширения Markdown, ссылки допускаются только на http(s), mailto
+и относительные адреса, содержимое ``<script>``/``<style>`` выбрасывается,
+остальное экранируется.
+
+Массовый перерендер (``archive_threads --rerender``) может идти в пуле процессов:
+``render_many(texts, processes=N)`` раздает сообщения пачками, у каждого
+процесса свой экземпляр Markdown.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from html.parser import HTMLParser
+from time import perf_counter
+from urllib.parse import urlsplit
+
+try:
+    from pygments.token import STANDARD_TYPES
+except ImportError:
+    STANDARD_TYPES = {}
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'li', 'ol', 'p', 'pre',
+    's', 'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+# Теги, которые выбрасываются вместе с содержимым
+DROP_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'textarea', 'select', 'svg', 'math'}
+ALLOWED_ATTRS = {
+    '*': {'title'},
+    'a': {'href'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'ol': {'start'},
+    'td': {'align', 'style'},
+    'th': {'align', 'style'},
+}
+URL_ATTRS = {'href', 'src'}
+URL_SCHEMES = {'', 'http', 'https', 'mailto'}
+# Только выравнивание ячеек из расширения tables
+ALLOWED_STYLES = {'text-align: left;', 'text-align: right;', 'text-align: center;'}
+# id нужны сноскам (fn:1, fnref:1); произвольные id могли бы перекрыть элементы страницы
+FOOTNOTE_ID_PREFIXES = ('fn:', 'fnref:')
+# Классы, которые выводят расширения fenced_code, codehilite и footnotes; произвольный
+# класс позволил бы применить к сообщению стили сайта (fixed-top, modal, w-100)
+ALLOWED_CLASSES = {
+    'a': {'footnote-ref', 'footnote-backref'},
+    'div': {'codehilite', 'footnote'},
+    'pre': {'codehilite'},
+    # Токены подсветки pygments (n, kd, s2, ...)
+    'span': set(STANDARD_TYPES.values()) - {''},
+}
+CLASS_PREFIXES = {'code': ('language-',), 'pre': ('language-',)}
+LINK_REL = 'nofollow ugc noopener'
+CHUNK_SIZE = 50
+
+_local = threading.local()
+_markdown_config = None
+
+
+def safe_url(value):
+    # Браузер игнорирует пробелы и управляющие символы внутри схемы ("java\tscript:")
+    cleaned = ''.join(char for char in value if char > ' ' and char != '\x7f')
+    try:
+        scheme = urlsplit(cleaned).scheme
+    except ValueError:
+        return False
+    return scheme.lower() in URL_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """Пересборка HTML по белому списку тегов и атрибутов"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+
+    @staticmethod
+    def allowed_class(tag, name):
+        return name in ALLOWED_CLASSES.get(tag, ()) or name.startswith(CLASS_PREFIXES.get(tag, ()))
+
+    def clean_attrs(self, tag, attrs):
+        allowed = ALLOWED_ATTRS['*'] | ALLOWED_ATTRS.get(tag, set())
+        result = []
+        for name, value in attrs:
+            value = value or ''
+            if name == 'id':
+                if not value.startswith(FOOTNOTE_ID_PREFIXES):
+                    continue
+            elif name == 'class':
+                value = ' '.join(cls for cls in value.split() if self.allowed_class(tag, cls))
+                if not value:
+                    continue
+            elif name not in allowed:
+                continue
+            elif name in URL_ATTRS and not safe_url(value):
+                continue
+            elif name == 'style' and value.strip() not in ALLOWED_STYLES:
+                continue
+            result.append(f' {name}="{escape(value)}"')
+        if tag == 'a':
+            result.append(f' rel="{LINK_REL}"')
+        return ''.join(result)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        self.out.append(f'<{tag}{self.clean_attrs(tag, attrs)}>')
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROP_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag in self.open and tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        # Незакрытые вложенные теги закрываются вместе с внешним
+        while self.open:
+            current = self.open.pop()
+            self.out.append(f'</{current}>')
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def result(self):
+        self.close()
+        self.out.extend(f'</{tag}>' for tag in reversed(self.open))
+        self.open = []
+        return ''.join(self.out)
+
+
+def sanitize(html):
+    """HTML, в котором остались только разрешенные теги, атрибуты и адреса"""
+    sanitizer = Sanitizer()
+    sanitizer.feed(html)
+    return sanitizer.result()
+
+
+def markdown_config():
+    """(расширения, их настройки) - те же, что у редактора markdownx"""
+    if _markdown_config is not None:
+        return _markdown_config
+    from markdownx.settings import MARKDOWNX_MARKDOWN_EXTENSIONS, MARKDOWNX_MARKDOWN_EXTENSION_CONFIGS
+    return list(MARKDOWNX_MARKDOWN_EXTENSIONS), dict(MARKDOWNX_MARKDOWN_EXTENSION_CONFIGS)
+
+
+def get_markdown():
+    """Экземпляр Markdown текущего потока"""
+    md = getattr(_local, 'markdown', None)
+    if md is None:
+        import markdown
+        extensions, extension_configs = markdown_config()
+        md = _local.markdown = markdown.Markdown(extensions=extensions, extension_configs=extension_configs)
+    return md
+
+
+def render(text):
+    """Markdown -> безопасный HTML"""
+    md = get_markdown()
+    try:
+        html = md.convert(text or '')
+    finally:
+        md.reset()
+    return sanitize(html)
+
+
+def _init_worker(config):
+    global _markdown_config
+    _markdown_config = config
+
+
+def _render_chunk(texts):
+    return [render(text) for text in texts]
+
+
+def render_many(texts, processes=None, chunk_size=CHUNK_SIZE):
+    """HTML для каждого текста, в том же порядке.
+
+    По умолчанию рендер идет в текущем потоке; processes > 1 - в пуле
+    процессов пачками по chunk_size (для массового перерендера, не для
+    запросов).
+    """
+    texts = list(texts)
+    if not processes or processes <= 1 or len(texts) <= chunk_size:
+        return [render(text) for text in texts]
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(markdown_config(),)) as executor:
+        return [html for chunk in executor.map(_render_chunk, chunks) for html in chunk]
+
+
+def _throughput(function, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        function(texts)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(texts) / best if best else 0.0
+
+
+def benchmark(texts, repeat=3, processes=None):
+    """{вариант: сообщений в секунду} (лучший из repeat прогонов) на одних и тех же текстах"""
+    from markdownx.utils import markdownify
+    texts = list(texts)
+    processes = processes or os.cpu_count() or 1
+    md = get_markdown()
+    # Вывод Markdown без санитайзера: отдельно меряется цена sanitize
+    html = [md.reset().convert(text) for text in texts]
+    md.reset()
+    return {
+        'markdownify': _throughput(lambda items: [markdownify(text) for text in items], texts, repeat),
+        'sanitize': _throughput(lambda items: [sanitize(item) for item in items], html, repeat),
+        'render': _throughput(lambda items: [render(text) for text in items], texts, repeat),
+        'render_many': _throughput(render_many, texts, repeat),
+        f'render_many({processes} proc)': _throughput(
+            lambda items: render_many(items, processes=processes), texts, repeat),
+    }
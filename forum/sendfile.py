@@ -0,0 +1,166 @@
+"""Отдача файлов из MEDIA_ROOT после проверки прав.
+
+Представление решает, можно ли отдать файл, а сами байты передает веб-сервер:
+бэкенд ``nginx`` возвращает пустой ответ с ``X-Accel-Redirect`` на internal
+location (``SENDFILE_URL``), ``xsendfile`` - заголовок ``X-Sendfile`` с
+абсолютным путем (Apache mod_xsendfile, lighttpd). Бэкенд ``simple`` для
+разработки и серверов без такой возможности отдает ``FileResponse``: целый
+файл уходит через ``wsgi.file_wrapper`` (gunicorn использует sendfile(2)),
+диапазон - через обертку, ограничивающую длину.
+
+Бэкенд выбирается настройкой ``SENDFILE_BACKEND``: имя из ``BACKENDS`` или
+путь к функции ``(request, name, response) -> response``. ETag и
+``If-None-Match`` обрабатываются здесь для всех бэкендов, Range - в ``simple``
+(nginx и Apache обрабатывают Range сами).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header
+from django.utils.module_loading import import_string
+
+# Безопасно показывать в браузере; остальное (включая SVG и HTML) только скачивается
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf', 'text/plain'}
+BLOCK_SIZE = 64 * 1024
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Файл, из которого читается не больше length байт начиная с offset.
+
+    ``fileno``/``tell`` позволяют gunicorn отдать диапазон через sendfile(2):
+    он начинает с текущей позиции и не выходит за Content-Length.
+    """
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.remaining = length
+        f.seek(offset)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def seekable(self):
+        return False
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+def parse_range(header, size):
+    """(начало, длина) для одного диапазона из заголовка Range.
+
+    None - заголовка нет или он не поддерживается (отдается весь файл),
+    ValueError - диапазон вне файла (416).
+    """
+    match = _range_re.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+    return start, end - start + 1
+
+
+def serve_simple(request, name, response):
+    size = int(response['Content-Length'])
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        error = HttpResponse(status=416)
+        error['Content-Range'] = f'bytes */{size}'
+        return error
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range != response.get('ETag'):
+        byte_range = None
+
+    f = default_storage.open(name, 'rb')
+    if byte_range is None:
+        result = FileResponse(f, status=200)
+    else:
+        start, length = byte_range
+        result = FileResponse(RangeFile(f, start, length), status=206)
+        result['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+        response['Content-Length'] = str(length)
+    result.block_size = BLOCK_SIZE
+    for header, value in response.items():
+        result[header] = value
+    result['Accept-Ranges'] = 'bytes'
+    return result
+
+
+def serve_nginx(request, name, response):
+    # nginx подставит файл из internal location, Content-Length и Range - его забота
+    del response['Content-Length']
+    response['X-Accel-Redirect'] = quote(settings.SENDFILE_URL.rstrip('/') + '/' + name)
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def serve_xsendfile(request, name, response):
+    del response['Content-Length']
+    response['X-Sendfile'] = default_storage.path(name)
+    return response
+
+
+BACKENDS = {
+    'simple': serve_simple,
+    'nginx': serve_nginx,
+    'xsendfile': serve_xsendfile,
+}
+
+
+def get_backend():
+    backend = getattr(settings, 'SENDFILE_BACKEND', 'simple')
+    return BACKENDS.get(backend) or import_string(backend)
+
+
+def sendfile(request, name, filename, size, etag, content_type=None):
+    """Ответ с файлом name из хранилища; filename - имя для Content-Disposition"""
+    etag = f'"{etag}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    response['Content-Length'] = str(size)
+    response['Content-Disposition'] = content_disposition_header(content_type not in INLINE_TYPES, filename)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=3600'
+    response['X-Content-Type-Options'] = 'nosniff'
+    return get_backend()(request, name, response)
+
+
+def file_etag(name):
+    """ETag файла без хеша содержимого: размер и время изменения"""
+    stat = os.stat(default_storage.path(name))
+    return f'{stat.st_size:x}-{int(stat.st_mtime):x}'
@@ -0,0 +1,127 @@
+"""Очистка производных данных при удалении и скрытии тем и сообщений.
+
+``post_delete`` срабатывает и при каскадном удалении (тема вместе с
+сообщениями, категория, пользователь), поэтому производные таблицы без
+внешних ключей и денормализованные счетчики (в том числе ``Blob.ref_count``)
+чистятся здесь, а не в ``Model.delete()``.
+
+Одиночное удаление пересчитывает сразу. Массовые операции (архивация,
+удаление из админки списком) оборачиваются в ``batched()``: затронутые id
+копятся и каждый пересчет выполняется один раз на выходе.
+
+Агрегаты профиля (``UserStat``) снимаются, только если удаляли сами темы или
+сообщения (``origin``): при удалении категории или пользователя их строки
+удаляются каскадом, а архив входит в счетчики категорий и пропускает этот
+пересчет (``batched(ignore=...)``).
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import ArchivedPost, Attachment, Blob, LSHBucket, Post, Thread, UserStat
+
+_local = threading.local()
+
+
+def _delete_buckets(kind, ids):
+    LSHBucket.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+def _refresh_tags(tag_ids):
+    from .tags import refresh_tag_stats
+    refresh_tag_stats(tag_ids)
+
+
+HANDLERS = {
+    'thread_buckets': lambda ids: _delete_buckets('thread', ids),
+    'post_buckets': lambda ids: _delete_buckets('post', ids),
+    'tags': _refresh_tags,
+    # Повторы значимы: одно упоминание - одна ссылка
+    'blob_refs': lambda ids: Blob.change_refs(ids, -1),
+    # (автор, категория, kind, pk) удаленных тем и сообщений
+    'activity': UserStat.forget,
+    # Число ответов и последний ответ тем, из которых удалены сообщения
+    'thread_stats': lambda ids: Thread.refresh_post_stats(set(ids)),
+}
+
+
+def _ignored(name):
+    return name in getattr(_local, 'ignore', ())
+
+
+def schedule(name, values):
+    """Выполнить пересчет name для values сейчас или, внутри batched(), на выходе из него"""
+    if _ignored(name):
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        values = list(values)
+        if values:
+            HANDLERS[name](values)
+    else:
+        pending[name].extend(values)
+
+
+@contextmanager
+def batched(ignore=()):
+    """Копить пересчеты до конца блока (кроме ignore); при исключении они не выполняются"""
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = pending = defaultdict(list)
+    _local.ignore = frozenset(ignore)
+    try:
+        yield
+    finally:
+        _local.pending = None
+        _local.ignore = ()
+    for name, values in pending.items():
+        if values:
+            HANDLERS[name](values)
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+@receiver(pre_delete, sender=Thread)
+def thread_deleting(sender, instance, origin=None, **kwargs):
+    # Привязки тегов и сообщения удаляются каскадом раньше, чем придет post_delete темы
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    if _origin_model(origin) is Thread and not _ignored('activity'):
+        instance._deleted_posts = list(instance.posts.values_list('author_id', 'pk'))
+
+
+@receiver(post_delete, sender=Thread)
+def thread_deleted(sender, instance, **kwargs):
+    schedule('thread_buckets', [instance.pk])
+    schedule('tags', getattr(instance, '_deleted_tag_ids', ()))
+    if hasattr(instance, '_deleted_posts'):
+        schedule('activity', [(instance.author_id, instance.category_id, 'thread', instance.pk)] + [
+            (author_id, instance.category_id, 'post', pk) for author_id, pk in instance._deleted_posts
+        ])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, origin=None, **kwargs):
+    schedule('post_buckets', [instance.pk])
+    if _origin_model(origin) is not Thread:
+        schedule('thread_stats', [instance.thread_id])
+    # При удалении темы ее сообщения учтены в thread_deleted
+    if _origin_model(origin) is Post:
+        schedule('activity', [(instance.author_id, instance.thread.category_id, 'post', instance.pk)])
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    if instance.blob_id:
+        schedule('blob_refs', [instance.blob_id])
+
+
+@receiver(post_delete, sender=ArchivedPost)
+def archived_post_deleted(sender, instance, **kwargs):
+    schedule('blob_refs', instance.blob_ids)
@@ -0,0 +1,64 @@
+"""Поиск похожих тем и сообщений через LSH-индекс MinHash-сигнатур"""
+from . import minhash
+from .models import Thread, Post, LSHBucket
+
+SIMILARITY_THRESHOLD = 0.5
+
+
+def find_similar(queryset, kind, packed, exclude_pk=None, threshold=SIMILARITY_THRESHOLD, limit=10):
+    """Объекты queryset, похожие на сигнатуру: список (объект, оценка сходства).
+
+    Кандидаты берутся из бакетов по индексу, а оценка считается по сохраненным
+    сигнатурам только для них, поэтому стоимость не зависит от размера форума.
+    """
+    sig = minhash.unpack(packed)
+    candidates = queryset.filter(pk__in=LSHBucket.candidates(kind, packed, limit=limit * 5, among=queryset))
+    if exclude_pk is not None:
+        candidates = candidates.exclude(pk=exclude_pk)
+    scored = []
+    for obj in candidates:
+        if obj.minhash is None:
+            continue
+        score = minhash.similarity(sig, minhash.unpack(obj.minhash))
+        if score >= threshold:
+            scored.append((obj, score))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:limit]
+
+
+def similar_posts(post, limit=20):
+    """Похожие сообщения по всему форуму, включая скрытые"""
+    if post.minhash is None:
+        return []
+    queryset = Post.objects.select_related('author', 'thread')
+    return find_similar(queryset, 'post', post.minhash, exclude_pk=post.pk, limit=limit)
+
+
+def similar_threads(title, content, exclude_pk=None, limit=5):
+    """Активные темы, похожие на черновик новой темы"""
+    packed = minhash.pack(minhash.signature(Thread(title=title, content=content).minhash_text()))
+    queryset = Thread.objects.filter(is_active=True).select_related('category')
+    return find_similar(queryset, 'thread', packed, exclude_pk=exclude_pk, limit=limit)
+
+
+def rebuild_index(kind, queryset, batch_size=1000):
+    """Пересчитать сигнатуры и бакеты объектов; возвращает их число"""
+    model = queryset.model
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return total
+        for obj in batch:
+            obj.minhash = minhash.pack(minhash.signature(obj.minhash_text()))
+        model.objects.bulk_update(batch, ['minhash'])
+        ids = [obj.pk for obj in batch]
+        LSHBucket.objects.filter(kind=kind, object_id__in=ids).delete()
+        LSHBucket.objects.bulk_create([
+            LSHBucket(kind=kind, object_id=obj.pk, band=band, bucket=bucket)
+            for obj in batch
+            for band, bucket in minhash.band_buckets(minhash.unpack(obj.minhash))
+        ])
+        total += len(batch)
+        last_pk = batch[-1].pk
@@ -0,0 +1,100 @@
+"""Время холодного старта воркера и его разбивка по импортам.
+
+Старт измеряется в отдельном процессе: загрузка WSGI-приложения
+(``django.setup()``) и URLconf - то, что делает каждый воркер gunicorn до
+первого ответа. Разбивка берется из ``python -X importtime`` и суммируется по
+пакетам верхнего уровня. Сборка мусора во время разбивки выключена: иначе
+полная сборка достается модулю, который импортировался в этот момент (так
+taggit выглядел на 14 мс дороже, чем есть). Время сборок выводится отдельно.
+
+Тяжелые и редко нужные модули (Celery, Pillow, markdown) импортируются
+отложенно. При ``preload_app`` gunicorn загружает приложение в мастере, и
+``warm_up()`` заранее импортирует и их, чтобы форкнутые воркеры получили готовый
+код copy-on-write, а не платили за импорт на первом запросе.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+# Импортируются отложенно, но воркеру понадобятся
+WARM_MODULES = (
+    'forumsite.celery',
+    'notifications.tasks',
+    'markdownx.utils',
+    'markdownx.views',
+    'PIL.Image',
+)
+
+BOOT_SNIPPET = """
+import gc, json, os, time
+gc_time = [0.0, 0.0]
+def gc_timer(phase, info):
+    if phase == 'start':
+        gc_time[1] = time.perf_counter()
+    else:
+        gc_time[0] += time.perf_counter() - gc_time[1]
+gc.callbacks.append(gc_timer)
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forumsite.settings')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'boot_ms': (time.perf_counter() - start) * 1000, 'gc_ms': gc_time[0] * 1000}))
+"""
+
+
+def warm_up():
+    """Импортировать отложенные модули и URLconf (в мастере gunicorn перед fork)"""
+    from importlib import import_module
+    from django.urls import get_resolver
+    for name in WARM_MODULES:
+        import_module(name)
+    get_resolver().url_patterns
+
+
+def _run(*options, snippet=BOOT_SNIPPET):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'forumsite.settings'))
+    result = subprocess.run([sys.executable, *options, '-c', snippet], cwd=settings.BASE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(text):
+    """[(модуль, собственное время мкс, суммарное мкс)] из вывода -X importtime"""
+    modules = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def profile_startup(repeat=5):
+    """Медиана старта по repeat холодным процессам и разбивка по пакетам.
+
+    Время -X importtime завышено накладными расходами самого профилирования,
+    поэтому старт измеряется отдельными прогонами без него.
+    """
+    runs = [_run()[0] for _ in range(repeat)]
+    _, trace = _run('-X', 'importtime', snippet='import gc; gc.disable()\n' + BOOT_SNIPPET)
+    modules = parse_importtime(trace)
+    packages = defaultdict(int)
+    for name, own, cumulative in modules:
+        packages[name.split('.')[0]] += own
+    return {
+        'boot_ms': statistics.median(run['boot_ms'] for run in runs),
+        'min_ms': min(run['boot_ms'] for run in runs),
+        'gc_ms': statistics.median(run['gc_ms'] for run in runs),
+        'runs': len(runs),
+        'modules': len(modules),
+        'packages': sorted(((name, us / 1000) for name, us in packages.items()), key=lambda item: -item[1]),
+        'slowest': sorted(((name, own / 1000, cumulative / 1000) for name, own, cumulative in modules),
+                          key=lambda item: -item[1]),
+    }
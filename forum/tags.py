@@ -0,0 +1,94 @@
+"""Страницы тегов и облако тегов поверх денормализованных счетчиков.
+
+Число активных тем на тег хранится в ``TagStat`` и пересчитывается только для
+тегов, которые изменились при сохранении ``ThreadForm``, поэтому ни список
+тегов, ни облако не считают ``COUNT`` по ``taggit_taggeditem`` на запрос.
+"""
+import math
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from taggit.models import Tag, TaggedItem
+
+from .models import Thread, TagStat
+
+CLOUD_SIZE = 50
+CLOUD_CACHE_KEY = 'forum:tag_cloud'
+CLOUD_TIMEOUT = 60 * 60
+CLOUD_LEVELS = 5
+TAG_PAGE_SIZE = 20
+
+
+def refresh_tag_stats(tag_ids):
+    """Пересчитать счетчики указанных тегов одним UPDATE и обновить облако"""
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+    existing = set(TagStat.objects.filter(tag_id__in=tag_ids).values_list('tag_id', flat=True))
+    TagStat.objects.bulk_create([TagStat(tag_id=pk) for pk in tag_ids - existing], ignore_conflicts=True)
+    counts = (TaggedItem.objects.filter(tag=OuterRef('tag_id'), content_type=ContentType.objects.get_for_model(Thread),
+                                        object_id__in=Thread.objects.filter(is_active=True).values('pk'))
+              .order_by().values('tag').annotate(n=Count('pk')).values('n'))
+    TagStat.objects.filter(tag_id__in=tag_ids).update(thread_count=Coalesce(Subquery(counts), Value(0)))
+    refresh_tag_cloud()
+
+
+def rebuild_tag_stats():
+    """Полный пересчет счетчиков всех тегов; возвращает число тегов"""
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+    TagStat.objects.exclude(tag_id__in=tag_ids).delete()
+    refresh_tag_stats(tag_ids)
+    return len(tag_ids)
+
+
+def refresh_tag_cloud():
+    """Перестроить облако из TagStat (читает только CLOUD_SIZE строк по индексу)"""
+    stats = list(TagStat.objects.filter(thread_count__gt=0).select_related('tag')
+                 .order_by('-thread_count', 'tag_id')[:CLOUD_SIZE])
+    cloud = []
+    if stats:
+        low, high = math.log(stats[-1].thread_count), math.log(stats[0].thread_count)
+        for stat in sorted(stats, key=lambda s: s.tag.name):
+            level = 1 if high == low else 1 + round((math.log(stat.thread_count) - low) / (high - low) * (CLOUD_LEVELS - 1))
+            cloud.append({'name': stat.tag.name, 'slug': stat.tag.slug, 'count': stat.thread_count, 'level': level})
+    cache.set(CLOUD_CACHE_KEY, cloud, timeout=CLOUD_TIMEOUT)
+    return cloud
+
+
+def tag_cloud():
+    cloud = cache.get(CLOUD_CACHE_KEY)
+    if cloud is None:
+        cloud = refresh_tag_cloud()
+    return cloud
+
+
+def tag_threads(tag, after=None, limit=TAG_PAGE_SIZE):
+    """Темы с тегом, новые сверху, keyset-пагинация по (updated_at, id).
+
+    Возвращает (темы, курсор следующей страницы или None).
+    """
+    threads = (Thread.objects.filter(is_active=True, tags=tag)
+               .select_related('author', 'category').order_by('-updated_at', '-pk'))
+    if after is not None:
+        updated_at, pk = after
+        threads = threads.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, pk__lt=pk))
+    threads = list(threads[:limit + 1])
+    cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        cursor = f'{threads[-1].updated_at.isoformat()}|{threads[-1].pk}'
+    return threads, cursor
+
+
+def decode_cursor(value):
+    """Разбор курсора; некорректный курсор означает первую страницу"""
+    if not value:
+        return None
+    updated_at, _, pk = value.rpartition('|')
+    try:
+        return datetime.fromisoformat(updated_at), int(pk)
+    except ValueError:
+        return None
@@ -0,0 +1,34 @@
+"""Периодические задачи форума (расписание - CELERY_BEAT_SCHEDULE в settings).
+
+Те же операции доступны командами manage.py: recompute_trending,
+archive_threads, gc_uploads, rebuild_user_stats, build_related_threads
+--since-last-run.
+"""
+from forumsite.celery import app
+
+from . import activity, archive, related, trending, uploads
+
+
+@app.task(ignore_result=True)
+def recompute_trending():
+    return trending.recompute_all()
+
+
+@app.task(ignore_result=True)
+def archive_threads():
+    return archive.run_in_batches(archive.archive_threads, archive.archive_candidates())
+
+
+@app.task(ignore_result=True)
+def collect_upload_garbage():
+    return uploads.collect_garbage()
+
+
+@app.task(ignore_result=True)
+def rebuild_user_stats():
+    return activity.rebuild_user_stats()
+
+
+@app.task(ignore_result=True)
+def build_related():
+    return related.build_related_since_last_run()
@@ -0,0 +1,147 @@
+"""Профиль рендера шаблонов: время и SQL-запросы по шаблонам, блокам и переменным.
+
+На время ``profile_templates()`` подменяются ``Template.render`` (каждый
+шаблон, включая ``{% include %}``), ``BlockNode.render`` и
+``Variable._resolve_lookup`` (каждое обращение вроде ``category.post_count``).
+Вложенные вызовы образуют стек: у записи есть полное время и собственное
+время без вложенных, а каждый SQL-запрос засчитывается самой глубокой
+открытой записи. Так ``{{ thread.author.username }}`` в цикле, делающее запрос
+на каждой строке, сразу видно как переменная с N вызовами и N запросами.
+
+Подмена глобальная, поэтому профилировать нужно в одном потоке: командой
+``profile_templates`` или в тестах.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from django.db import connection
+from django.template.base import Template, Variable
+from django.template.loader_tags import BLOCK_CONTEXT_KEY, BlockNode
+from django.test.utils import override_settings
+
+from .benchmark import build_scenarios, make_client
+
+
+@dataclass
+class Entry:
+    """Статистика одного шаблона, блока или переменной"""
+    kind: str
+    name: str
+    template: str
+    calls: int = 0
+    total: float = 0.0
+    own: float = 0.0
+    queries: int = 0
+    own_queries: int = 0
+    sql: list = field(default_factory=list)
+
+
+def _template_name(template):
+    origin = getattr(template, 'origin', None)
+    return getattr(origin, 'template_name', None) or getattr(template, 'name', None) or '<string>'
+
+
+class TemplateProfiler:
+    MAX_SQL = 3
+
+    def __init__(self):
+        self.entries = {}
+        self.stack = []
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if self.stack:
+            entry = self.stack[-1][0]
+            entry.own_queries += 1
+            if len(entry.sql) < self.MAX_SQL and sql not in entry.sql:
+                entry.sql.append(sql)
+        return execute(sql, params, many, context)
+
+    def current_template(self):
+        """Шаблон, в котором записана рендерящаяся сейчас переменная"""
+        for entry, _ in reversed(self.stack):
+            if entry.kind != 'variable':
+                return entry.template
+        return '<string>'
+
+    @contextmanager
+    def frame(self, kind, name, template):
+        key = (kind, template, name)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = Entry(kind=kind, name=name, template=template)
+        # [запись, время вложенных]
+        current = [entry, 0.0]
+        self.stack.append(current)
+        start = perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1][1] += elapsed
+            entry.calls += 1
+            entry.total += elapsed
+            entry.own += elapsed - current[1]
+            entry.queries += self.queries - queries
+
+    def report(self, min_ms=0.0):
+        """Записи по убыванию собственного времени; переменные без запросов быстрее min_ms опускаются"""
+        rows = [entry for entry in self.entries.values()
+                if entry.kind != 'variable' or entry.own_queries or entry.own * 1000 >= min_ms]
+        return sorted(rows, key=lambda entry: -entry.own)
+
+
+@contextmanager
+def profile_templates():
+    """Профилировать весь рендер шаблонов внутри блока with"""
+    profiler = TemplateProfiler()
+    template_render = Template.render
+    block_render = BlockNode.render
+    resolve_lookup = Variable._resolve_lookup
+
+    def profiled_template_render(self, context):
+        with profiler.frame('template', _template_name(self), _template_name(self)):
+            return template_render(self, context)
+
+    def profiled_block_render(self, context):
+        # Блок базового шаблона рендерит переопределение из дочернего: записать на него
+        block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+        block = (block_context.get_block(self.name) if block_context is not None else None) or self
+        with profiler.frame('block', self.name, _template_name(block)):
+            return block_render(self, context)
+
+    def profiled_resolve_lookup(self, context):
+        with profiler.frame('variable', self.var, profiler.current_template()):
+            return resolve_lookup(self, context)
+
+    Template.render = profiled_template_render
+    BlockNode.render = profiled_block_render
+    Variable._resolve_lookup = profiled_resolve_lookup
+    try:
+        with connection.execute_wrapper(profiler):
+            yield profiler
+    finally:
+        Template.render = template_render
+        BlockNode.render = block_render
+        Variable._resolve_lookup = resolve_lookup
+
+
+def profile_scenarios(scenarios=None):
+    """{сценарий: профиль} для одного прогона каждого сценария бенчмарка"""
+    if scenarios is None:
+        scenarios = build_scenarios()
+    profiles = {}
+    with override_settings(RATE_LIMIT_ENABLED=False):
+        for scenario in scenarios:
+            client = make_client()
+            if scenario.user is not None:
+                client.force_login(scenario.user)
+            with profile_templates() as profiler:
+                getattr(client, scenario.method)(scenario.url, scenario.data, secure=True)
+            profiles[scenario.name] = profiler
+    return profiles
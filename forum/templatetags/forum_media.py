@@ -0,0 +1,14 @@
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail(file, size):
+    """URL уменьшенной копии: {{ user.avatar|thumbnail:"64x64" }}"""
+    name = getattr(file, 'name', file)
+    if not name:
+        return ''
+    width, height = size.split('x')
+    return reverse('forum:thumbnail', kwargs={'width': int(width), 'height': int(height), 'path': name})
@@ -1,7 +1,44 @@
-from django.test import TestCase, Client
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.template import Context as TemplateContext, Template
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import Category, Thread, Post, Like
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, Sum
+from django.utils import timezone
+from PIL import Image
+from .models import (Category, Thread, Post, Like, Report, LSHBucket, TagStat, ArchivedThread, Attachment, Blob,
+                     UploadSession, UserStat, UserCategoryStat)
+from .benchmark import run_benchmark, percentile
+from .loadtest import Fixtures, InProcessDriver, run_load
+from . import activity, archive, export, fingerprint, minhash, ratelimit, rendering, startup, thumbnails, trending, uploads
+from .signals import batched
+from .similar import similar_posts, similar_threads
+from .related import build_related
+from .indexadvisor import analyze
+from .templateprofile import profile_templates
+from .forms import ThreadForm
+from . import tags as tag_pages
+from notifications.models import ThreadSubscription
 
 User = get_user_model()
 
@@ -194,3 +231,1142 @@ class LikeSystemTest(TestCase):
         Like.objects.create(post=self.post, user=self.user, like_type=1)
         with self.assertRaises(Exception):
             Like.objects.create(post=self.post, user=self.user, like_type=1)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                   FORUM_RATE_LIMITS={'like': (3, 60), 'post': (2, 60)})
+class FloodControlTest(TestCase):
+    """Тесты ограничения частоты и отсева дубликатов"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.thread = Thread.objects.create(
+            title='Test Thread',
+            category=self.category,
+            author=self.user,
+            content='Test content'
+        )
+        self.post = Post.objects.create(thread=self.thread, author=self.user, content='Test post')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_sliding_window(self):
+        """Тест: предыдущее окно учитывается с весом оставшейся доли"""
+        for _ in range(4):
+            ratelimit.hit('like', 'user:1', now=60 * 100 + 30)
+        # Середина следующего окна: 4 * 0.5 + 1
+        self.assertEqual(ratelimit.hit('like', 'user:1', now=60 * 101 + 30), 3)
+        # Через два окна счетчик пуст
+        self.assertEqual(ratelimit.hit('like', 'user:1', now=60 * 103), 1)
+    
+    def test_settings_override_single_actions(self):
+        """Тест: настройка переопределяет только перечисленные действия"""
+        self.assertEqual(ratelimit.get_limit('like'), (3, 60))
+        self.assertEqual(ratelimit.get_limit('report'), ratelimit.DEFAULT_RATE_LIMITS['report'])
+    
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip_behind_trusted_proxy(self):
+        """Тест: адрес клиента берется из заголовков только от доверенного прокси"""
+        from django.test import RequestFactory
+        factory = RequestFactory()
+        proxied = factory.get('/', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7, 10.0.0.3')
+        self.assertEqual(ratelimit.client_ip(proxied), '203.0.113.7')
+        self.assertEqual(ratelimit.client_ip(factory.get('/', REMOTE_ADDR='10.0.0.2', HTTP_X_REAL_IP='203.0.113.8')),
+                         '203.0.113.8')
+        direct = factory.get('/', REMOTE_ADDR='198.51.100.1', HTTP_X_FORWARDED_FOR='203.0.113.7',
+                             HTTP_X_REAL_IP='203.0.113.8')
+        self.assertEqual(ratelimit.client_ip(direct), '198.51.100.1')
+    
+    def test_like_limit_returns_429(self):
+        """Тест: лишний лайк получает JSON-ответ 429"""
+        url = reverse('forum:post_like', kwargs={'pk': self.post.pk})
+        statuses = [self.client.post(url, {'type': 1}).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+    
+    def test_moderator_is_exempt(self):
+        """Тест: модераторы не ограничиваются"""
+        self.user.role = 'moderator'
+        self.user.save()
+        url = reverse('forum:post_like', kwargs={'pk': self.post.pk})
+        statuses = {self.client.post(url, {'type': 1}).status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+    
+    def test_duplicate_post_rejected(self):
+        """Тест: почти одинаковое сообщение не публикуется повторно"""
+        url = reverse('forum:thread_detail', kwargs={'slug': self.thread.slug})
+        text = 'Купите наши замечательные окна со скидкой прямо сейчас по телефону'
+        self.client.post(url, {'content': text})
+        self.client.post(url, {'content': text.upper() + '!!!'})
+        self.assertEqual(Post.objects.filter(thread=self.thread).count(), 2)
+    
+    def test_fingerprint_similarity(self):
+        """Тест: мелкая правка сохраняет сходство, другой текст - нет"""
+        text = ' '.join(f'слово{i}' for i in range(60))
+        edited = text.replace('слово30', 'другое')
+        self.assertGreater(fingerprint.similarity(fingerprint.fingerprint(text), fingerprint.fingerprint(edited)), 0.8)
+        other = ' '.join(f'иное{i}' for i in range(60))
+        self.assertEqual(fingerprint.similarity(fingerprint.fingerprint(text), fingerprint.fingerprint(other)), 0)
+
+
+class SimilarContentTest(TestCase):
+    """Тесты MinHash-индекса похожих тем и сообщений"""
+    
+    SPAM = ('Лучшие окна в городе по самой низкой цене звоните прямо сейчас '
+            'и получите бесплатный замер и установку уже завтра утром без предоплаты')
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.thread = Thread.objects.create(
+            title='Как выбрать окна',
+            category=self.category,
+            author=self.user,
+            content=self.SPAM
+        )
+    
+    def test_signature_is_stored_compactly(self):
+        """Тест: сигнатура хранится упакованной и индексируется по полосам"""
+        self.thread.refresh_from_db()
+        self.assertEqual(len(self.thread.minhash), minhash.SIGNATURE_BYTES)
+        self.assertEqual(LSHBucket.objects.filter(kind='thread', object_id=self.thread.pk).count(), minhash.BANDS)
+    
+    def test_similar_posts(self):
+        """Тест: слегка измененный повтор находится, другой текст - нет"""
+        original = Post.objects.create(thread=self.thread, author=self.user, content=self.SPAM)
+        repost = Post.objects.create(thread=self.thread, author=self.user, content=self.SPAM.replace('завтра', 'сегодня'))
+        Post.objects.create(thread=self.thread, author=self.user, content='Совсем другой ответ про погоду и выходные')
+        found = [post for post, score in similar_posts(original)]
+        self.assertEqual(found, [repost])
+    
+    def test_similar_threads_for_draft(self):
+        """Тест: черновик темы находит похожую тему"""
+        found = [thread for thread, score in similar_threads('Как выбрать окна', self.SPAM)]
+        self.assertEqual(found, [self.thread])
+        self.assertEqual(similar_threads('Рецепт борща', 'Свекла, капуста и картофель'), [])
+    
+    def test_deleted_and_hidden_leave_no_candidates(self):
+        """Тест: удаление (и каскадное тоже) чистит бакеты, скрытая тема не кандидат"""
+        post = Post.objects.create(thread=self.thread, author=self.user, content=self.SPAM)
+        packed = minhash.pack(minhash.signature(self.thread.minhash_text()))
+        Thread.objects.filter(pk=self.thread.pk).update(is_active=False)
+        self.assertEqual(LSHBucket.candidates('thread', packed, among=Thread.objects.filter(is_active=True)), [])
+        self.thread.delete()
+        self.assertFalse(LSHBucket.objects.filter(kind='thread', object_id=self.thread.pk).exists())
+        self.assertFalse(LSHBucket.objects.filter(kind='post', object_id=post.pk).exists())
+
+
+class RelatedThreadsTest(TestCase):
+    """Тесты пакетного расчета похожих тем"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        self.python = Thread.objects.create(title='Декораторы в Python', category=category,
+                                            author=self.user, content='Как работают декораторы функций')
+        self.django = Thread.objects.create(title='Декораторы представлений Django', category=category,
+                                            author=self.user, content='login_required и свои декораторы')
+        self.garden = Thread.objects.create(title='Рассада томатов', category=category,
+                                            author=self.other, content='Когда сеять помидоры')
+        self.python.tags.add('python', 'декораторы')
+        self.django.tags.add('python', 'django')
+        self.garden.tags.add('огород')
+    
+    def test_related_by_tags_people_and_text(self):
+        """Тест: тема с общими тегами, автором и словами похожа, чужая - нет"""
+        self.assertEqual(build_related(), 3)
+        self.assertEqual(self.python.related_threads(), [self.django])
+        self.assertEqual(self.garden.related_threads(), [])
+    
+    def test_incremental_run(self):
+        """Тест: инкрементальный прогон пересчитывает только свежие темы"""
+        build_related()
+        Thread.objects.filter(pk=self.garden.pk).update(updated_at=timezone.now() - timedelta(days=30))
+        Thread.objects.filter(pk=self.python.pk).update(updated_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(build_related(since=timezone.now() - timedelta(days=1)), 1)
+    
+    def test_scheduled_run_since_last_run(self):
+        """Тест: задача по расписанию пересчитывает темы, измененные после прошлого запуска"""
+        from django.conf import settings
+        from . import tasks
+        self.assertIn('forum.tasks.build_related', {entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()})
+        cache.clear()
+        self.assertEqual(tasks.build_related(), 3)
+        self.assertEqual(self.python.related_threads(), [self.django])
+        self.assertEqual(tasks.build_related(), 0)
+        Post.objects.create(thread=self.garden, author=self.user, content='Ответ')
+        self.assertEqual(tasks.build_related(), 1)
+
+
+class TagPagesTest(TestCase):
+    """Тесты страниц тегов и денормализованных счетчиков"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+    
+    def create_thread(self, title, tags):
+        form = ThreadForm({'title': title, 'category': self.category.pk, 'content': 'Текст', 'tags': tags})
+        self.assertTrue(form.is_valid(), form.errors)
+        thread = form.save(commit=False)
+        thread.author = self.user
+        thread.save()
+        form.save_m2m()
+        return thread
+    
+    def test_counts_follow_form_saves(self):
+        """Тест: счетчики и облако обновляются при сохранении формы"""
+        thread = self.create_thread('First', 'python, django')
+        self.create_thread('Second', 'python')
+        counts = dict(TagStat.objects.values_list('tag__name', 'thread_count'))
+        self.assertEqual(counts, {'python': 2, 'django': 1})
+        self.assertEqual({t['name']: t['level'] for t in tag_pages.tag_cloud()}, {'python': 5, 'django': 1})
+        
+        form = ThreadForm({'title': 'First', 'category': self.category.pk, 'content': 'Текст', 'tags': 'flask'},
+                          instance=thread)
+        self.assertTrue(form.is_valid())
+        form.save()
+        counts = dict(TagStat.objects.values_list('tag__name', 'thread_count'))
+        self.assertEqual(counts, {'python': 1, 'django': 0, 'flask': 1})
+    
+    def test_counts_follow_hide_and_delete(self):
+        """Тест: скрытие, возврат и удаление темы (и каскад категории) меняют счетчики"""
+        self.create_thread('First', 'python')
+        self.create_thread('Second', 'python')
+        counts = lambda: dict(TagStat.objects.values_list('tag__name', 'thread_count'))
+        thread = Thread.objects.get(title='First')
+        thread.is_active = False
+        thread.save()
+        self.assertEqual(counts(), {'python': 1})
+        thread.is_active = True
+        thread.save(update_fields=['is_active'])
+        self.assertEqual(counts(), {'python': 2})
+        thread.delete()
+        self.assertEqual(counts(), {'python': 1})
+        self.category.delete()
+        self.assertEqual(counts(), {'python': 0})
+        self.assertEqual(tag_pages.tag_cloud(), [])
+    
+    def test_tag_keyset_pagination(self):
+        """Тест: страницы тега не пересекаются и покрывают все темы"""
+        threads = [self.create_thread(f'Тема {i}', 'python') for i in range(5)]
+        tag = threads[0].tags.get()
+        first, cursor = tag_pages.tag_threads(tag, limit=3)
+        second, cursor_end = tag_pages.tag_threads(tag, after=tag_pages.decode_cursor(cursor), limit=3)
+        self.assertIsNone(cursor_end)
+        self.assertEqual(sorted(t.pk for t in first + second), sorted(t.pk for t in threads))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TrendingTest(TestCase):
+    """Тесты рейтингов тем"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.quiet = Thread.objects.create(title='Quiet', category=self.category, author=self.user, content='Текст')
+        self.busy = Thread.objects.create(title='Busy', category=self.category, author=self.user, content='Текст')
+        for i in range(3):
+            post = Post.objects.create(thread=self.busy, author=self.other, content=f'Ответ {i}')
+        Like.objects.create(post=post, user=self.user, like_type=1)
+        self.busy.refresh_from_db()
+    
+    def test_incremental_matches_recompute(self):
+        """Тест: инкрементальные оценки совпадают с пакетным пересчетом"""
+        scores = Thread.objects.values_list('pk', 'hot_score', 'rising_score', 'weekly_score')
+        before = {row[0]: row[1:] for row in scores}
+        call_command('recompute_trending', stdout=StringIO())
+        for pk, hot, rising, weekly in scores.all():
+            self.assertAlmostEqual(hot, before[pk][0], places=6)
+            self.assertAlmostEqual(rising, before[pk][1], places=6)
+            self.assertAlmostEqual(weekly, before[pk][2], places=6)
+        self.assertEqual(self.busy.weekly_score, 4.5)
+    
+    def test_scheduled_recompute_expires_week(self):
+        """Тест: задача по расписанию убирает из недельной оценки события старше 7 дней"""
+        from django.conf import settings
+        from . import tasks
+        self.assertIn('forum.tasks.recompute_trending',
+                      {entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()})
+        Post.objects.filter(thread=self.busy).update(created_at=timezone.now() - timedelta(days=8))
+        tasks.recompute_trending()
+        self.busy.refresh_from_db()
+        self.assertEqual(self.busy.weekly_score, 1.5)
+    
+    def test_activity_raises_rank(self):
+        """Тест: активная тема выше тихой во всех списках"""
+        for kind in trending.LISTINGS:
+            response = self.client.get(reverse('forum:trending', kwargs={'kind': kind}),
+                                       {'category': self.category.slug})
+            self.assertEqual(list(response.context['threads']), [self.busy, self.quiet])
+    
+    def test_index_keeps_recent_threads(self):
+        """Тест: на главной последние темы идут по активности, горячие - отдельным списком"""
+        fresh = Thread.objects.create(title='Fresh', category=self.category, author=self.user, content='Текст')
+        response = self.client.get(reverse('forum:index'))
+        self.assertEqual(list(response.context['recent_threads']), [fresh, self.busy, self.quiet])
+        self.assertEqual(list(response.context['hot_threads'])[0], self.busy)
+        self.assertContains(response, 'Последние темы')
+        self.assertContains(response, reverse('forum:trending', kwargs={'kind': 'hot'}))
+    
+    def test_decay(self):
+        """Тест: старая активность весит меньше новой"""
+        now = timezone.now()
+        old = trending.compute_scores([(1.0, now - timedelta(days=3))] * 5, now)
+        fresh = trending.compute_scores([(1.0, now)], now)
+        self.assertLess(old['hot_score'], fresh['hot_score'])
+        self.assertEqual(old['weekly_score'], 5)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ThreadStatsTest(TestCase):
+    """Тесты денормализованных счетчиков ответов темы"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.thread = Thread.objects.create(title='Test Thread', category=self.category, author=self.user, content='Текст')
+        self.first = Post.objects.create(thread=self.thread, author=self.user, content='Первый')
+        self.second = Post.objects.create(thread=self.thread, author=self.other, content='Второй')
+    
+    def assertStats(self, reply_count, last_post):
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, reply_count)
+        self.assertEqual(self.thread.last_post, last_post)
+        self.assertEqual(self.thread.last_post_author_id, last_post.author_id if last_post else None)
+        self.assertEqual(self.thread.last_post_at, last_post.created_at if last_post else self.thread.created_at)
+    
+    def test_create_and_remove(self):
+        """Тест: создание, скрытие и удаление сообщений"""
+        self.assertStats(2, self.second)
+        self.second.is_active = False
+        self.second.save(update_fields=['is_active'])
+        self.assertStats(1, self.first)
+        self.first.delete()
+        self.assertStats(0, None)
+    
+    def test_queryset_delete(self):
+        """Тест: удаление списком (как в админке) тоже пересчитывает счетчики темы"""
+        Post.objects.filter(pk=self.second.pk).delete()
+        self.assertStats(1, self.first)
+        with batched():
+            Post.objects.filter(pk=self.first.pk).delete()
+        self.assertStats(0, None)
+    
+    def test_rebuild_command(self):
+        """Тест: команда пересчета восстанавливает счетчики после массовых изменений"""
+        Post.objects.filter(pk=self.second.pk).update(is_active=False)
+        Thread.objects.update(reply_count=0, last_post=None)
+        call_command('rebuild_thread_stats', stdout=StringIO())
+        self.assertStats(1, self.first)
+    
+    def test_category_listing_queries(self):
+        """Тест: число запросов списка тем не зависит от числа тем"""
+        url = reverse('forum:category_detail', kwargs={'slug': self.category.slug})
+        self.client.get(url)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        for i in range(5):
+            thread = Thread.objects.create(title=f'Thread {i}', category=self.category, author=self.user, content='Текст')
+            Post.objects.create(thread=thread, author=self.other, content='Ответ')
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.context['threads'][0].title, 'Thread 4')
+        self.assertContains(response, 'Последнее: other')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ArchiveTest(TestCase):
+    """Тесты переноса тем в архив и восстановления"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.thread = Thread.objects.create(title='Old Thread', category=self.category, author=self.user,
+                                            content='**Старый** текст')
+        self.thread.tags.add('history')
+        tag_pages.refresh_tag_stats(self.thread.tags.values_list('pk', flat=True))
+        self.post = Post.objects.create(thread=self.thread, author=self.other, content='Ответ *курсивом*')
+        Like.objects.create(post=self.post, user=self.user, like_type=1)
+        ThreadSubscription.objects.create(thread=self.thread, user=self.user)
+        self.old = timezone.now() - timedelta(days=400)
+        Thread.objects.filter(pk=self.thread.pk).update(created_at=self.old, last_post_at=self.old)
+        Post.objects.filter(pk=self.post.pk).update(created_at=self.old)
+        self.fresh = Thread.objects.create(title='Fresh Thread', category=self.category, author=self.user, content='Текст')
+    
+    def test_candidates(self):
+        """Тест: закрепленные темы и темы с открытыми жалобами не архивируются"""
+        self.assertEqual(list(archive.archive_candidates()), [self.thread])
+        Post.objects.filter(pk=self.post.pk).update(open_report_count=1)
+        self.assertFalse(archive.archive_candidates().exists())
+    
+    def test_archive_reads_through(self):
+        """Тест: ссылка на тему работает после переноса, горячие таблицы очищены"""
+        call_command('archive_threads', stdout=StringIO())
+        self.assertFalse(Thread.objects.filter(pk=self.thread.pk).exists())
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(TagStat.objects.get(tag__name='history').thread_count, 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.post_count, 1)
+        
+        response = self.client.get(reverse('forum:thread_detail', kwargs={'slug': 'old-thread'}))
+        self.assertTemplateUsed(response, 'forum/thread_archived.html')
+        self.assertContains(response, '<em>курсивом</em>')
+        self.assertEqual(response.context['posts'][0].like_count, 1)
+        response = self.client.get(reverse('forum:category_archive', kwargs={'slug': self.category.slug}))
+        self.assertContains(response, 'Old Thread')
+    
+    def test_restore(self):
+        """Тест: восстановление возвращает темы с теми же id, датами, лайками и тегами"""
+        archive.archive_threads([self.thread.pk])
+        call_command('archive_threads', restore=True, ids=[self.thread.pk], stdout=StringIO())
+        self.assertFalse(ArchivedThread.objects.exists())
+        thread = Thread.objects.get(pk=self.thread.pk)
+        self.assertEqual((thread.slug, thread.reply_count, thread.last_post_id), ('old-thread', 1, self.post.pk))
+        self.assertEqual(thread.created_at, self.old)
+        self.assertEqual(list(thread.tags.names()), ['history'])
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.created_at, self.old)
+        self.assertEqual(post.likes.get().user, self.user)
+        self.assertTrue(ThreadSubscription.objects.filter(thread=thread, user=self.user).exists())
+        self.assertTrue(LSHBucket.objects.filter(kind='post', object_id=post.pk).exists())
+        self.assertEqual(TagStat.objects.get(tag__name='history').thread_count, 1)
+    
+    def test_reports_survive_archive(self):
+        """Тест: закрытые жалобы сохраняются в архиве и возвращаются с датами"""
+        report = Report.objects.create(post=self.post, reporter=self.user, report_type='spam', description='!',
+                                       status='rejected', moderator=self.other, resolved_at=self.old)
+        Report.objects.filter(pk=report.pk).update(created_at=self.old)
+        archive.archive_threads([self.thread.pk])
+        self.assertFalse(Report.objects.exists())
+        archive.restore_threads([self.thread.pk])
+        restored = Report.objects.get(post_id=self.post.pk)
+        self.assertEqual((restored.status, restored.moderator, restored.created_at, restored.resolved_at),
+                         ('rejected', self.other, self.old, self.old))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).open_report_count, 0)
+    
+    def test_archived_slug_is_reserved(self):
+        """Тест: новая тема с тем же заголовком не перехватывает ссылку архивной"""
+        archive.archive_threads([self.thread.pk])
+        thread = Thread.objects.create(title='Old Thread', category=self.category, author=self.user, content='Новая')
+        self.assertEqual(thread.slug, 'old-thread-2')
+        response = self.client.get(reverse('forum:thread_detail', kwargs={'slug': 'old-thread'}))
+        self.assertTemplateUsed(response, 'forum/thread_archived.html')
+        archive.restore_threads([self.thread.pk])
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).slug, 'old-thread')
+
+
+class UploadTest(TestCase):
+    """Тесты загрузки вложений по частям"""
+    
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        thread = Thread.objects.create(title='Thread', category=category, author=self.user, content='Текст')
+        self.post = Post.objects.create(thread=thread, author=self.user, content='Ответ')
+        self.client.login(username='testuser', password='testpass123')
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+    
+    def start(self, data):
+        response = self.client.post(reverse('forum:upload_start', kwargs={'pk': self.post.pk}),
+                                    {'filename': 'notes.txt', 'size': len(data)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+    
+    def send(self, url, offset, chunk):
+        return self.client.generic('PATCH', url, chunk, content_type='application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET=str(offset))
+    
+    def upload(self, data, chunk_size=4):
+        url = self.start(data)
+        for offset in range(0, len(data), chunk_size):
+            response = self.send(url, offset, data[offset:offset + chunk_size])
+        return response
+    
+    def test_chunked_upload(self):
+        """Тест: файл собирается из частей, хеш считается по всему содержимому"""
+        data = b'hello, chunked world'
+        response = self.upload(data)
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.size, len(data))
+        self.assertEqual(attachment.blob.sha256, hashlib.sha256(data).hexdigest())
+        with attachment.blob.file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(UploadSession.objects.exists())
+    
+    def test_same_content_stored_once(self):
+        """Тест: повторная загрузка того же файла не создает новый Blob"""
+        self.upload(b'duplicate content')
+        self.upload(b'duplicate content', chunk_size=100)
+        self.assertEqual(Attachment.objects.count(), 2)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'uploads', 'tmp')), [])
+    
+    def test_offset_mismatch_and_resume(self):
+        """Тест: часть с неверным смещением отклоняется, HEAD сообщает принятое смещение"""
+        data = b'0123456789'
+        url = self.start(data)
+        self.send(url, 0, data[:4])
+        response = self.send(url, 2, data[2:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4)
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], '4')
+        self.assertEqual(self.send(url, 4, data[4:]).status_code, 201)
+    
+    def test_permissions(self):
+        """Тест: вложения добавляет только автор, чужую сессию нельзя продолжить"""
+        url = self.start(b'data')
+        self.client.login(username='other', password='testpass123')
+        response = self.client.post(reverse('forum:upload_start', kwargs={'pk': self.post.pk}),
+                                    {'filename': 'x.txt', 'size': 4})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.send(url, 0, b'data').status_code, 404)
+    
+    def test_garbage_collection(self):
+        """Тест: удаляются брошенные сессии и файлы без ссылок"""
+        self.upload(b'orphan')
+        self.start(b'abandoned')
+        Attachment.objects.get().delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertEqual(uploads.collect_garbage(), (0, 0))
+        self.assertEqual(uploads.collect_garbage(now=timezone.now() + timedelta(days=2)), (1, 1))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, uploads.blob_name(hashlib.sha256(b'orphan').hexdigest()))))
+    
+    def test_references_follow_cascades_and_archive(self):
+        """Тест: каскадное удаление снимает ссылку, архив ее держит до удаления архивной темы"""
+        self.upload(b'shared')
+        blob = Blob.objects.get()
+        later = timezone.now() + timedelta(days=2)
+        archive.archive_threads([self.post.thread_id])
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertEqual(uploads.collect_garbage(now=later), (0, 0))
+        archive.restore_threads([self.post.thread_id])
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        archive.archive_threads([self.post.thread_id])
+        ArchivedThread.objects.all().delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        self.assertEqual(uploads.collect_garbage(now=later), (0, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.media, blob.file.name)))
+    
+    def test_untracked_files_collected(self):
+        """Тест: файл в blobs/ без записи Blob (откат транзакции) удаляет сборщик"""
+        name = default_storage.save(uploads.blob_name(hashlib.sha256(b'lost').hexdigest()), ContentFile(b'lost'))
+        self.upload(b'kept')
+        self.assertEqual(uploads.collect_garbage(), (0, 0))
+        self.assertEqual(uploads.collect_garbage(now=timezone.now() + timedelta(days=2)), (0, 1))
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(Blob.objects.get().file.name))
+
+
+class AttachmentDownloadTest(TestCase):
+    """Тесты отдачи вложений"""
+    
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        thread = Thread.objects.create(title='Thread', category=category, author=self.user, content='Текст')
+        self.post = Post.objects.create(thread=thread, author=self.user, content='Ответ')
+        self.data = b'0123456789abcdef'
+        sha256 = hashlib.sha256(self.data).hexdigest()
+        name = default_storage.save(uploads.blob_name(sha256), ContentFile(self.data))
+        blob = Blob.objects.create(sha256=sha256, file=name, size=len(self.data))
+        self.attachment = Attachment.objects.create(post=self.post, blob=blob, file=name,
+                                                    filename='notes.txt', size=len(self.data))
+        self.url = self.attachment.get_absolute_url()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+    
+    def test_full_and_range(self):
+        """Тест: файл целиком, диапазон, диапазон вне файла"""
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('inline', response['Content-Disposition'])
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-7')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'4567')
+        self.assertEqual(response['Content-Range'], f'bytes 4-7/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '4')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'def')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=100-').status_code, 416)
+        # If-Range с устаревшим ETag - файл целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-7', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_etag(self):
+        """Тест: ETag - хеш содержимого, повторный запрос получает 304"""
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(etag, f'"{self.attachment.blob.sha256}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+    
+    def test_hidden_post(self):
+        """Тест: вложение скрытого сообщения видят только автор и модераторы"""
+        Post.objects.filter(pk=self.post.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+    
+    @override_settings(SENDFILE_BACKEND='nginx')
+    def test_nginx_backend(self):
+        """Тест: с nginx воркер не читает файл, а отвечает X-Accel-Redirect"""
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.attachment.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+class ThumbnailTest(TestCase):
+    """Тесты уменьшенных копий изображений"""
+    
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        thumbnails._cache_size = None
+        image = BytesIO()
+        Image.new('RGBA', (800, 400), (200, 30, 30, 128)).save(image, 'PNG')
+        self.avatar = default_storage.save('avatars/me.png', ContentFile(image.getvalue()))
+        self.url = reverse('forum:thumbnail', kwargs={'width': 64, 'height': 64, 'path': self.avatar})
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+    
+    def test_render_and_cache(self):
+        """Тест: копия вписана в размер, WebP по Accept, повтор берется из кеша"""
+        response = self.client.get(self.url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 32))
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        
+        with patch('forum.thumbnails.render') as render:
+            self.client.get(self.url)
+        render.assert_not_called()
+        
+        self.assertEqual(self.client.get(self.url.replace('64x64', '65x65')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('forum:thumbnail', kwargs={
+            'width': 64, 'height': 64, 'path': 'thumbs/../avatars/me.png'})).status_code, 404)
+    
+    def test_concurrent_requests_render_once(self):
+        """Тест: одновременные первые запросы одной копии ждут один рендер"""
+        started = threading.Event()
+        release = threading.Event()
+        original = thumbnails.render
+        calls = []
+        
+        def slow_render(*args):
+            calls.append(args)
+            started.set()
+            release.wait(5)
+            return original(*args)
+        
+        with patch('forum.thumbnails.render', slow_render):
+            results = []
+            workers = [threading.Thread(target=lambda: results.append(
+                thumbnails.get_thumbnail(self.avatar, 64, 64, 'jpeg'))) for _ in range(4)]
+            workers[0].start()
+            started.wait(5)
+            for worker in workers[1:]:
+                worker.start()
+            release.set()
+            for worker in workers:
+                worker.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results), 4)
+    
+    def test_eviction(self):
+        """Тест: при переполнении удаляются давно не запрашивавшиеся копии"""
+        old = thumbnails.get_thumbnail(self.avatar, 64, 64, 'jpeg')
+        new = thumbnails.get_thumbnail(self.avatar, 128, 128, 'jpeg')
+        past = time.time() - 3600
+        os.utime(default_storage.path(old), (past, past))
+        self.assertEqual(thumbnails.evict(max_size=int(default_storage.size(new) / thumbnails.EVICT_TO) + 1), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(new))
+    
+    def test_attachment_permissions(self):
+        """Тест: копия вложения скрытого сообщения недоступна"""
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        thread = Thread.objects.create(title='Thread', category=category, author=user, content='Текст')
+        post = Post.objects.create(thread=thread, author=user, content='Ответ')
+        name = default_storage.save('attachments/photo.png', default_storage.open(self.avatar))
+        Attachment.objects.create(post=post, file=name, filename='photo.png', size=default_storage.size(name))
+        url = reverse('forum:thumbnail', kwargs={'width': 320, 'height': 320, 'path': name})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        Post.objects.filter(pk=post.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class StartupTest(TestCase):
+    """Тесты отложенных импортов и профиля старта"""
+    
+    def test_heavy_modules_are_lazy(self):
+        """Тест: старт воркера не импортирует Celery, Pillow и markdown"""
+        snippet = startup.BOOT_SNIPPET + "import sys; print(sorted({'celery', 'PIL', 'markdown'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, '-c', snippet], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], '[]')
+    
+    def test_parse_importtime(self):
+        """Тест разбора вывода python -X importtime"""
+        modules = startup.parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   markdown.util\n'
+            'import time:       300 |        420 | markdown\n'
+        )
+        self.assertEqual(modules, [('markdown.util', 120, 120), ('markdown', 300, 420)])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TemplateProfileTest(TestCase):
+    """Тесты профиля рендера шаблонов"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        for i in range(3):
+            category = Category.objects.create(name=f'Category {i}', slug=f'category-{i}')
+            thread = Thread.objects.create(title=f'Thread {i}', category=category, author=self.user, content='Текст')
+            Post.objects.create(thread=thread, author=self.user, content='Ответ')
+    
+    def test_category_stats(self):
+        """Тест: счетчики категорий на главной не зависят от числа категорий"""
+        categories = Category.with_stats(Category.objects.filter(is_active=True))
+        for category in categories:
+            self.assertEqual(category.active_thread_count, category.thread_count())
+            self.assertEqual(category.active_post_count, category.post_count())
+            self.assertEqual(category.latest_post, category.last_post())
+        
+        with profile_templates() as profiler:
+            response = self.client.get(reverse('forum:index'))
+        self.assertContains(response, 'Последнее:', count=3)
+        variables = [entry for entry in profiler.report() if entry.kind == 'variable']
+        self.assertFalse([entry.name for entry in variables if entry.own_queries])
+    
+    def test_queries_attributed_to_variables(self):
+        """Тест: запрос из метода, вызванного в шаблоне, записан на переменную"""
+        template = Template('{% for category in categories %}{{ category.thread_count }}{% endfor %}')
+        with profile_templates() as profiler:
+            template.render(TemplateContext({'categories': Category.objects.all()}))
+        entry = next(entry for entry in profiler.report() if entry.name == 'category.thread_count')
+        self.assertEqual((entry.kind, entry.calls, entry.own_queries), ('variable', 3, 3))
+        self.assertIn('COUNT', entry.sql[0])
+
+
+class RenderingTest(TestCase):
+    """Тесты рендера Markdown и санитайзера"""
+    
+    def test_sanitize_strips_scripts(self):
+        """Тест: скрипты, обработчики и javascript:-ссылки вырезаются"""
+        html = rendering.render(
+            'Текст <script>alert(1)</script><img src=x onerror="alert(1)">\n\n'
+            '[ссылка](javascript:alert(1)) <a href="java&#x09;script:alert(1)">a</a> <iframe src="/"></iframe>'
+        )
+        self.assertNotIn('script', html.replace('javascript', ''))
+        self.assertNotIn('alert', html)
+        self.assertNotIn('onerror', html)
+        self.assertNotIn('iframe', html)
+        self.assertIn('<img src="x">', html)
+    
+    def test_sanitize_keeps_markdown(self):
+        """Тест: обычная разметка, ссылки и код сохраняются"""
+        html = rendering.render('**жирный** [сайт](https://example.com)\n\n    <b>код</b>')
+        self.assertIn('<strong>жирный</strong>', html)
+        self.assertIn('<a href="https://example.com" rel="nofollow ugc noopener">сайт</a>', html)
+        self.assertIn('<code>&lt;b&gt;код&lt;/b&gt;', html)
+    
+    def test_sanitize_strips_unknown_classes(self):
+        """Тест: остаются только классы, которые выводят расширения Markdown"""
+        html = rendering.sanitize(
+            '<div class="fixed-top modal"><p class="position-absolute w-100">текст</p></div>'
+            '<pre class="codehilite"><code class="language-python btn">x</code></pre>'
+            '<a class="footnote-ref navbar" href="#fn:1">1</a>'
+        )
+        self.assertEqual(html, '<div><p>текст</p></div>'
+                               '<pre class="codehilite"><code class="language-python">x</code></pre>'
+                               '<a class="footnote-ref" href="#fn:1" rel="nofollow ugc noopener">1</a>')
+    
+    def test_sanitize_closes_tags(self):
+        """Тест: незакрытые и лишние закрывающие теги не ломают страницу"""
+        self.assertEqual(rendering.sanitize('<div><em>текст</div></p>'), '<div><em>текст</em></div>')
+    
+    def test_render_many(self):
+        """Тест: render_many дает тот же результат, что рендер по одному"""
+        texts = [f'# Заголовок {i}\n\nТекст[^1]\n\n[^1]: сноска' for i in range(5)]
+        self.assertEqual(rendering.render_many(texts), [rendering.render(text) for text in texts])
+        self.assertEqual(rendering.render_many(texts, processes=2, chunk_size=2), rendering.render_many(texts))
+    
+    def test_rerender_archive(self):
+        """Тест: перерендер заменяет замороженный HTML архивных сообщений"""
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Category', slug='category')
+        thread = Thread.objects.create(title='Thread', category=category, author=user, content='Тема')
+        Post.objects.create(thread=thread, author=user, content='<script>alert(1)</script>Ответ')
+        archive.archive_threads([thread.pk])
+        archived = ArchivedThread.objects.get(pk=thread.pk)
+        archived.posts.update(content_html='<script>alert(1)</script>')
+        
+        call_command('archive_threads', '--rerender', stdout=StringIO())
+        self.assertEqual([post.content_html.strip() for post in archived.posts.all()], ['<p>Ответ</p>'])
+    
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_thread_page_is_sanitized(self):
+        """Тест: сообщения на странице темы выводятся после санитайзера"""
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Category', slug='category')
+        thread = Thread.objects.create(title='Thread', category=category, author=user, content='**Тема**')
+        Post.objects.create(thread=thread, author=user, content='Ответ <script>alert(1)</script>')
+        response = self.client.get(thread.get_absolute_url())
+        self.assertContains(response, '<strong>Тема</strong>')
+        self.assertContains(response, 'Ответ')
+        self.assertNotContains(response, 'alert(1)')
+    
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_search_snippet_is_escaped(self):
+        """Тест: фрагмент сообщения в результатах поиска не выводит сырой HTML"""
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Category', slug='category')
+        thread = Thread.objects.create(title='Thread', category=category, author=user, content='Тема')
+        Post.objects.create(thread=thread, author=user, content='Находка <img src=x onerror=alert(1)> <b>жирный</b>')
+        response = self.client.get(reverse('forum:search'), {'q': 'Находка', 'search_in': 'posts'})
+        self.assertContains(response, 'Находка')
+        self.assertNotContains(response, 'onerror')
+        self.assertNotContains(response, '<b>жирный</b>')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage', POSTS_PER_PAGE=2)
+class PermalinkTest(TestCase):
+    """Тесты номеров сообщений в теме и постоянных ссылок"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Category', slug='category')
+        self.thread = Thread.objects.create(title='Thread', category=self.category, author=self.user, content='Текст')
+        self.posts = [Post.objects.create(thread=self.thread, author=self.user, content=f'Ответ {i}') for i in range(5)]
+    
+    def test_positions(self):
+        """Тест: номера выдаются по порядку и не переиспользуются после удаления"""
+        self.assertEqual([post.position for post in self.posts], [1, 2, 3, 4, 5])
+        self.posts[-1].delete()
+        post = Post.objects.create(thread=self.thread, author=self.user, content='Еще ответ')
+        self.assertEqual(post.position, 6)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.post_sequence, 6)
+    
+    def test_permalink_redirects_to_page(self):
+        """Тест: ссылка на сообщение ведет на его страницу одним запросом"""
+        post = self.posts[2]
+        with self.assertNumQueries(1):
+            response = self.client.get(post.get_absolute_url())
+        self.assertRedirects(response, f'{self.thread.get_absolute_url()}?page=2#post-{post.pk}',
+                             fetch_redirect_response=False)
+        response = self.client.get(response['Location'])
+        self.assertContains(response, f'id="post-{post.pk}"')
+        self.assertEqual(response.context['posts'].paginator.num_pages, 3)
+    
+    def test_hidden_posts_keep_pages(self):
+        """Тест: скрытое сообщение не сдвигает остальные на другие страницы"""
+        self.posts[0].is_active = False
+        self.posts[0].save(update_fields=['is_active'])
+        response = self.client.get(self.thread.get_absolute_url(), {'page': 2})
+        self.assertEqual([post.pk for post in response.context['posts']], [self.posts[2].pk, self.posts[3].pk])
+        self.assertEqual(response.context['posts'].paginator.count, 4)
+    
+    def test_hidden_range_is_shown(self):
+        """Тест: страница из одних скрытых сообщений сообщает о пропуске, диапазон - по номерам"""
+        Post.objects.filter(pk__in=[self.posts[2].pk, self.posts[3].pk]).update(is_active=False)
+        response = self.client.get(self.thread.get_absolute_url(), {'page': 2})
+        page = response.context['posts']
+        self.assertEqual((page.start_index(), page.end_index(), page.hidden_count), (3, 4, 2))
+        self.assertContains(response, 'Сообщения 3–4 скрыты или удалены.')
+        self.assertNotContains(response, 'Пока нет ответов.')
+        page = self.client.get(self.thread.get_absolute_url(), {'page': 3}).context['posts']
+        self.assertEqual((page.start_index(), page.end_index(), page.hidden_count), (5, 5, 0))
+    
+    def test_reply_redirects_to_new_post(self):
+        """Тест: после ответа пользователь попадает на страницу нового сообщения"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(self.thread.get_absolute_url(), {'content': 'Новый ответ в теме'})
+        post = Post.objects.latest('pk')
+        self.assertEqual(post.position, 6)
+        self.assertRedirects(response, f'{self.thread.get_absolute_url()}?page=3#post-{post.pk}',
+                             fetch_redirect_response=False)
+    
+    def test_archived_permalink(self):
+        """Тест: номера сохраняются в архиве и при восстановлении"""
+        post = self.posts[4]
+        archive.archive_threads([self.thread.pk])
+        response = self.client.get(reverse('forum:post_permalink', kwargs={'pk': post.pk}))
+        self.assertRedirects(response, f'{self.thread.get_absolute_url()}?page=3#post-{post.pk}',
+                             fetch_redirect_response=False)
+        
+        archive.restore_threads([self.thread.pk])
+        self.assertEqual(list(Post.objects.filter(thread=self.thread).values_list('position', flat=True)),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(Post.objects.create(thread=self.thread, author=self.user, content='После архива').position, 6)
+
+
+class ExportTest(TestCase):
+    """Тесты потоковой выгрузки данных"""
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+        category = Category.objects.create(name='Category', slug='category')
+        thread = Thread.objects.create(title='Thread', category=category, author=self.user, content='Текст')
+        for i in range(5):
+            Post.objects.create(thread=thread, author=self.user, content=f'Ответ, "{i}"\nстрока')
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_jsonl_gzip(self):
+        """Тест: JSONL со сжатием gzip читается обратно, приватные поля не выгружаются"""
+        result = export.export_dataset('users', self.dir, compress='gzip')
+        self.assertTrue(result['path'].endswith('users.jsonl.gz'))
+        with gzip.open(result['path'], 'rt') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(records[0]['username'], 'testuser')
+        self.assertNotIn('email', records[0])
+    
+    def test_csv_in_chunks(self):
+        """Тест: CSV пишется кусками и совпадает с данными таблицы"""
+        with patch.object(export, 'CHUNK_SIZE', 2), patch.object(export, 'BUFFER_SIZE', 10):
+            result = export.export_dataset('posts', self.dir, fmt='csv')
+        with open(result['path'], newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['content'] for row in rows], [f'Ответ, "{i}"\nстрока' for i in range(5)])
+        self.assertEqual([row['position'] for row in rows], ['1', '2', '3', '4', '5'])
+        self.assertFalse(os.path.exists(result['path'] + '.tmp'))
+    
+    def test_missing_optional_dependency(self):
+        """Тест: без pyarrow/zstandard - понятная ошибка, а не частичный файл"""
+        with patch.dict(sys.modules, {'pyarrow': None, 'pyarrow.parquet': None, 'zstandard': None}):
+            with self.assertRaises(CommandError):
+                call_command('export_data', self.dir, '--format', 'parquet', '--datasets', 'posts', stdout=StringIO())
+            with self.assertRaises(CommandError):
+                call_command('export_data', self.dir, '--compress', 'zstd', '--datasets', 'posts', stdout=StringIO())
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class UserActivityTest(TestCase):
+    """Тесты агрегатов профиля и репутации"""
+    
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='testpass123')
+        self.category = Category.objects.create(name='Category', slug='category')
+        self.other_category = Category.objects.create(name='Other', slug='other')
+        self.thread = Thread.objects.create(title='Thread', slug='thread', category=self.category,
+                                            author=self.author, content='Текст')
+        self.post = Post.objects.create(thread=self.thread, author=self.author, content='Ответ')
+        activity.rebuild_user_stats()
+    
+    def snapshot(self, user):
+        stat = UserStat.objects.get(pk=user.pk)
+        categories = sorted(UserCategoryStat.objects.filter(user=user)
+                            .values_list('category_id', 'thread_count', 'post_count'))
+        user.refresh_from_db()
+        return stat.likes_received, stat.dislikes_received, user.reputation, stat.recent, categories
+    
+    def test_incremental_matches_rebuild(self):
+        """Тест: агрегаты по событиям совпадают с полным пересчетом"""
+        other = Thread.objects.create(title='Other', slug='other-thread', category=self.other_category,
+                                      author=self.reader, content='Текст')
+        reply = Post.objects.create(thread=other, author=self.author, content='Ответ в другой категории')
+        extra = Post.objects.create(thread=self.thread, author=self.author, content='Будет удален')
+        Like.objects.create(post=self.post, user=self.reader, like_type=1)
+        like = Like.objects.create(post=reply, user=self.reader, like_type=1)
+        like.like_type = -1
+        like.save()
+        Like.objects.create(post=self.post, user=self.author, like_type=1)
+        Like.objects.create(post=extra, user=self.reader, like_type=1).delete()
+        extra.delete()
+        
+        incremental = self.snapshot(self.author)
+        self.assertEqual(incremental[:3], (1, 1, 0))
+        self.assertEqual([item['id'] for item in incremental[3]], [reply.pk, self.post.pk, self.thread.pk])
+        activity.rebuild_user_stats()
+        self.assertEqual(self.snapshot(self.author), incremental)
+    
+    def test_removals_match_rebuild(self):
+        """Тест: удаление темы каскадом, удаление списком и скрытие модератором обновляют агрегаты"""
+        from moderation.services import deactivate_posts
+        other = Thread.objects.create(title='Other', slug='other-thread', category=self.other_category,
+                                      author=self.reader, content='Текст')
+        Post.objects.create(thread=other, author=self.author, content='Ответ в другой категории')
+        hidden = Post.objects.create(thread=self.thread, author=self.author, content='Будет скрыт')
+        removed = Post.objects.create(thread=self.thread, author=self.author, content='Будет удален')
+        Post.objects.filter(pk=removed.pk).delete()
+        deactivate_posts([hidden.pk], self.reader)
+        other.delete()
+        incremental = self.snapshot(self.author)
+        self.assertEqual([item['id'] for item in incremental[3]], [self.post.pk, self.thread.pk])
+        activity.rebuild_user_stats()
+        self.assertEqual(self.snapshot(self.author), incremental)
+    
+    def test_reactions_validated_and_cache_dropped(self):
+        """Тест: неизвестный тип реакции отклоняется, репутация сбрасывает кеш пользователя"""
+        from accounts.models import user_cache_key
+        self.client.login(username='reader', password='testpass123')
+        url = reverse('forum:post_like', kwargs={'pk': self.post.pk})
+        for value in ('5', 'x'):
+            self.assertEqual(self.client.post(url, {'type': value}).status_code, 400)
+        self.assertFalse(Like.objects.exists())
+        cache.set(user_cache_key(self.author.pk), 'stale')
+        self.assertEqual(self.client.post(url, {'type': '-1'}).status_code, 200)
+        self.assertIsNone(cache.get(user_cache_key(self.author.pk)))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.reputation, -1)
+    
+    def test_reputation_survives_archive(self):
+        """Тест: лайки сообщений из архива остаются в репутации"""
+        Like.objects.create(post=self.post, user=self.reader, like_type=1)
+        archive.archive_threads([self.thread.pk])
+        activity.rebuild_user_stats()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.reputation, 1)
+        self.assertEqual(self.snapshot(self.author)[4], [(self.category.pk, 1, 1)])
+    
+    def test_profile_reads_aggregates(self):
+        """Тест: профиль строится из агрегатов, без них считает их при первом просмотре"""
+        UserStat.objects.filter(pk=self.author.pk).delete()
+        Like.objects.create(post=self.post, user=self.reader, like_type=1)
+        url = reverse('accounts:profile', kwargs={'username': 'author'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['stat'].likes_received, 1)
+        self.assertContains(response, reverse('forum:post_permalink', kwargs={'pk': self.post.pk}))
+        # пользователь + агрегаты, профиль, категории
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual([item.category for item in response.context['top_categories']], [self.category])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BenchmarkToolsTest(TestCase):
+    """Тесты генератора данных и бенчмарка"""
+    
+    def test_generate_forum(self):
+        """Тест генерации синтетического форума"""
+        call_command('generate_forum', categories=2, users=20, threads=10, posts=200,
+                     messages=30, seed=1, stdout=StringIO())
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Thread.objects.count(), 10)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(User.objects.aggregate(n=Sum('post_count'))['n'], 200)
+        # Даты распределены по истории, а не равны моменту генерации
+        self.assertGreater(Post.objects.aggregate(n=Count('created_at', distinct=True))['n'], 100)
+    
+    def test_benchmark_report(self):
+        """Тест отчета бенчмарка"""
+        call_command('generate_forum', categories=2, users=20, threads=10, posts=100,
+                     messages=30, seed=2, stdout=StringIO())
+        report = run_benchmark(iterations=3, warmup=0)
+        self.assertEqual(
+            set(report['results']),
+            {'index', 'category_detail', 'category_detail_deep', 'thread_detail',
+             'tag_detail', 'search', 'post_like', 'messages_inbox'}
+        )
+        for result in report['results'].values():
+            self.assertEqual(result['status_codes'], {'200': 3})
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+    
+    def test_percentile(self):
+        """Тест расчета перцентилей"""
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 95), 95.05)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class IndexAdvisorTest(TestCase):
+    """Тесты анализа планов запросов"""
+    
+    def setUp(self):
+        cache.clear()
+        call_command('generate_forum', categories=2, users=20, threads=10, posts=100,
+                     messages=30, seed=3, stdout=StringIO())
+    
+    def test_report(self):
+        """Тест: полный просмотр при поиске найден, входящие читаются по индексу без сортировки"""
+        report = analyze(min_rows=0)
+        self.assertGreater(report['queries'], 10)
+        self.assertIn('search', {name for scan in report['seq_scans'] for name in scan['scenarios']})
+        self.assertNotIn('messages_inbox', {name for sort in report['sorts'] for name in sort['scenarios']})
+        self.assertIn('message_inbox_idx', report['used_indexes'])
+        self.assertIn('thread_category_last_post_idx', report['used_indexes'])
+        self.assertNotIn('message_inbox_idx', report['unused_indexes'].get('forum_privatemessage', []))
+    
+    def test_replay_leaves_data_unchanged(self):
+        """Тест: прогон сценариев (лайк, просмотры) откатывается"""
+        before = (Like.objects.count(), Thread.objects.aggregate(Sum('views'))['views__sum'])
+        analyze(min_rows=0)
+        self.assertEqual((Like.objects.count(), Thread.objects.aggregate(Sum('views'))['views__sum']), before)
+    
+    def test_command(self):
+        """Тест: --strict завершается ошибкой при полных просмотрах"""
+        with self.assertRaises(CommandError):
+            call_command('index_advisor', min_rows=0, only=['search'], strict=True, stdout=StringIO())
+        call_command('index_advisor', min_rows=0, only=['thread_detail'], strict=True, stdout=StringIO())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class LoadTestRunnerTest(TransactionTestCase):
+    """Тесты нагрузочного прогона в текущем процессе"""
+    
+    def test_mixed_load(self):
+        """Тест смешанной нагрузки: чтение и запись проходят без ошибок"""
+        call_command('generate_forum', categories=2, users=10, threads=5, posts=30,
+                     messages=5, seed=3, stdout=StringIO())
+        mix = {'anon_read': 1, 'member_read': 1, 'member_reply': 1, 'member_like': 1, 'member_message': 1}
+        report = run_load(InProcessDriver(), Fixtures.load(sessions=3), mix=mix,
+                          concurrency=1, duration=60, max_requests=25, seed=1)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['rejected'], 0)
+        self.assertGreater(report['throughput_rps'], 0)
+        self.assertIn('thread_detail', report['steps'])
+        step = report['steps']['thread_detail']
+        self.assertEqual(sum(step['histogram'].values()), step['requests'])
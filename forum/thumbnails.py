@@ -0,0 +1,191 @@
+"""Уменьшенные копии изображений (вложения и аватары) с кешем на диске.
+
+``/media/thumb/<w>x<h>/<путь>`` отдает изображение, вписанное в w×h (без
+увеличения), в WebP, если браузер его принимает, иначе в JPEG. Копия
+рендерится Pillow при первом запросе и сохраняется в ``MEDIA_ROOT/thumbs``;
+дальше ее отдает веб-сервер через ``forum.sendfile``.
+
+Рендер идет в общем пуле из ``THUMBNAIL_WORKERS`` потоков (Pillow отпускает
+GIL при декодировании и масштабировании), поэтому всплеск запросов к новым
+картинкам не займет все воркеры. Одновременные первые запросы одной копии ждут
+один и тот же Future. Размер кеша ограничен ``THUMBNAIL_CACHE_MAX_SIZE``:
+попадание обновляет mtime файла, а при переполнении удаляются давно не
+запрашивавшиеся копии (LRU по mtime).
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+CACHE_DIR = 'thumbs'
+RENDER_TIMEOUT = 30
+EVICT_TO = 0.9
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+# Пути, из которых можно делать копии; остальное в MEDIA_ROOT недоступно
+SOURCES = ('avatars/', 'blobs/', 'attachments/')
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+_lock = threading.Lock()
+_executor = None
+_pending = {}
+_cache_size = None
+_evicting = False
+
+
+class ThumbnailError(Exception):
+    """Копию сделать нельзя; status - HTTP-код ответа"""
+
+    def __init__(self, message, status=404):
+        super().__init__(message)
+        self.status = status
+
+
+def sizes():
+    return {tuple(int(n) for n in size.split('x')) for size in settings.THUMBNAIL_SIZES}
+
+
+def output_format(accept):
+    return 'webp' if 'image/webp' in (accept or '') else 'jpeg'
+
+
+def is_source(name):
+    return os.path.normpath(name) == name and name.startswith(SOURCES)
+
+
+def cache_name(name, width, height, fmt):
+    """Путь копии; время изменения исходника входит в ключ"""
+    mtime = int(os.path.getmtime(default_storage.path(name)))
+    key = hashlib.sha256(f'{name}:{mtime}:{width}x{height}'.encode()).hexdigest()
+    return f'{CACHE_DIR}/{key[:2]}/{key}.{fmt}'
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+        return _executor
+
+
+def render(source, target, width, height, fmt):
+    """Записать в target копию source, вписанную в width×height"""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(source) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе
+            image.draft('RGB', (width, height))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, height), Image.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            if fmt == 'jpeg' and image.mode == 'RGBA':
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f'{target}.{threading.get_ident()}.tmp'
+            try:
+                if fmt == 'webp':
+                    image.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+                else:
+                    image.save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                os.replace(tmp, target)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ThumbnailError(f'Не удалось обработать изображение: {exc}') from exc
+    return os.path.getsize(target)
+
+
+def _render_job(key, source, target, width, height, fmt):
+    try:
+        size = render(source, target, width, height, fmt)
+    finally:
+        with _lock:
+            _pending.pop(key, None)
+    _account(size)
+
+
+def get_thumbnail(name, width, height, fmt):
+    """Имя копии в хранилище; рендерит ее, если копии еще нет"""
+    target = cache_name(name, width, height, fmt)
+    path = default_storage.path(target)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return target
+    executor = _get_executor()
+    with _lock:
+        future = _pending.get(target)
+        if future is None:
+            future = executor.submit(_render_job, target, default_storage.path(name), path, width, height, fmt)
+            _pending[target] = future
+    try:
+        future.result(timeout=RENDER_TIMEOUT)
+    except FutureTimeout:
+        raise ThumbnailError('Изображение еще обрабатывается', status=503)
+    return target
+
+
+def _scan():
+    """[(mtime, размер, путь)] всех копий"""
+    files = []
+    for root, dirs, names in os.walk(default_storage.path(CACHE_DIR)):
+        for filename in names:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def _account(size):
+    """Учесть новую копию и запустить вытеснение при переполнении"""
+    global _cache_size, _evicting
+    if _cache_size is None:
+        # Новая копия уже на диске и попадет в сумму
+        total = sum(item[1] for item in _scan()) - size
+        with _lock:
+            _cache_size = total
+    with _lock:
+        _cache_size += size
+        if _cache_size <= settings.THUMBNAIL_CACHE_MAX_SIZE or _evicting:
+            return
+        _evicting = True
+    _get_executor().submit(evict)
+
+
+def evict(max_size=None):
+    """Удалять самые давно запрошенные копии, пока кеш больше EVICT_TO * max_size.
+
+    Возвращает число удаленных файлов.
+    """
+    global _cache_size, _evicting
+    max_size = settings.THUMBNAIL_CACHE_MAX_SIZE if max_size is None else max_size
+    removed = 0
+    try:
+        files = sorted(_scan())
+        total = sum(item[1] for item in files)
+        for mtime, size, path in files:
+            if total <= max_size * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with _lock:
+            _cache_size = total
+    finally:
+        _evicting = False
+    return removed
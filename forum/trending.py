@@ -0,0 +1,120 @@
+"""Рейтинги «горячих», «растущих» и «лучших за неделю» тем.
+
+Каждое событие (тема, ответ, лайк, просмотр) имеет вес ``w`` и время ``t``.
+Горячесть темы - ``ln(Σ w * exp((t - EPOCH) / τ))``: вклад события со временем
+затухает экспоненциально, но затухание одинаково для всех тем, поэтому порядок
+не меняется сам по себе и оценку не нужно пересчитывать по часам. Новое событие
+добавляется одним UPDATE через устойчивый logaddexp:
+``max(a, b) + ln(1 + exp(-|a - b|))``. Для «растущих» τ вчетверо меньше.
+
+``weekly_score`` - просто сумма весов; периодический пересчет
+(``recompute_all``: задача celery beat и команда ``recompute_trending``)
+оставляет в ней только события последних 7 дней и исправляет накопившийся
+дрейф остальных оценок.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Value, FloatField
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HOT_TAU = 45000
+RISING_TAU = 11250
+WEEK = 7 * 24 * 3600
+
+THREAD_WEIGHT = 1.0
+POST_WEIGHT = 1.0
+LIKE_WEIGHT = 0.5
+VIEW_WEIGHT = 0.02
+
+LISTING_SIZE = 50
+LISTINGS = {
+    'hot': ('hot_score', 'Горячие'),
+    'rising': ('rising_score', 'Растущие'),
+    'week': ('weekly_score', 'Лучшие за неделю'),
+}
+
+
+def event_log_weight(weight, when, tau):
+    """Логарифм вклада события в оценку с постоянной затухания tau"""
+    return math.log(weight) + (when - EPOCH).total_seconds() / tau
+
+
+def log_sum(values):
+    """ln(Σ exp(v)) без переполнения"""
+    values = list(values)
+    if not values:
+        return None
+    top = max(values)
+    return top + math.log(sum(math.exp(v - top) for v in values))
+
+
+def _logaddexp(field, value):
+    value = Value(value, output_field=FloatField())
+    return Greatest(F(field), value) + Ln(1 + Exp(-Abs(F(field) - value)))
+
+
+def event_updates(weight, when=None):
+    """Аргументы для QuerySet.update(), добавляющие событие ко всем оценкам"""
+    when = when or timezone.now()
+    return {
+        'hot_score': _logaddexp('hot_score', event_log_weight(weight, when, HOT_TAU)),
+        'rising_score': _logaddexp('rising_score', event_log_weight(weight, when, RISING_TAU)),
+        'weekly_score': F('weekly_score') + weight,
+    }
+
+
+def initial_scores(created_at):
+    """Оценки новой темы: единственное событие - ее создание"""
+    return {
+        'hot_score': event_log_weight(THREAD_WEIGHT, created_at, HOT_TAU),
+        'rising_score': event_log_weight(THREAD_WEIGHT, created_at, RISING_TAU),
+        'weekly_score': THREAD_WEIGHT,
+    }
+
+
+def compute_scores(events, now):
+    """Оценки по полному списку событий [(вес, время)] для пакетного пересчета"""
+    week_start = now.timestamp() - WEEK
+    return {
+        'hot_score': log_sum(event_log_weight(w, t, HOT_TAU) for w, t in events) or 0.0,
+        'rising_score': log_sum(event_log_weight(w, t, RISING_TAU) for w, t in events) or 0.0,
+        'weekly_score': sum(w for w, t in events if t.timestamp() >= week_start),
+    }
+
+
+def recompute_all(batch_size=2000, now=None):
+    """Пересчитать оценки всех тем по полному списку событий; возвращает число тем"""
+    from .models import Thread, Post, Like
+    now = now or timezone.now()
+    total = 0
+    last_pk = 0
+    while True:
+        threads = list(Thread.objects.filter(pk__gt=last_pk).order_by('pk')
+                       .only('pk', 'created_at', 'updated_at', 'views')[:batch_size])
+        if not threads:
+            return total
+        ids = [t.pk for t in threads]
+        events = defaultdict(list)
+        for thread in threads:
+            events[thread.pk].append((THREAD_WEIGHT, thread.created_at))
+            if thread.views:
+                # Время просмотров не хранится - относим их к последней активности
+                events[thread.pk].append((VIEW_WEIGHT * thread.views, thread.updated_at))
+        for thread_id, created_at in Post.objects.filter(thread_id__in=ids).values_list('thread_id', 'created_at').iterator():
+            events[thread_id].append((POST_WEIGHT, created_at))
+        likes = Like.objects.filter(post__thread_id__in=ids, like_type=1).values_list('post__thread_id', 'created_at')
+        for thread_id, created_at in likes.iterator():
+            events[thread_id].append((LIKE_WEIGHT, created_at))
+
+        for thread in threads:
+            for field, value in compute_scores(events[thread.pk], now).items():
+                setattr(thread, field, value)
+        with transaction.atomic():
+            Thread.objects.bulk_update(threads, ['hot_score', 'rising_score', 'weekly_score'])
+        total += len(threads)
+        last_pk = ids[-1]
@@ -0,0 +1,191 @@
+"""Возобновляемая загрузка вложений по частям и хранилище с дедупликацией.
+
+Клиент создает сессию (имя файла и размер), затем отправляет части запросами
+``PATCH`` с заголовком ``Upload-Offset``. Тело запроса читается из потока
+блоками по ``READ_SIZE`` и сразу пишется во временный файл, так что воркер
+никогда не держит файл в памяти целиком; SHA-256 считается на лету. Оборванную
+загрузку можно продолжить: ``HEAD`` возвращает принятое смещение.
+
+Готовый файл хранится один раз под путем из хеша (``blobs/ab/cd/<sha256>``);
+повторная загрузка того же содержимого только увеличивает ``Blob.ref_count`` и
+удаляет временный файл. Ссылки держат вложения и архивные сообщения, снимаются
+они в ``post_delete`` (forum/signals.py), в том числе при каскадном удалении.
+Файлы без ссылок удаляет ``gc_uploads``; он же подбирает файлы в blobs/ без
+записи ``Blob`` - их оставляет откат транзакции после перемещения файла.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Attachment, Blob, UploadSession
+
+READ_SIZE = 64 * 1024
+LOCK_TIMEOUT = 60
+MAX_CACHED_HASHERS = 1000
+
+# Хеш принятых байтов по сессиям: продолжает подсчет между запросами к одному
+# процессу. Запрос, попавший в другой воркер, пересчитывает хеш по файлу.
+_hashers = {}
+
+
+class UploadError(Exception):
+    """Ошибка загрузки; status - HTTP-код ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_size():
+    return getattr(settings, 'ATTACHMENT_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def temp_path(session):
+    return default_storage.path(os.path.join('uploads', 'tmp', str(session.pk)))
+
+
+def blob_name(sha256):
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def start(user, post, filename, size):
+    filename = os.path.basename(filename.replace('\\', '/')).strip()[:255]
+    if not filename:
+        raise UploadError('Не указано имя файла')
+    if size <= 0 or size > max_size():
+        raise UploadError(f'Размер файла должен быть от 1 до {max_size()} байт', status=413)
+    return UploadSession.objects.create(user=user, post=post, filename=filename, size=size)
+
+
+def _hasher(session, path):
+    cached = _hashers.get(session.pk)
+    if cached is not None and cached[0] == session.offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    if session.offset:
+        with open(path, 'rb') as f:
+            remaining = session.offset
+            while remaining:
+                block = f.read(min(READ_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def append(session, stream, length):
+    """Дописать в сессию length байт из stream.
+
+    Возвращает созданное вложение, если файл принят полностью, иначе None.
+    """
+    if length > session.size - session.offset:
+        raise UploadError('Часть выходит за объявленный размер файла', status=413)
+    lock = f'forum:upload-lock:{session.pk}'
+    if not cache.add(lock, 1, timeout=LOCK_TIMEOUT):
+        raise UploadError('Часть этого файла уже загружается', status=409)
+    try:
+        path = temp_path(session)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        hasher = _hasher(session, path)
+        offset = session.offset
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # Хвост оборванного запроса отбрасывается: он не вошел в offset
+            f.seek(offset)
+            f.truncate()
+            remaining = length
+            while remaining:
+                block = stream.read(min(READ_SIZE, remaining))
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                remaining -= len(block)
+                offset += len(block)
+        session.offset = offset
+        session.save(update_fields=['offset', 'updated_at'])
+        _hashers.pop(session.pk, None)
+        if len(_hashers) >= MAX_CACHED_HASHERS:
+            _hashers.pop(next(iter(_hashers)))
+        _hashers[session.pk] = (offset, hasher)
+        if offset < session.size:
+            return None
+        return finish(session, hasher.hexdigest())
+    finally:
+        cache.delete(lock)
+
+
+def _store_blob(path, sha256, size):
+    """Blob с содержимым path; временный файл перемещается или удаляется"""
+    blob = Blob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        name = blob_name(sha256)
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        try:
+            with transaction.atomic():
+                return Blob.objects.create(sha256=sha256, file=name, size=size)
+        except IntegrityError:
+            # Тот же файл одновременно загрузили дважды: содержимое совпадает
+            return Blob.objects.get(sha256=sha256)
+    os.remove(path)
+    return blob
+
+
+def finish(session, sha256):
+    _hashers.pop(session.pk, None)
+    with transaction.atomic():
+        blob = _store_blob(temp_path(session), sha256, session.size)
+        attachment = Attachment.objects.create(post_id=session.post_id, blob=blob, file=blob.file.name,
+                                               filename=session.filename, size=session.size)
+        session.delete()
+    return attachment
+
+
+def collect_garbage(now=None, grace=timedelta(hours=24)):
+    """Удалить брошенные сессии и файлы без ссылок старше grace.
+
+    Возвращает (сессий, файлов).
+    """
+    cutoff = (now or timezone.now()) - grace
+    sessions = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        _hashers.pop(session.pk, None)
+        if os.path.exists(temp_path(session)):
+            os.remove(temp_path(session))
+        session.delete()
+        sessions += 1
+    blobs = 0
+    for blob in Blob.objects.filter(ref_count__lte=0, created_at__lt=cutoff, attachments__isnull=True).iterator():
+        with transaction.atomic():
+            if Blob.objects.filter(pk=blob.pk, ref_count__lte=0).delete()[0]:
+                default_storage.delete(blob.file.name)
+                blobs += 1
+    return sessions, blobs + _collect_untracked(cutoff)
+
+
+def _collect_untracked(cutoff):
+    """Удалить файлы в blobs/ старше cutoff, для которых нет записи Blob"""
+    removed = 0
+    root = default_storage.path('blobs')
+    for directory, _, filenames in os.walk(root):
+        paths = {}
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) < cutoff.timestamp():
+                paths[blob_name(filename)] = path
+        if not paths:
+            continue
+        known = set(Blob.objects.filter(file__in=list(paths)).values_list('file', flat=True))
+        for name, path in paths.items():
+            if name not in known:
+                os.remove(path)
+                removed += 1
+    return removed
@@ -7,16 +7,30 @@ urlpatterns = [
     # Главная и категории
     path('', views.index, name='index'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
+    path('category/<slug:slug>/archive/', views.category_archive, name='category_archive'),
     
     # Темы
-    path('thread/<slug:slug>/', views.thread_detail, name='thread_detail'),
     path('thread/create/', views.thread_create, name='thread_create'),
+    path('thread/similar/', views.thread_similar, name='thread_similar'),
+    path('thread/<slug:slug>/', views.thread_detail, name='thread_detail'),
     path('thread/<slug:slug>/edit/', views.thread_edit, name='thread_edit'),
     
     # Сообщения
+    path('post/<int:pk>/', views.post_permalink, name='post_permalink'),
     path('post/<int:pk>/edit/', views.post_edit, name='post_edit'),
     path('post/<int:pk>/like/', views.post_like, name='post_like'),
     path('post/<int:pk>/report/', views.post_report, name='post_report'),
+    path('post/<int:pk>/attachments/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:pk>/', views.upload_chunk, name='upload_chunk'),
+    path('attachments/<int:pk>/', views.attachment_download, name='attachment_download'),
+    path('media/thumb/<int:width>x<int:height>/<path:path>', views.thumbnail, name='thumbnail'),
+    
+    # Рейтинги тем
+    path('trending/<str:kind>/', views.trending, name='trending'),
+    
+    # Теги
+    path('tags/', views.tag_list, name='tag_list'),
+    path('tag/<slug:slug>/', views.tag_detail, name='tag_detail'),
     
     # Поиск
     path('search/', views.search, name='search'),
@@ -2,32 +2,60 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.db.models import Q, Count, Max
+from django.http import HttpResponse, JsonResponse, Http404
+from taggit.models import Tag
+from django.views.decorators.http import require_POST, require_http_methods
 from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.utils import timezone
 
-from .models import Category, Thread, Post, Like, Report, PrivateMessage
+from .models import (Category, Thread, Post, Like, Report, PrivateMessage, TagStat, ArchivedThread, ArchivedPost,
+                     Attachment, UploadSession)
 from .forms import ThreadForm, PostForm, ReportForm, PrivateMessageForm, SearchForm
+from .pagination import PositionPaginator
+from .ratelimit import ratelimit
+from .similar import similar_threads
+from . import tags as tag_pages
+from . import trending as rankings
+from . import fingerprint
+from . import uploads
+from . import thumbnails
+from .rendering import render_many
+from .sendfile import sendfile, file_etag
+
+DUPLICATE_ERROR = 'Вы недавно уже отправляли такое сообщение'
+INDEX_STATS_CACHE_KEY = 'forum:index_stats'
+INDEX_STATS_TIMEOUT = 5 * 60
+VIEWS_DISPLAY_TIMEOUT = 60
 
 
 def index(request):
     """Главная страница форума"""
-    categories = Category.objects.filter(is_active=True).prefetch_related('threads')
-    recent_threads = Thread.objects.filter(is_active=True).select_related('author', 'category').order_by('-updated_at')[:10]
-    
-    # Статистика
-    stats = {
-        'total_threads': Thread.objects.filter(is_active=True).count(),
-        'total_posts': Post.objects.filter(is_active=True).count(),
-        'total_users': settings.AUTH_USER_MODEL and __import__('django.contrib.auth', fromlist=['get_user_model']).get_user_model().objects.count() or 0,
-    }
+    categories = Category.with_stats(Category.objects.filter(is_active=True))
+    threads = Thread.objects.filter(is_active=True).select_related('author', 'category')
+    recent_threads = threads.order_by('-last_post_at')[:10]
+    hot_threads = threads.order_by('-hot_score')[:10]
+    
+    # Статистика: COUNT по всей таблице - полный просмотр, поэтому кешируется
+    stats = cache.get(INDEX_STATS_CACHE_KEY)
+    if stats is None:
+        stats = {
+            'total_threads': Thread.objects.filter(is_active=True).count(),
+            'total_posts': Post.objects.filter(is_active=True).count(),
+            'total_users': settings.AUTH_USER_MODEL and __import__('django.contrib.auth', fromlist=['get_user_model']).get_user_model().objects.count() or 0,
+        }
+        cache.set(INDEX_STATS_CACHE_KEY, stats, timeout=INDEX_STATS_TIMEOUT)
     
     context = {
         'categories': categories,
         'recent_threads': recent_threads,
+        'hot_threads': hot_threads,
         'stats': stats,
+        'tag_cloud': tag_pages.tag_cloud(),
     }
     return render(request, 'forum/index.html', context)
 
@@ -35,7 +63,8 @@ def index(request):
 def category_detail(request, slug):
     """Просмотр категории с темами"""
     category = get_object_or_404(Category, slug=slug, is_active=True)
-    threads_list = category.threads.filter(is_active=True).select_related('author').order_by('-is_pinned', '-updated_at')
+    threads_list = (category.threads.filter(is_active=True).select_related('author', 'last_post_author')
+                    .order_by('-is_pinned', '-last_post_at'))
     
     # Пагинация
     paginator = Paginator(threads_list, settings.THREADS_PER_PAGE)
@@ -45,54 +74,109 @@ def category_detail(request, slug):
     context = {
         'category': category,
         'threads': threads,
+        'has_archive': category.archived_threads.filter(is_active=True).exists(),
     }
     return render(request, 'forum/category_detail.html', context)
 
 
+def category_archive(request, slug):
+    """Архивные темы категории"""
+    category = get_object_or_404(Category, slug=slug, is_active=True)
+    threads_list = category.archived_threads.filter(is_active=True).select_related('author')
+    paginator = Paginator(threads_list, settings.THREADS_PER_PAGE)
+    threads = paginator.get_page(request.GET.get('page'))
+    return render(request, 'forum/category_archive.html', {'category': category, 'threads': threads})
+
+
+@ratelimit('post')
 def thread_detail(request, slug):
     """Просмотр темы с сообщениями"""
-    thread = get_object_or_404(Thread, slug=slug, is_active=True)
-    posts_list = thread.posts.filter(is_active=True).select_related('author').prefetch_related('likes')
+    try:
+        thread = Thread.objects.select_related('category', 'author').get(slug=slug, is_active=True)
+    except Thread.DoesNotExist:
+        return archived_thread_detail(request, slug)
+    posts_list = thread.posts.filter(is_active=True).select_related('author').prefetch_related('likes', 'attachments')
     
-    # Увеличить счетчик просмотров
+    # Увеличить счетчик просмотров. На странице он обновляется раз в
+    # VIEWS_DISPLAY_TIMEOUT секунд: иначе каждая анонимная страница уникальна
+    # и ее сжатие нельзя переиспользовать (forumsite/compression.py)
     thread.increment_views()
+    thread.views = cache.get_or_set(f'forum:thread-views:{thread.pk}', thread.views, VIEWS_DISPLAY_TIMEOUT)
     
-    # Пагинация
-    paginator = Paginator(posts_list, settings.POSTS_PER_PAGE)
+    # Пагинация по номерам сообщений: страница - диапазон position, без OFFSET
+    paginator = PositionPaginator(posts_list, settings.POSTS_PER_PAGE, thread.reply_count, thread.post_sequence)
     page = request.GET.get('page')
     posts = paginator.get_page(page)
     
     # Форма ответа
     if request.method == 'POST' and request.user.is_authenticated and not thread.is_locked:
         form = PostForm(request.POST)
+        if form.is_valid() and fingerprint.is_duplicate(request.user, form.cleaned_data['content']):
+            form.add_error('content', DUPLICATE_ERROR)
         if form.is_valid():
             post = form.save(commit=False)
             post.thread = thread
             post.author = request.user
             post.save()
+            fingerprint.remember(request.user, post.content)
             messages.success(request, 'Сообщение добавлено')
-            return redirect('forum:thread_detail', slug=thread.slug)
+            return redirect(post.get_page_url())
     else:
         form = PostForm()
+
+    # Тема и все сообщения страницы рендерятся одним вызовом
+    html = render_many([thread.content] + [post.content for post in posts])
+    thread.content_html = html[0]
+    for post, content_html in zip(posts, html[1:]):
+        post.content_html = content_html
     
     context = {
         'thread': thread,
         'posts': posts,
         'form': form,
+        'related_threads': thread.related_threads(),
+        'is_watching': request.user.is_authenticated and thread.subscriptions.filter(user=request.user).exists(),
     }
     return render(request, 'forum/thread_detail.html', context)
 
 
+def archived_thread_detail(request, slug):
+    """Тема из архива: только чтение, HTML сообщений заморожен при переносе"""
+    thread = get_object_or_404(ArchivedThread.objects.select_related('category', 'author'), slug=slug, is_active=True)
+    last_position = thread.posts.aggregate(last=Max('position'))['last'] or 0
+    paginator = PositionPaginator(thread.posts.filter(is_active=True).select_related('author'), settings.POSTS_PER_PAGE,
+                                  thread.reply_count, last_position)
+    posts = paginator.get_page(request.GET.get('page'))
+    return render(request, 'forum/thread_archived.html', {'thread': thread, 'posts': posts})
+
+
+def post_permalink(request, pk):
+    """Постоянная ссылка на сообщение: редирект на страницу темы, где оно находится.
+
+    Скрытые сообщения тоже ведут на свою страницу (ссылки из очереди модерации).
+    """
+    post = (Post.objects.filter(pk=pk, thread__is_active=True).select_related('thread')
+            .only('position', 'thread__slug').first())
+    if post is None:
+        post = get_object_or_404(ArchivedPost.objects.select_related('thread').only('position', 'thread__slug'),
+                                 pk=pk, thread__is_active=True)
+    return redirect(post.get_page_url())
+
+
 @login_required
+@ratelimit('thread')
 def thread_create(request):
     """Создание новой темы"""
     if request.method == 'POST':
         form = ThreadForm(request.POST)
+        if form.is_valid() and fingerprint.is_duplicate(request.user, form.cleaned_data['content']):
+            form.add_error('content', DUPLICATE_ERROR)
         if form.is_valid():
             thread = form.save(commit=False)
             thread.author = request.user
             thread.save()
             form.save_m2m()  # Сохранить теги
+            fingerprint.remember(request.user, thread.content)
             messages.success(request, 'Тема создана успешно')
             return redirect('forum:thread_detail', slug=thread.slug)
     else:
@@ -102,6 +186,20 @@ def thread_create(request):
     return render(request, 'forum/thread_create.html', context)
 
 
+@login_required
+def thread_similar(request):
+    """Похожие темы для черновика новой темы (JSON)"""
+    title = request.GET.get('title', '')[:200]
+    content = request.GET.get('content', '')[:5000]
+    threads = similar_threads(title, content) if title or content else []
+    return JsonResponse({
+        'threads': [
+            {'title': t.title, 'url': t.get_absolute_url(), 'category': t.category.name, 'score': round(score, 2)}
+            for t, score in threads
+        ],
+    })
+
+
 @login_required
 def thread_edit(request, slug):
     """Редактирование темы"""
@@ -143,7 +241,7 @@ def post_edit(request, pk):
             post.edited_at = timezone.now()
             post.save()
             messages.success(request, 'Сообщение обновлено')
-            return redirect('forum:thread_detail', slug=post.thread.slug)
+            return redirect(post.get_page_url())
     else:
         form = PostForm(instance=post)
     
@@ -153,10 +251,123 @@ def post_edit(request, pk):
 
 @login_required
 @require_POST
+@ratelimit('upload', json=True)
+def upload_start(request, pk):
+    """Начать загрузку вложения к сообщению (JSON)"""
+    post = get_object_or_404(Post, pk=pk, is_active=True)
+    if post.author != request.user and not request.user.is_moderator():
+        return JsonResponse({'error': 'У вас нет прав добавлять вложения к этому сообщению'}, status=403)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный размер файла'}, status=400)
+    try:
+        session = uploads.start(request.user, post, request.POST.get('filename', ''), size)
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    return JsonResponse({
+        'id': str(session.pk),
+        'offset': session.offset,
+        'url': reverse('forum:upload_chunk', kwargs={'pk': session.pk}),
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_chunk(request, pk):
+    """Часть файла (PATCH с Upload-Offset) или текущее смещение для продолжения"""
+    session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Нужны заголовки Upload-Offset и Content-Length'}, status=400)
+        if offset != session.offset:
+            return JsonResponse({'error': 'Смещение не совпадает', 'offset': session.offset}, status=409)
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            return JsonResponse({'error': 'Слишком большая часть'}, status=413)
+        try:
+            # Тело читается из потока запроса, request.body не используется
+            attachment = uploads.append(session, request, length)
+        except uploads.UploadError as exc:
+            return JsonResponse({'error': str(exc), 'offset': session.offset}, status=exc.status)
+        if attachment is not None:
+            return JsonResponse({'attachment': {
+                'id': attachment.pk,
+                'filename': attachment.filename,
+                'size': attachment.size,
+                'sha256': attachment.blob.sha256,
+                'url': attachment.get_absolute_url(),
+            }}, status=201)
+    response = JsonResponse({'offset': session.offset, 'size': session.size})
+    response['Upload-Offset'] = str(session.offset)
+    return response
+
+
+def _can_view_post(user, post):
+    """Скрытое сообщение (или тема, категория) видно только автору и модераторам"""
+    if post.is_active and post.thread.is_active and post.thread.category.is_active:
+        return True
+    return user.is_authenticated and (post.author_id == user.pk or user.is_moderator())
+
+
+@require_http_methods(['GET', 'HEAD'])
+def attachment_download(request, pk):
+    """Скачивание вложения: права проверяет Django, файл отдает веб-сервер"""
+    attachment = get_object_or_404(Attachment.objects.select_related('blob', 'post__thread__category'), pk=pk)
+    if not _can_view_post(request.user, attachment.post):
+        raise Http404
+    name = attachment.file.name
+    if not default_storage.exists(name):
+        raise Http404
+    etag = attachment.blob.sha256 if attachment.blob_id else file_etag(name)
+    return sendfile(request, name, attachment.filename, attachment.size, etag)
+
+
+@require_http_methods(['GET', 'HEAD'])
+def thumbnail(request, width, height, path):
+    """Уменьшенная копия аватара или вложения-изображения"""
+    if (width, height) not in thumbnails.sizes() or not thumbnails.is_source(path) or not default_storage.exists(path):
+        raise Http404
+    public = path.startswith('avatars/')
+    if not public:
+        # Один файл может быть вложен в несколько сообщений: достаточно одного видимого
+        attachments = Attachment.objects.select_related('post__thread__category')
+        if path.startswith('blobs/'):
+            attachments = attachments.filter(blob__sha256=path.rsplit('/', 1)[-1])
+        else:
+            attachments = attachments.filter(file=path)
+        if not any(_can_view_post(request.user, attachment.post) for attachment in attachments[:20]):
+            raise Http404
+    fmt = thumbnails.output_format(request.headers.get('Accept'))
+    try:
+        name = thumbnails.get_thumbnail(path, width, height, fmt)
+    except thumbnails.ThumbnailError as exc:
+        if exc.status == 404:
+            raise Http404
+        return HttpResponse(str(exc), status=exc.status)
+    etag = name.rsplit('/', 1)[-1].split('.')[0]
+    response = sendfile(request, name, f'{width}x{height}.{fmt}', default_storage.size(name), etag,
+                        content_type=thumbnails.CONTENT_TYPES[fmt])
+    patch_vary_headers(response, ['Accept'])
+    if public:
+        response['Cache-Control'] = 'public, max-age=604800'
+    return response
+
+
+@login_required
+@require_POST
+@ratelimit('like', json=True)
 def post_like(request, pk):
     """Лайк/дизлайк сообщения"""
     post = get_object_or_404(Post, pk=pk)
-    like_type = int(request.POST.get('type', 1))
+    try:
+        like_type = int(request.POST.get('type', 1))
+    except ValueError:
+        like_type = None
+    if like_type not in (1, -1):
+        return JsonResponse({'error': 'Неизвестный тип реакции'}, status=400)
     
     # Проверить существующий лайк
     existing_like = Like.objects.filter(post=post, user=request.user).first()
@@ -188,6 +399,7 @@ def post_like(request, pk):
 
 
 @login_required
+@ratelimit('report')
 def post_report(request, pk):
     """Жалоба на сообщение"""
     post = get_object_or_404(Post, pk=pk)
@@ -200,7 +412,7 @@ def post_report(request, pk):
             report.reporter = request.user
             report.save()
             messages.success(request, 'Жалоба отправлена модераторам')
-            return redirect('forum:thread_detail', slug=post.thread.slug)
+            return redirect(post.get_page_url())
     else:
         form = ReportForm()
     
@@ -208,6 +420,58 @@ def post_report(request, pk):
     return render(request, 'forum/post_report.html', context)
 
 
+def trending(request, kind):
+    """Горячие, растущие и лучшие за неделю темы: глобально или в категории"""
+    if kind not in rankings.LISTINGS:
+        raise Http404
+    field, title = rankings.LISTINGS[kind]
+    threads = Thread.objects.filter(is_active=True)
+    category = None
+    if request.GET.get('category'):
+        category = get_object_or_404(Category, slug=request.GET['category'], is_active=True)
+        threads = threads.filter(category=category)
+    threads = threads.select_related('author', 'category').order_by(f'-{field}')[:rankings.LISTING_SIZE]
+    
+    context = {
+        'threads': threads,
+        'kind': kind,
+        'title': title,
+        'listings': [(key, name) for key, (_, name) in rankings.LISTINGS.items()],
+        'category': category,
+    }
+    return render(request, 'forum/trending.html', context)
+
+
+def tag_list(request):
+    """Все теги по числу тем"""
+    tags_list = TagStat.objects.filter(thread_count__gt=0).select_related('tag').order_by('-thread_count', 'tag_id')
+    
+    paginator = Paginator(tags_list, 100)
+    page = request.GET.get('page')
+    tags = paginator.get_page(page)
+    
+    context = {
+        'tags': tags,
+        'tag_cloud': tag_pages.tag_cloud(),
+    }
+    return render(request, 'forum/tag_list.html', context)
+
+
+def tag_detail(request, slug):
+    """Темы с тегом"""
+    tag = get_object_or_404(Tag.objects.select_related('stat'), slug=slug)
+    after = request.GET.get('after')
+    threads, next_cursor = tag_pages.tag_threads(tag, after=tag_pages.decode_cursor(after))
+    
+    context = {
+        'tag': tag,
+        'threads': threads,
+        'next_cursor': next_cursor,
+        'is_first_page': not after,
+    }
+    return render(request, 'forum/tag_detail.html', context)
+
+
 def search(request):
     """Поиск по форуму"""
     form = SearchForm(request.GET)
@@ -250,7 +514,7 @@ def messages_inbox(request):
     page = request.GET.get('page')
     messages_page = paginator.get_page(page)
     
-    context = {'messages': messages_page}
+    context = {'inbox': messages_page}
     return render(request, 'forum/messages_inbox.html', context)
 
 
@@ -275,6 +539,7 @@ def message_detail(request, pk):
 
 
 @login_required
+@ratelimit('message')
 def message_send(request, username=None):
     """Отправка личного сообщения"""
     from django.contrib.auth import get_user_model
@@ -286,10 +551,13 @@ def message_send(request, username=None):
     
     if request.method == 'POST':
         form = PrivateMessageForm(request.POST)
+        if form.is_valid() and fingerprint.is_duplicate(request.user, form.cleaned_data['content']):
+            form.add_error('content', DUPLICATE_ERROR)
         if form.is_valid():
             message = form.save(commit=False)
             message.sender = request.user
             message.save()
+            fingerprint.remember(request.user, message.content)
             messages.success(request, 'Сообщение отправлено')
             return redirect('forum:messages_inbox')
     else:
@@ -0,0 +1,4 @@
+# Приложение Celery (forumsite.celery) здесь не импортируется: веб-воркеру оно
+# нужно только при постановке задачи, а создание приложения - самая дорогая
+# часть импорта проекта. notifications.tasks импортирует его сам, а
+# `celery -A forumsite` находит модуль forumsite.celery.
@@ -0,0 +1,128 @@
+"""Сжатие динамических ответов brotli или gzip.
+
+Статику сжимает WhiteNoise заранее, а HTML страниц сжимается здесь. Чтобы не
+тратить CPU на одно и то же, сжатое тело кешируется по хешу несжатого:
+одинаковые анонимные страницы (в том числе отданные из page/fragment-кеша)
+сжимаются один раз. Этот же хеш идет в ETag, поэтому повторный запрос с
+``If-None-Match`` получает 304 без тела.
+
+Общим считается только ответ анонимному пользователю, в который не попал
+CSRF-токен (``CSRF_COOKIE_USED``): токен маскируется заново на каждый запрос.
+Тело с максимальным уровнем сжатия кешируется, только когда тот же хеш
+встретился второй раз; страница с другим содержимым на каждый запрос
+сжимается один раз дешевым уровнем, как ответы авторизованным пользователям.
+brotli - необязательная зависимость: без пакета ``Brotli`` используется только
+gzip.
+"""
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_LENGTH = 200
+CACHE_MAX_LENGTH = 512 * 1024
+CACHE_TIMEOUT = 10 * 60
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+# (уровень для кешируемых тел, уровень для разовых)
+BROTLI_QUALITY = (8, 4)
+GZIP_LEVEL = (9, 6)
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме явно запрещенных q=0"""
+    encodings = set()
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header or '')
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding, shared):
+    level = 0 if shared else 1
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY[level])
+    return gzip.compress(content, compresslevel=GZIP_LEVEL[level], mtime=0)
+
+
+def compressed_body(content, encoding, digest, shared):
+    """Сжатое тело; для общих страниц - из кеша"""
+    if not shared or len(content) > CACHE_MAX_LENGTH:
+        return compress(content, encoding, shared=False)
+    key = f'compress:{encoding}:{digest}'
+    body = cache.get(key)
+    if body is None:
+        timeout = getattr(settings, 'COMPRESSION_CACHE_TIMEOUT', CACHE_TIMEOUT)
+        # Первое появление тела - только отметка: уникальные страницы не платят
+        # за максимальный уровень и не забивают кеш
+        if cache.add(f'compress:seen:{digest}', 1, timeout):
+            return compress(content, encoding, shared=False)
+        body = compress(content, encoding, shared=True)
+        cache.set(key, body, timeout)
+    return body
+
+
+class CompressionMiddleware:
+    """Сжатие ответов с кешем сжатых тел и ETag по содержимому"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.status_code != 200 or response.has_header('Content-Encoding')
+                or len(response.content) < MIN_LENGTH
+                or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        content = response.content
+        digest = hashlib.md5(content, usedforsecurity=False).hexdigest()
+        # У сжатого варианта свой ETag: байты отличаются от несжатого ответа
+        original_etag = response.get('ETag')
+        etag = original_etag or f'"{digest}"'
+        response['ETag'] = f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+        if request.method in ('GET', 'HEAD'):
+            conditional = get_conditional_response(request, etag=response['ETag'], response=response)
+            if conditional is not response:
+                return conditional
+
+        user = getattr(request, 'user', None)
+        shared = (user is None or not user.is_authenticated) and not request.META.get('CSRF_COOKIE_USED')
+        body = compressed_body(content, encoding, digest, shared)
+        if len(body) >= len(content):
+            del response['ETag']
+            if original_etag:
+                response['ETag'] = original_etag
+            return response
+        response.content = body
+        response['Content-Length'] = str(len(body))
+        response['Content-Encoding'] = encoding
+        return response
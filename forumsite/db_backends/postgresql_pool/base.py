@@ -0,0 +1,103 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+Django 4.2 не умеет пул соединений сам, поэтому закрытие соединения в конце
+запроса возвращает его в ``psycopg2.pool.ThreadedConnectionPool``, а следующий
+запрос берет готовое соединение без TCP/TLS-рукопожатия и аутентификации.
+Размер пула задается в ``DATABASES[alias]['POOL']``: ``MIN_SIZE`` и ``MAX_SIZE``
+(не меньше числа потоков воркера). Когда все соединения заняты, запрос ждет
+свободное до ``TIMEOUT`` секунд, а потом получает ``OperationalError``, как при
+недоступной базе.
+"""
+import threading
+
+from psycopg2 import OperationalError, extensions, extras, pool
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+DEFAULT_TIMEOUT = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def close_pools():
+    """Закрыть все пулы процесса (например, после fork)"""
+    with _pools_lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool, который при исчерпании ждет, а не бросает PoolError"""
+
+    def __init__(self, minconn, maxconn, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'Нет свободного соединения в пуле за {self.timeout} с')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_pool(self, conn_params):
+        with _pools_lock:
+            connection_pool = _pools.get(self.alias)
+            if connection_pool is None:
+                options = self.settings_dict.get('POOL') or {}
+                connection_pool = _pools[self.alias] = BlockingConnectionPool(
+                    options.get('MIN_SIZE', 1), options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', DEFAULT_TIMEOUT), **conn_params
+                )
+        return connection_pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        try:
+            self.isolation_level = IsolationLevel(isolation_level) if isolation_level is not None \
+                else IsolationLevel.READ_COMMITTED
+        except ValueError:
+            raise ImproperlyConfigured(f'Invalid transaction isolation level {isolation_level} specified.')
+
+        connection_pool = self.get_pool(conn_params)
+        connection = connection_pool.getconn()
+        if connection.closed:
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is None:
+            return
+        connection_pool = _pools.get(self.alias)
+        if connection_pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            broken = bool(self.connection.closed)
+            if not broken and self.connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                # Незавершенная транзакция не должна достаться следующему запросу
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    broken = True
+            connection_pool.putconn(self.connection, close=broken)
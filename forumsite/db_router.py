@@ -0,0 +1,145 @@
+"""Маршрутизация запросов между основной базой и репликами только для чтения.
+
+Записи всегда идут в ``default``. Чтения распределяются по ``DATABASE_REPLICAS``,
+кроме случаев, когда нужна свежесть данных:
+
+* запрос с небезопасным методом (POST и т.п.) целиком читает из основной базы;
+* если такой запрос что-то записал, ответ ставит cookie-метку, и следующие
+  ``REPLICA_STICKY_SECONDS`` секунд пользователь читает свои же записи из
+  основной базы;
+* реплика, отстающая больше ``REPLICA_MAX_LAG`` секунд или недоступная,
+  временно исключается из ротации.
+
+Внутри транзакции основной базы (``transaction.atomic()``) все чтения идут в
+нее же: транзакция видит собственные незакоммиченные записи, реплика - нет.
+Так, ``Post.save`` читает увеличенный ``post_sequence`` сразу после UPDATE.
+Вне HTTP-запросов (команды, фоновые задачи) чтение после закоммиченной записи
+нужно оборачивать в ``use_primary()``.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+STICKY_COOKIE = 'db_primary'
+
+_pinned = ContextVar('db_pinned', default=False)
+_wrote = ContextVar('db_wrote', default=False)
+
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_lag(alias):
+    """Отставание реплики в секундах; None, если реплика недоступна"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        return None
+
+
+def replica_is_healthy(alias):
+    """Проверка отставания с кешированием на REPLICA_LAG_CHECK_INTERVAL секунд в пределах процесса"""
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(alias)
+    if cached is None or now - cached[0] > interval:
+        lag = replica_lag(alias)
+        healthy = lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', 5)
+        cached = (now, healthy)
+        with _lag_lock:
+            _lag_cache[alias] = cached
+    return cached[1]
+
+
+def reset_replica_health():
+    with _lag_lock:
+        _lag_cache.clear()
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут в основную базу"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Запись в основную базу, чтение из здоровых реплик"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        candidates = [alias for alias in replicas() if replica_is_healthy(alias)]
+        return random.choice(candidates) if candidates else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему через репликацию
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Read-your-writes: закрепляет пользователя за основной базой после записи"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        pin_token = _pinned.set(unsafe or STICKY_COOKIE in request.COOKIES)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            # Счетчики вроде increment_views на GET не требуют свежего чтения
+            if unsafe and _wrote.get():
+                response.set_cookie(
+                    STICKY_COOKIE, '1',
+                    max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                    secure=settings.SESSION_COOKIE_SECURE,
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        finally:
+            _wrote.reset(wrote_token)
+            _pinned.reset(pin_token)
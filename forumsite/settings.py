@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     "accounts",
     "forum",
     "moderation",
+    "notifications",
 ]
 
 SITE_ID = 1
@@ -64,11 +65,14 @@ SITE_ID = 1
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "forumsite.compression.CompressionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "forumsite.db_router.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.CachedAuthenticationMiddleware",
+    "accounts.middleware.LastSeenMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
@@ -76,18 +80,28 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "forumsite.urls"
 
+# Compiled templates are cached in process memory. Django only enables cached.Loader
+# on its own when DEBUG=False, so it is configured explicitly: a DEBUG=True staging
+# box can use the cache too (TEMPLATE_CACHE=True). Without it every render re-parses.
+TEMPLATE_CACHE = config('TEMPLATE_CACHE', default=not DEBUG, cast=bool)
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / 'templates'],
-        "APP_DIRS": True,
         "OPTIONS": {
+            "loaders": [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)] if TEMPLATE_CACHE else TEMPLATE_LOADERS,
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "forum.context_processors.site_settings",
+                "notifications.context_processors.notifications",
             ],
         },
     },
@@ -110,6 +124,51 @@ DATABASES = {
     }
 }
 
+# Connection lifetime profile (DB_POOL_MODE):
+#   none       - new connection per request (Django default, fine for development)
+#   persistent - keep connections open for DB_CONN_MAX_AGE seconds with health checks
+#   pool       - in-process psycopg2 pool, connections return to the pool after each request
+#   pgbouncer  - behind PgBouncer in transaction pooling mode (no server-side cursors)
+DB_POOL_MODE = config('DB_POOL_MODE', default='none' if DEBUG else 'persistent')
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = DB_POOL_MODE != 'none'
+if DB_POOL_MODE in ('persistent', 'pgbouncer'):
+    DATABASES["default"]["CONN_MAX_AGE"] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+if DB_POOL_MODE == 'pgbouncer':
+    # Named cursors do not survive transaction pooling; QuerySet.iterator() falls back to chunked fetches
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+if DB_POOL_MODE == 'pool' and DATABASES["default"]["ENGINE"] == 'django.db.backends.postgresql':
+    DATABASES["default"]["ENGINE"] = 'forumsite.db_backends.postgresql_pool'
+    DATABASES["default"]["POOL"] = {
+        "MIN_SIZE": config('DB_POOL_MIN_SIZE', default=1, cast=int),
+        # At least gunicorn --threads per worker
+        "MAX_SIZE": config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        # Seconds to wait for a free connection before OperationalError
+        "TIMEOUT": config('DB_POOL_TIMEOUT', default=30, cast=float),
+    }
+if 'postgresql' in DATABASES["default"]["ENGINE"]:
+    DATABASES["default"]["OPTIONS"] = {"connect_timeout": config('DB_CONNECT_TIMEOUT', default=5, cast=int)}
+
+# Read-only replicas: DB_REPLICAS=replica1.internal,replica2.internal:5433
+# For SQLite each entry is a path to a copy of the database file
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    _alias = f"replica{_index}"
+    DATABASES[_alias] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+    if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        DATABASES[_alias]["NAME"] = _replica
+    else:
+        _host, _, _port = _replica.partition(':')
+        DATABASES[_alias].update(HOST=_host, PORT=_port or DATABASES["default"]["PORT"])
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ["forumsite.db_router.PrimaryReplicaRouter"]
+
+# Replica lag above this many seconds sends reads back to the primary
+REPLICA_MAX_LAG = config('DB_REPLICA_MAX_LAG', default=5.0, cast=float)
+REPLICA_LAG_CHECK_INTERVAL = config('DB_REPLICA_LAG_CHECK_INTERVAL', default=5.0, cast=float)
+# Read-your-writes window after a POST that wrote something
+REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=10, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -151,6 +210,19 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Only MEDIA_ROOT/avatars is served publicly; attachments go through forum.sendfile
+# after a permission check. simple - FileResponse, nginx - X-Accel-Redirect to
+# SENDFILE_URL (internal location aliased to MEDIA_ROOT), xsendfile - X-Sendfile header
+SENDFILE_BACKEND = config('SENDFILE_BACKEND', default='simple')
+SENDFILE_URL = '/protected/'
+
+# Image thumbnails at /media/thumb/<w>x<h>/..., see forum/thumbnails.py
+THUMBNAIL_SIZES = ['64x64', '128x128', '320x320', '640x640']
+THUMBNAIL_WORKERS = config('THUMBNAIL_WORKERS', default=2, cast=int)
+THUMBNAIL_CACHE_MAX_SIZE = config('THUMBNAIL_CACHE_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)
+
+# Editor preview is rendered like posts, sanitizer included, see forum/rendering.py
+MARKDOWNX_MARKDOWNIFY_FUNCTION = 'forum.rendering.render'
 
 # WhiteNoise configuration
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
@@ -202,7 +274,13 @@ CACHES = {
 }
 
 # Session configuration
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# cached_db reads sessions from CACHES (Redis in production) and writes through to the DB
+SESSION_ENGINE = config('SESSION_ENGINE', default="django.contrib.sessions.backends.cached_db")
+
+# Authenticated user objects are cached between requests (invalidated on User.save)
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=300, cast=int)
+# User.last_seen is written at most once per interval (seconds) per user
+LAST_SEEN_UPDATE_INTERVAL = config('LAST_SEEN_UPDATE_INTERVAL', default=300, cast=int)
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = DEBUG
@@ -223,11 +301,68 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Celery: fan-out of notifications and digest emails run on a worker
+# In development tasks run inline unless CELERY_TASK_ALWAYS_EAGER=False
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default=config('REDIS_URL', default='redis://127.0.0.1:6379/0'))
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=DEBUG, cast=bool)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'notification-digests': {
+        'task': 'notifications.tasks.send_digests',
+        'schedule': 15 * 60,
+    },
+    # Drops events older than 7 days from weekly_score and corrects drift of the other scores
+    'recompute-trending': {
+        'task': 'forum.tasks.recompute_trending',
+        'schedule': 60 * 60,
+    },
+    'archive-threads': {
+        'task': 'forum.tasks.archive_threads',
+        'schedule': 24 * 60 * 60,
+    },
+    'gc-uploads': {
+        'task': 'forum.tasks.collect_upload_garbage',
+        'schedule': 6 * 60 * 60,
+    },
+    # Related threads for threads updated since the previous run
+    'build-related': {
+        'task': 'forum.tasks.build_related',
+        'schedule': 60 * 60,
+    },
+    # Catches up profile aggregates after bulk operations that bypass the per-event updates
+    'rebuild-user-stats': {
+        'task': 'forum.tasks.rebuild_user_stats',
+        'schedule': 24 * 60 * 60,
+    },
+}
+# A user receives at most one digest email per interval (seconds)
+NOTIFICATION_DIGEST_INTERVAL = config('NOTIFICATION_DIGEST_INTERVAL', default=3600, cast=int)
+
 # Forum settings
+SITE_NAME = config('SITE_NAME', default='Forum Community')
+SITE_DOMAIN = config('SITE_DOMAIN', default='localhost:8000')
 FORUM_PAGINATION = 20
 POSTS_PER_PAGE = 10
 THREADS_PER_PAGE = 20
 
+# Flood control, see forum/ratelimit.py
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_CACHE = 'default'
+# Reverse proxies (IPs or CIDRs) whose X-Forwarded-For/X-Real-IP identify anonymous clients;
+# without them every client behind nginx shares the proxy's address and one bucket
+RATE_LIMIT_TRUSTED_PROXIES = config('RATE_LIMIT_TRUSTED_PROXIES', default='127.0.0.1,::1', cast=Csv())
+# Overrides of forum.ratelimit.DEFAULT_RATE_LIMITS: action -> (max actions, period in seconds),
+# e.g. {'post': (5, 60)}; actions not listed here keep their defaults
+FORUM_RATE_LIMITS = {}
+# Near-duplicate posts from the same user within the window are rejected
+DUPLICATE_THRESHOLD = 0.8
+DUPLICATE_WINDOW = 3600
+
+# Attachments are uploaded in chunks and stored once per SHA-256, see forum/uploads.py
+ATTACHMENT_MAX_SIZE = config('ATTACHMENT_MAX_SIZE', default=100 * 1024 * 1024, cast=int)
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
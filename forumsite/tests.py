@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+
+from forum.models import Category, Post, Thread
+from . import compression
+from .db_router import (
+    PrimaryReplicaRouter, ReplicaStickinessMiddleware, STICKY_COOKIE,
+    reset_replica_health, use_primary,
+)
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTest(SimpleTestCase):
+    """Тесты маршрутизации чтения на реплики"""
+
+    # Без обертки TestCase в транзакцию: иначе все чтения шли бы в основную базу
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        reset_replica_health()
+
+    def read_db(self):
+        return self.router.db_for_read(User)
+
+    @mock.patch('forumsite.db_router.replica_lag', return_value=0.0)
+    def test_reads_go_to_replicas(self, lag):
+        """Тест: чтение идет на реплики, запись в основную базу"""
+        self.assertIn(self.read_db(), ['replica1', 'replica2'])
+        self.assertEqual(self.router.db_for_write(User), 'default')
+
+    @mock.patch('forumsite.db_router.replica_lag', side_effect=lambda alias: 60.0 if alias == 'replica1' else 0.0)
+    def test_lagging_replica_is_skipped(self, lag):
+        """Тест: отстающая реплика исключается из ротации"""
+        self.assertEqual({self.read_db() for _ in range(20)}, {'replica2'})
+
+    @mock.patch('forumsite.db_router.replica_lag', return_value=None)
+    def test_fallback_to_primary(self, lag):
+        """Тест: без здоровых реплик чтение идет в основную базу"""
+        self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch('forumsite.db_router.replica_lag', return_value=0.0)
+    def test_use_primary(self, lag):
+        """Тест явного закрепления за основной базой"""
+        with use_primary():
+            self.assertEqual(self.read_db(), 'default')
+
+    @mock.patch('forumsite.db_router.replica_lag', return_value=0.0)
+    def test_reads_inside_transaction_use_primary(self, lag):
+        """Тест: внутри транзакции (команды, задачи) чтение после записи идет в основную базу"""
+        with transaction.atomic():
+            self.assertEqual(self.read_db(), 'default')
+            with transaction.atomic():
+                self.assertEqual(self.read_db(), 'default')
+        self.assertIn(self.read_db(), ['replica1', 'replica2'])
+
+    @mock.patch('forumsite.db_router.replica_lag', return_value=0.0)
+    def test_read_your_writes(self, lag):
+        """Тест: после POST с записью ставится метка и чтения идут в основную базу"""
+        seen = []
+
+        def view(request):
+            seen.append(self.read_db())
+            if request.method == 'POST':
+                self.router.db_for_write(User)
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(view)
+        response = middleware(self.factory.post('/'))
+        self.assertEqual(seen[-1], 'default')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        middleware(request)
+        self.assertEqual(seen[-1], 'default')
+
+        response = middleware(self.factory.get('/'))
+        self.assertIn(seen[-1], ['replica1', 'replica2'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Тесты пула соединений PostgreSQL (без сервера: psycopg2.connect подменен)"""
+
+    def make_pool(self):
+        from psycopg2 import extensions
+        from .db_backends.postgresql_pool.base import BlockingConnectionPool
+
+        def connect(*args, **kwargs):
+            return mock.Mock(closed=0, info=mock.Mock(transaction_status=extensions.TRANSACTION_STATUS_IDLE))
+
+        with mock.patch('psycopg2.connect', side_effect=connect):
+            return BlockingConnectionPool(1, 1, timeout=0.05)
+
+    def test_exhausted_pool_waits_then_raises_operational_error(self):
+        """Тест: исчерпанный пул ждет timeout и бросает OperationalError, а не PoolError"""
+        import psycopg2
+        pool = self.make_pool()
+        connection = pool.getconn()
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_post_fork_closes_pools(self):
+        """Тест: воркер gunicorn после fork закрывает унаследованные пулы"""
+        import runpy
+        from django.conf import settings
+        from .db_backends.postgresql_pool import base
+        config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        with mock.patch.dict(base._pools, {'default': self.make_pool()}):
+            config['post_fork'](None, None)
+            self.assertEqual(base._pools, {})
+
+
+class CompressionMiddlewareTest(TestCase):
+    """Тесты сжатия ответов"""
+
+    body = ('<p>Одинаковая анонимная страница</p>' * 50).encode()
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        return HttpResponse(self.body, content_type='text/html; charset=utf-8')
+
+    def get(self, encoding='gzip', user=None, **headers):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=encoding, **headers)
+        request.user = user or AnonymousUser()
+        return compression.CompressionMiddleware(self.view)(request)
+
+    def test_gzip(self):
+        """Тест: тело сжато, ETag отличается от несжатого варианта"""
+        response = self.get()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertTrue(response['ETag'].endswith('-gzip"'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertNotIn('Content-Encoding', self.get(encoding='identity, gzip;q=0'))
+
+    def test_shared_pages_compressed_once(self):
+        """Тест: повторяющаяся анонимная страница сжимается в кеш один раз, авторизованные не кешируются"""
+        with mock.patch('forumsite.compression.compress', wraps=compression.compress) as compress:
+            self.get()
+            second = self.get()
+            third = self.get()
+            self.assertEqual(compress.call_count, 2)
+            self.assertEqual(second.content, third.content)
+            user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass123')
+            self.get(user=user)
+            self.get(user=user)
+            self.assertEqual(compress.call_count, 4)
+
+    def test_csrf_pages_not_shared(self):
+        """Тест: ответ с CSRF-токеном сжимается дешевым уровнем и не кешируется"""
+        for _ in range(2):
+            self.get(CSRF_COOKIE_USED=True)
+        self.assertIsNone(cache.get(f"compress:gzip:{hashlib.md5(self.body, usedforsecurity=False).hexdigest()}"))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_anonymous_thread_page_shared(self):
+        """Тест: страница темы одинакова для анонимных посетителей и получает 304 по ETag"""
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        author = User.objects.create_user(username='author', email='author@example.com', password='testpass123')
+        thread = Thread.objects.create(title='Thread', category=category, author=author, content='Текст ' * 100)
+        Post.objects.create(thread=thread, author=author, content='Ответ')
+        first = self.client.get(thread.get_absolute_url(), HTTP_ACCEPT_ENCODING='gzip')
+        second = self.client.get(thread.get_absolute_url(), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertNotIn('csrfmiddlewaretoken', gzip.decompress(second.content).decode())
+        response = self.client.get(thread.get_absolute_url(), HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified(self):
+        """Тест: совпавший If-None-Match получает 304 без тела"""
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    @skipIf(compression.brotli is None, 'пакет Brotli не установлен')
+    def test_brotli_preferred(self):
+        """Тест: brotli выбирается, если клиент его принимает"""
+        response = self.get(encoding='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), self.body)
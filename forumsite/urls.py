@@ -19,16 +19,37 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.utils.module_loading import import_string
+
+
+def lazy_view(dotted_path):
+    """Class-based view, модуль которой импортируется при первом запросе.
+
+    markdownx.views тянет Pillow и markdown, а нужны они только редактору.
+    """
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view()
+        return view(request, *args, **kwargs)
+    return wrapper
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('accounts/', include('allauth.urls')),
-    path('markdownx/', include('markdownx.urls')),
+    path('markdownx/upload/', lazy_view('markdownx.views.ImageUploadView'), name='markdownx_upload'),
+    path('markdownx/markdownify/', lazy_view('markdownx.views.MarkdownifyView'), name='markdownx_markdownify'),
+    path('moderation/', include('moderation.urls')),
+    path('notifications/', include('notifications.urls')),
     path('', include('forum.urls')),
 ]
 
 # Serve media files in development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Вложения (blobs/, attachments/) только через forum:attachment_download
+    urlpatterns += static(settings.MEDIA_URL + 'avatars/', document_root=settings.MEDIA_ROOT / 'avatars')
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
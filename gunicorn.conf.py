@@ -0,0 +1,46 @@
+"""Настройки gunicorn: gunicorn -c gunicorn.conf.py forumsite.wsgi:application
+
+С preload_app приложение загружается один раз в мастере, а воркеры получают
+импортированный код через fork (copy-on-write): новый воркер после
+max_requests или падения стартует за миллисекунды, а не за время импорта
+Django. Отложенные импорты (Celery, Pillow, markdown) мастер загружает заранее
+через forum.startup.warm_up(). Измерить старт: python manage.py profile_startup
+"""
+import gc
+import os
+import sys
+
+import decouple
+
+bind = decouple.config('GUNICORN_BIND', default='0.0.0.0:8000')
+workers = decouple.config('GUNICORN_WORKERS', default=3, cast=int)
+timeout = decouple.config('GUNICORN_TIMEOUT', default=60, cast=int)
+preload_app = decouple.config('GUNICORN_PRELOAD', default=True, cast=bool)
+# Перезапуск воркеров против утечек памяти; jitter, чтобы не все сразу
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=2000, cast=int)
+max_requests_jitter = 200
+if os.path.isdir('/dev/shm'):
+    # Heartbeat-файл воркера в памяти: в контейнере /tmp может быть на медленном overlayfs
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from forum.startup import warm_up
+    warm_up()
+    # Объекты мастера не трогает сборщик мусора воркеров: страницы памяти остаются общими
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Соединения, открытые в мастере, не должны достаться нескольким воркерам
+    from django.db import connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+    # С DB_POOL_MODE=pool close() только возвращает унаследованный сокет в пул
+    # мастера; пулы закрываются, и воркер открывает свои. Модуль импортирован,
+    # только если пул используется
+    pool = sys.modules.get('forumsite.db_backends.postgresql_pool.base')
+    if pool is not None:
+        pool.close_pools()
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from forum.models import Post, Report, Thread, UserStat
+
+QUEUE_PAGE_SIZE = 25
+
+
+def report_queue(after=None, limit=QUEUE_PAGE_SIZE):
+    """Открытые жалобы, сгруппированные по сообщениям, с keyset-пагинацией.
+
+    Страница читается из таблицы сообщений по денормализованным
+    open_report_count и first_reported_at (индекс post_report_queue_idx),
+    а не группировкой всех открытых жалоб. Сортировка по времени первой
+    открытой жалобы (самые старые сверху), курсор - пара (first_reported,
+    post_id) последней строки предыдущей страницы. Возвращает (группы,
+    курсор следующей страницы или None).
+    """
+    posts = (Post.objects.filter(open_report_count__gt=0, first_reported_at__isnull=False)
+             .select_related('author', 'thread').order_by('first_reported_at', 'pk'))
+    if after is not None:
+        reported, post_id = after
+        posts = posts.filter(Q(first_reported_at__gt=reported) | Q(first_reported_at=reported, pk__gt=post_id))
+
+    posts = list(posts[:limit + 1])
+    has_next = len(posts) > limit
+    posts = posts[:limit]
+
+    post_ids = [post.pk for post in posts]
+    types = {}
+    for row in (Report.objects.filter(post_id__in=post_ids, status__in=Report.OPEN_STATUSES)
+                .values('post_id', 'report_type').annotate(n=Count('id')).order_by()):
+        types.setdefault(row['post_id'], {})[row['report_type']] = row['n']
+    type_names = dict(Report.REPORT_TYPES)
+    groups = [{
+        'post_id': post.pk,
+        'post': post,
+        'report_count': post.open_report_count,
+        'first_reported': post.first_reported_at,
+        'types': [(type_names.get(t, t), n) for t, n in sorted(types.get(post.pk, {}).items())],
+    } for post in posts]
+
+    cursor = encode_cursor(groups[-1]) if has_next else None
+    return groups, cursor
+
+
+def encode_cursor(group):
+    return f"{group['first_reported'].isoformat()}|{group['post_id']}"
+
+
+def decode_cursor(value):
+    """Разбор курсора; некорректный курсор означает первую страницу"""
+    if not value:
+        return None
+    reported, _, post_id = value.rpartition('|')
+    try:
+        return datetime.fromisoformat(reported), int(post_id)
+    except ValueError:
+        return None
+
+
+def refresh_open_report_counts(post_ids):
+    """Пересчет денормализованного счетчика одним UPDATE"""
+    open_reports = Report.objects.filter(post=OuterRef('pk'), status__in=Report.OPEN_STATUSES).order_by()
+    Post.objects.filter(pk__in=post_ids).update(
+        open_report_count=Coalesce(Subquery(open_reports.values('post').annotate(n=Count('pk')).values('n')),
+                                   Value(0)),
+        first_reported_at=Subquery(open_reports.values('post').annotate(first=Min('created_at')).values('first')),
+    )
+
+
+def close_reports(post_ids, moderator, status, note=''):
+    """Закрыть все открытые жалобы на сообщения; возвращает число жалоб"""
+    with transaction.atomic():
+        closed = Report.objects.filter(post_id__in=post_ids, status__in=Report.OPEN_STATUSES).update(
+            status=status,
+            moderator=moderator,
+            moderator_note=note,
+            resolved_at=timezone.now(),
+        )
+        refresh_open_report_counts(post_ids)
+    return closed
+
+
+def deactivate_posts(post_ids, moderator, note=''):
+    """Скрыть сообщения и закрыть жалобы на них как решенные"""
+    with transaction.atomic():
+        hidden = list(Post.objects.filter(pk__in=post_ids, is_active=True)
+                      .values_list('author_id', 'thread__category_id', 'pk'))
+        Post.objects.filter(pk__in=post_ids).update(is_active=False)
+        Thread.refresh_post_stats(Thread.objects.filter(posts__in=post_ids).values('pk'))
+        UserStat.forget([(author_id, category_id, 'post', pk) for author_id, category_id, pk in hidden],
+                        uncount=False)
+        return close_reports(post_ids, moderator, 'resolved', note)
@@ -1,2 +1,71 @@
-# Create your tests here.
-# from django.test import TestCase
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from forum.models import Category, Thread, Post, Report
+from . import services
+
+User = get_user_model()
+
+
+class ModerationQueueTest(TestCase):
+    """Тесты очереди жалоб"""
+    
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='testpass123')
+        self.reporter = User.objects.create_user(username='reporter', email='reporter@example.com', password='testpass123')
+        self.moderator = User.objects.create_user(username='moderator', email='moderator@example.com', password='testpass123', role='moderator')
+        category = Category.objects.create(name='Тест', slug='test')
+        thread = Thread.objects.create(title='Тема', slug='tema', category=category, author=self.author, content='Текст')
+        self.posts = [
+            Post.objects.create(thread=thread, author=self.author, content=f'Сообщение {i}')
+            for i in range(3)
+        ]
+        for post in self.posts:
+            for report_type in ('spam', 'offensive'):
+                Report.objects.create(post=post, reporter=self.reporter, report_type=report_type, description='!')
+    
+    def test_report_updates_open_count(self):
+        """Новая жалоба увеличивает счетчик открытых жалоб"""
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].open_report_count, 2)
+    
+    def test_queue_groups_and_keyset(self):
+        """Жалобы группируются по сообщению, страницы не пересекаются"""
+        first, cursor = services.report_queue(limit=2)
+        self.assertEqual([g['report_count'] for g in first], [2, 2])
+        self.assertIsNotNone(cursor)
+        second, cursor = services.report_queue(after=services.decode_cursor(cursor), limit=2)
+        self.assertIsNone(cursor)
+        ids = [g['post_id'] for g in first + second]
+        self.assertEqual(sorted(ids), sorted(p.pk for p in self.posts))
+    
+    def test_queue_reads_post_table(self):
+        """Страница очереди - два запроса; закрытые жалобы убирают сообщение из очереди"""
+        with self.assertNumQueries(2):
+            groups, _ = services.report_queue()
+        self.assertEqual([g['post_id'] for g in groups], [p.pk for p in self.posts])
+        services.close_reports([self.posts[0].pk], self.moderator, 'rejected')
+        self.posts[0].refresh_from_db()
+        self.assertIsNone(self.posts[0].first_reported_at)
+        groups, _ = services.report_queue()
+        self.assertEqual([g['post_id'] for g in groups], [p.pk for p in self.posts[1:]])
+    
+    def test_bulk_deactivate(self):
+        """Массовое скрытие закрывает жалобы и обнуляет счетчик"""
+        self.client.login(username='moderator', email='moderator@example.com', password='testpass123')
+        response = self.client.post(reverse('moderation:bulk_action'), {
+            'action': 'deactivate',
+            'posts': [self.posts[0].pk, self.posts[1].pk],
+        })
+        self.assertRedirects(response, reverse('moderation:queue'), fetch_redirect_response=False)
+        self.posts[0].refresh_from_db()
+        self.assertFalse(self.posts[0].is_active)
+        self.assertEqual(self.posts[0].open_report_count, 0)
+        self.assertEqual(Report.objects.filter(status='resolved', moderator=self.moderator).count(), 4)
+        self.assertEqual(Report.objects.filter(status__in=Report.OPEN_STATUSES).count(), 2)
+    
+    def test_queue_requires_moderator(self):
+        """Очередь недоступна обычным пользователям"""
+        self.client.login(username='reporter', email='reporter@example.com', password='testpass123')
+        response = self.client.get(reverse('moderation:queue'))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+app_name = 'moderation'
+
+urlpatterns = [
+    path('', views.queue, name='queue'),
+    path('bulk/', views.bulk_action, name='bulk_action'),
+    path('post/<int:pk>/similar/', views.similar, name='similar'),
+]
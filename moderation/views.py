@@ -1,2 +1,65 @@
-# Create your views here.
-# from django.shortcuts import render
+from django.contrib import messages
+from django.contrib.auth.decorators import user_passes_test
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_POST
+
+from forum.models import Post
+from forum.similar import similar_posts
+from .services import report_queue, decode_cursor, close_reports, deactivate_posts
+
+
+def is_moderator(user):
+    return user.is_authenticated and user.is_moderator()
+
+
+moderator_required = user_passes_test(is_moderator)
+
+
+@moderator_required
+def queue(request):
+    """Очередь жалоб, сгруппированных по сообщениям"""
+    groups, next_cursor = report_queue(after=decode_cursor(request.GET.get('after')))
+    
+    context = {
+        'groups': groups,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
+    }
+    return render(request, 'moderation/queue.html', context)
+
+
+@moderator_required
+@require_POST
+def bulk_action(request):
+    """Массовое решение, отклонение жалоб или скрытие сообщений"""
+    action = request.POST.get('action')
+    note = request.POST.get('note', '')
+    post_ids = [int(pk) for pk in request.POST.getlist('posts') if pk.isdigit()]
+    
+    if not post_ids:
+        messages.error(request, 'Не выбрано ни одного сообщения')
+    elif action == 'resolve':
+        count = close_reports(post_ids, request.user, 'resolved', note)
+        messages.success(request, f'Решено жалоб: {count}')
+    elif action == 'reject':
+        count = close_reports(post_ids, request.user, 'rejected', note)
+        messages.success(request, f'Отклонено жалоб: {count}')
+    elif action == 'deactivate':
+        count = deactivate_posts(post_ids, request.user, note)
+        messages.success(request, f'Скрыто сообщений: {len(post_ids)}, закрыто жалоб: {count}')
+    else:
+        messages.error(request, 'Неизвестное действие')
+    
+    return redirect('moderation:queue')
+
+
+@moderator_required
+def similar(request, pk):
+    """Похожие сообщения по всему форуму: поиск повторов спама"""
+    post = get_object_or_404(Post.objects.select_related('author', 'thread'), pk=pk)
+    
+    context = {
+        'post': post,
+        'similar': similar_posts(post),
+    }
+    return render(request, 'moderation/similar.html', context)
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from .models import ThreadSubscription, Notification, NotificationState
+
+
+@admin.register(ThreadSubscription)
+class ThreadSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'thread', 'created_at')
+    raw_id_fields = ('user', 'thread')
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'kind', 'actor', 'is_read', 'emailed', 'created_at')
+    list_filter = ('kind', 'is_read', 'emailed')
+    raw_id_fields = ('recipient', 'actor', 'thread', 'post', 'message')
+
+
+@admin.register(NotificationState)
+class NotificationStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'unread_count', 'total_count', 'last_digest_at')
+    raw_id_fields = ('user',)
@@ -0,0 +1,10 @@
+from .models import NotificationState
+
+
+def notifications(request):
+    """Число непрочитанных уведомлений для навигации (один запрос по первичному ключу)"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    state = NotificationState.objects.filter(user_id=user.pk).values_list('unread_count', flat=True).first()
+    return {'unread_notifications': state or 0}
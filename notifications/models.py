@@ -0,0 +1,106 @@
+from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.conf import settings
+from django.urls import reverse
+
+
+class ThreadSubscription(models.Model):
+    """Подписка пользователя на ответы в теме"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='thread_subscriptions')
+    thread = models.ForeignKey('forum.Thread', on_delete=models.CASCADE, related_name='subscriptions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Подписка на тему'
+        verbose_name_plural = 'Подписки на темы'
+        # (thread, user): рассылка читает подписчиков темы по индексу в порядке user_id
+        unique_together = ('thread', 'user')
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.thread_id}"
+
+
+class Notification(models.Model):
+    """Уведомление пользователя"""
+    KINDS = (
+        ('reply', 'Ответ в теме'),
+        ('mention', 'Упоминание'),
+        ('message', 'Личное сообщение'),
+    )
+    
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, related_name='+')
+    thread = models.ForeignKey('forum.Thread', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    post = models.ForeignKey('forum.Post', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    message = models.ForeignKey('forum.PrivateMessage', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    is_read = models.BooleanField(default=False)
+    emailed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at']),
+            # Дайджест выбирает только неотправленные непрочитанные уведомления
+            models.Index(fields=['recipient', 'created_at'], name='notification_digest_idx',
+                         condition=models.Q(emailed=False, is_read=False)),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} для {self.recipient_id}"
+    
+    def get_absolute_url(self):
+        if self.message_id:
+            return reverse('forum:message_detail', kwargs={'pk': self.message_id})
+        if self.post_id:
+            return self.post.get_absolute_url()
+        return self.thread.get_absolute_url()
+
+
+class NotificationState(models.Model):
+    """Денормализованные счетчики уведомлений пользователя"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_state')
+    unread_count = models.PositiveIntegerField(default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    last_digest_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Счетчики уведомлений'
+        verbose_name_plural = 'Счетчики уведомлений'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_count}/{self.total_count}"
+    
+    @property
+    def read_count(self):
+        return self.total_count - self.unread_count
+    
+    @classmethod
+    def add(cls, user_ids, count=1):
+        """Учесть count новых непрочитанных уведомлений у каждого из пользователей"""
+        user_ids = list(user_ids)
+        cls.objects.bulk_create([cls(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(
+            unread_count=F('unread_count') + count,
+            total_count=F('total_count') + count,
+        )
+    
+    @classmethod
+    def refresh(cls, user_ids):
+        """Пересчитать счетчики по таблице уведомлений (после массового удаления)"""
+        notifications = Notification.objects.filter(recipient=OuterRef('user_id')).order_by().values('recipient')
+        cls.objects.filter(user_id__in=user_ids).update(
+            unread_count=Coalesce(Subquery(notifications.filter(is_read=False).annotate(n=Count('pk')).values('n')),
+                                  Value(0)),
+            total_count=Coalesce(Subquery(notifications.annotate(n=Count('pk')).values('n')), Value(0)),
+        )
+    
+    @classmethod
+    def mark_read(cls, user_id, count):
+        if count:
+            cls.objects.filter(user_id=user_id).update(unread_count=Greatest(F('unread_count') - count, 0))
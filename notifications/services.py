@@ -0,0 +1,174 @@
+"""Рассылка уведомлений и дайджестов.
+
+Функции вызываются из задач Celery (``tasks.py``): ответ в теме с тысячами
+подписчиков обрабатывается пачками по ``FANOUT_BATCH`` подписчиков, каждая
+пачка - один ``bulk_create`` уведомлений и один UPDATE счетчиков, а следующая
+пачка ставится отдельной задачей, чтобы одна большая тема не занимала воркер.
+"""
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from forum.models import Thread, Post, PrivateMessage
+from .models import ThreadSubscription, Notification, NotificationState
+
+User = get_user_model()
+
+FANOUT_BATCH = 1000
+MAX_MENTIONS = 20
+DIGEST_BATCH = 200
+DIGEST_MAX_ITEMS = 20
+
+_code_re = re.compile(r'```.*?```|`[^`\n]*`', re.S)
+_mention_re = re.compile(r'(?<![\w@])@([\w.@+-]{1,150})')
+
+
+def parse_mentions(text):
+    """Имена пользователей, упомянутых как @username (кроме блоков кода)"""
+    names = []
+    for name in _mention_re.findall(_code_re.sub(' ', text)):
+        name = name.rstrip('.')
+        if name and name not in names:
+            names.append(name)
+    return names[:MAX_MENTIONS]
+
+
+def subscribe(user_id, thread_id):
+    ThreadSubscription.objects.bulk_create([ThreadSubscription(user_id=user_id, thread_id=thread_id)],
+                                           ignore_conflicts=True)
+
+
+def notify(recipient_ids, **fields):
+    """Создать одинаковые уведомления для списка получателей"""
+    recipient_ids = list(recipient_ids)
+    if not recipient_ids:
+        return 0
+    with transaction.atomic():
+        Notification.objects.bulk_create([Notification(recipient_id=pk, **fields) for pk in recipient_ids])
+        NotificationState.add(recipient_ids)
+    return len(recipient_ids)
+
+
+def notify_mentions(text, actor_id, **fields):
+    """Уведомить упомянутых пользователей; возвращает их id"""
+    names = parse_mentions(text)
+    if not names:
+        return set()
+    mentioned = set(User.objects.filter(username__in=names, is_active=True)
+                    .exclude(pk=actor_id).values_list('pk', flat=True))
+    notify(mentioned, kind='mention', actor_id=actor_id, **fields)
+    return mentioned
+
+
+def fan_out_post(post_id, after_user_id=0):
+    """Одна пачка рассылки об ответе: упоминания, затем подписчики темы.
+
+    Возвращает id последнего обработанного подписчика или None, если
+    подписчики закончились.
+    """
+    post = Post.objects.filter(pk=post_id, is_active=True).only('thread_id', 'author_id', 'content').first()
+    if post is None:
+        return None
+    fields = {'actor_id': post.author_id, 'thread_id': post.thread_id, 'post_id': post.pk}
+
+    if not after_user_id:
+        subscribe(post.author_id, post.thread_id)
+        notify_mentions(post.content, **fields)
+    # Упомянутый подписчик получает только упоминание
+    mentioned = set(Notification.objects.filter(post_id=post.pk, kind='mention').values_list('recipient_id', flat=True))
+
+    chunk = list(ThreadSubscription.objects.filter(thread_id=post.thread_id, user_id__gt=after_user_id)
+                 .exclude(user_id=post.author_id).order_by('user_id')
+                 .values_list('user_id', flat=True)[:FANOUT_BATCH])
+    notify((pk for pk in chunk if pk not in mentioned), kind='reply', **fields)
+    return chunk[-1] if len(chunk) == FANOUT_BATCH else None
+
+
+def fan_out_thread(thread_id):
+    """Новая тема: подписать автора и уведомить упомянутых"""
+    thread = Thread.objects.filter(pk=thread_id).only('author_id', 'content').first()
+    if thread is None:
+        return
+    subscribe(thread.author_id, thread.pk)
+    notify_mentions(thread.content, thread.author_id, thread_id=thread.pk)
+
+
+def notify_message(message_id):
+    message = PrivateMessage.objects.filter(pk=message_id).only('sender_id', 'recipient_id').first()
+    if message is not None and message.recipient_id != message.sender_id:
+        notify([message.recipient_id], kind='message', actor_id=message.sender_id, message_id=message.pk)
+
+
+def send_digests(now=None):
+    """Одно письмо на пользователя со всеми неотправленными непрочитанными уведомлениями.
+
+    Пользователь получает дайджест не чаще раза в NOTIFICATION_DIGEST_INTERVAL
+    секунд; все письма пачки уходят через одно соединение EMAIL_BACKEND.
+    Возвращает число отправленных писем.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'NOTIFICATION_DIGEST_INTERVAL', 3600))
+    pending = Notification.objects.filter(emailed=False, is_read=False, created_at__lte=now)
+    due = (NotificationState.objects.filter(user_id__in=pending.values('recipient_id'))
+           .filter(Q(last_digest_at__isnull=True) | Q(last_digest_at__lte=cutoff))
+           .values_list('user_id', flat=True))
+    user_ids = list(due)
+    sent = 0
+    for offset in range(0, len(user_ids), DIGEST_BATCH):
+        users = list(User.objects.filter(pk__in=user_ids[offset:offset + DIGEST_BATCH]).select_related('profile'))
+        recipients = [user for user in users if _wants_digest(user)]
+        items, totals = _digest_items(pending, [user.pk for user in recipients])
+        emails = []
+        for user in recipients:
+            total = totals.get(user.pk, 0)
+            context = {'user': user, 'items': items.get(user.pk, []), 'total': total,
+                       'more': total - len(items.get(user.pk, [])),
+                       'site_name': settings.SITE_NAME,
+                       'site_url': f"{'http' if settings.DEBUG else 'https'}://{settings.SITE_DOMAIN}"}
+            emails.append(EmailMessage(
+                subject=f"{context['site_name']}: новых уведомлений - {total}",
+                body=render_to_string('notifications/digest_email.txt', context),
+                to=[user.email],
+            ))
+        if emails:
+            with get_connection() as connection:
+                sent += connection.send_messages(emails) or 0
+        batch = [user.pk for user in users]
+        # Отказавшиеся от писем тоже помечаются, чтобы не попадать в выборку снова
+        pending.filter(recipient_id__in=batch).update(emailed=True)
+        NotificationState.objects.filter(user_id__in=batch).update(last_digest_at=now)
+    return sent
+
+
+def _wants_digest(user):
+    profile = getattr(user, 'profile', None)
+    return bool(user.email) and (profile is None or profile.email_notifications)
+
+
+def _digest_items(pending, user_ids):
+    """Последние DIGEST_MAX_ITEMS уведомлений и их общее число для пачки пользователей одним запросом.
+
+    Возвращает ({пользователь: уведомления, новые первыми}, {пользователь: всего}).
+    """
+    items, totals = {}, {}
+    if not user_ids:
+        return items, totals
+    by_recipient = {'partition_by': F('recipient_id')}
+    rows = (pending.filter(recipient_id__in=user_ids)
+            .annotate(rank=Window(RowNumber(), order_by=[F('created_at').desc(), F('pk').desc()], **by_recipient),
+                      total=Window(Count('pk'), **by_recipient))
+            .filter(rank__lte=DIGEST_MAX_ITEMS)
+            .select_related('actor', 'thread', 'post__thread')
+            .order_by('recipient_id', 'rank'))
+    for notification in rows:
+        items.setdefault(notification.recipient_id, []).append(notification)
+        totals[notification.recipient_id] = notification.total
+    return items, totals
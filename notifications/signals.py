@@ -0,0 +1,47 @@
+"""Постановка рассылки в очередь после коммита: сохранение сообщения не ждет рассылку.
+
+Модуль задач (и вместе с ним Celery) импортируется при первой постановке, а не
+при загрузке приложения. Недоступный брокер не превращает уже сохраненное
+сообщение в ошибку 500: задача теряется, ошибка пишется в лог.
+"""
+import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from forum.models import Thread, Post, PrivateMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def _delay(name, *args):
+    from . import tasks
+    try:
+        getattr(tasks, name).delay(*args)
+    except Exception:
+        logger.exception('Could not enqueue %s%r: broker unavailable', name, args)
+
+
+def enqueue(name, *args):
+    transaction.on_commit(partial(_delay, name, *args))
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enqueue('fan_out_post', instance.pk)
+
+
+@receiver(post_save, sender=Thread)
+def thread_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enqueue('fan_out_thread', instance.pk)
+
+
+@receiver(post_save, sender=PrivateMessage)
+def message_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enqueue('notify_message', instance.pk)
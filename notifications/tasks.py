@@ -0,0 +1,26 @@
+from forumsite.celery import app
+
+from . import services
+
+
+@app.task(ignore_result=True)
+def fan_out_post(post_id, after_user_id=0):
+    last = services.fan_out_post(post_id, after_user_id)
+    if last is not None:
+        # Следующая пачка подписчиков - отдельной задачей
+        fan_out_post.delay(post_id, last)
+
+
+@app.task(ignore_result=True)
+def fan_out_thread(thread_id):
+    services.fan_out_thread(thread_id)
+
+
+@app.task(ignore_result=True)
+def notify_message(message_id):
+    services.notify_message(message_id)
+
+
+@app.task(ignore_result=True)
+def send_digests():
+    return services.send_digests()
@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from forum.models import Category, Thread, Post, PrivateMessage
+from . import services
+from .models import ThreadSubscription, Notification, NotificationState
+
+User = get_user_model()
+
+
+class NotificationFanOutTest(TestCase):
+    """Тесты рассылки уведомлений"""
+    
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com', password='testpass123')
+        self.watchers = [
+            User.objects.create_user(username=f'watcher{i}', email=f'watcher{i}@example.com', password='testpass123')
+            for i in range(5)
+        ]
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        self.thread = Thread.objects.create(title='Test Thread', category=category, author=self.author, content='Текст')
+        ThreadSubscription.objects.bulk_create(
+            [ThreadSubscription(thread=self.thread, user=user) for user in self.watchers + [self.author]]
+        )
+    
+    def fan_out(self, post):
+        last = services.fan_out_post(post.pk)
+        while last is not None:
+            last = services.fan_out_post(post.pk, last)
+    
+    def test_reply_is_queued_after_commit(self):
+        """Тест: сохранение ответа только ставит рассылку в очередь после коммита"""
+        with mock.patch('notifications.tasks.fan_out_post.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(thread=self.thread, author=self.watchers[0], content='Ответ')
+                delay.assert_not_called()
+        delay.assert_called_once_with(post.pk)
+        self.assertFalse(Notification.objects.exists())
+    
+    def test_broker_failure_is_logged(self):
+        """Тест: недоступный брокер не ломает уже сохраненный ответ"""
+        with mock.patch('notifications.tasks.fan_out_post.delay', side_effect=ConnectionError('broker down')):
+            with self.assertLogs('notifications.signals', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Post.objects.create(thread=self.thread, author=self.watchers[0], content='Ответ')
+        self.assertTrue(Post.objects.filter(content='Ответ').exists())
+    
+    def test_fan_out_in_batches(self):
+        """Тест: все подписчики, кроме автора ответа, получают уведомление пачками"""
+        post = Post.objects.create(thread=self.thread, author=self.watchers[0], content='Ответ')
+        with mock.patch('notifications.services.FANOUT_BATCH', 2):
+            self.fan_out(post)
+        recipients = set(Notification.objects.filter(kind='reply').values_list('recipient_id', flat=True))
+        self.assertEqual(recipients, {user.pk for user in self.watchers[1:] + [self.author]})
+        state = NotificationState.objects.get(user=self.author)
+        self.assertEqual((state.unread_count, state.total_count), (1, 1))
+    
+    def test_mentions(self):
+        """Тест: упоминание вместо ответа, код не считается упоминанием"""
+        self.assertEqual(services.parse_mentions('Привет, @watcher1. См. `@watcher2` и ```\n@watcher3\n```'),
+                         ['watcher1'])
+        post = Post.objects.create(thread=self.thread, author=self.watchers[0], content='@watcher1, глянь')
+        self.fan_out(post)
+        kinds = dict(Notification.objects.filter(recipient=self.watchers[1]).values_list('kind', 'post'))
+        self.assertEqual(kinds, {'mention': post.pk})
+    
+    def test_digest_coalesces_events(self):
+        """Тест: много событий - одно письмо, повторно письмо не уходит"""
+        for i in range(3):
+            self.fan_out(Post.objects.create(thread=self.thread, author=self.watchers[0], content=f'Ответ {i}'))
+        message = PrivateMessage.objects.create(sender=self.watchers[0], recipient=self.author, subject='Тема', content='Текст')
+        services.notify_message(message.pk)
+        
+        self.assertEqual(services.send_digests(), 5)
+        to_author = [email for email in mail.outbox if email.to == ['author@example.com']]
+        self.assertEqual(len(to_author), 1)
+        self.assertIn('4', to_author[0].subject)
+        self.assertEqual(services.send_digests(), 0)
+    
+    def test_digest_queries_per_batch(self):
+        """Тест: число запросов дайджеста не растет с числом получателей в пачке"""
+        def send(recipients):
+            for i in range(2):
+                self.fan_out(Post.objects.create(thread=self.thread, author=self.author, content=f'Ответ {i}'))
+            NotificationState.objects.update(last_digest_at=None)
+            with self.assertNumQueries(5):
+                self.assertEqual(services.send_digests(), recipients)
+        send(5)
+        ThreadSubscription.objects.filter(user__in=self.watchers[2:]).delete()
+        send(2)
+    
+    def test_mark_read_updates_counter(self):
+        """Тест: открытие уведомления уменьшает счетчик непрочитанных"""
+        self.fan_out(Post.objects.create(thread=self.thread, author=self.watchers[0], content='Ответ'))
+        notification = Notification.objects.get(recipient=self.author)
+        self.client.login(username='author', password='testpass123')
+        self.client.get(reverse('notifications:open', kwargs={'pk': notification.pk}))
+        self.assertEqual(NotificationState.objects.get(user=self.author).unread_count, 0)
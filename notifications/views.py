@@ -0,0 +1,57 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_POST
+
+from forum.models import Thread
+from .models import ThreadSubscription, Notification, NotificationState
+
+
+@login_required
+def notification_list(request):
+    """Уведомления пользователя"""
+    notifications_list = (request.user.notifications.all()
+                          .select_related('actor', 'thread', 'post__thread'))
+    
+    paginator = Paginator(notifications_list, 30)
+    page = request.GET.get('page')
+    notifications = paginator.get_page(page)
+    
+    context = {'notifications': notifications}
+    return render(request, 'notifications/list.html', context)
+
+
+@login_required
+def notification_open(request, pk):
+    """Отметить уведомление прочитанным и перейти к нему"""
+    notification = get_object_or_404(
+        Notification.objects.select_related('thread', 'post__thread'), pk=pk, recipient=request.user
+    )
+    if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+        NotificationState.mark_read(request.user.pk, 1)
+    return redirect(notification.get_absolute_url())
+
+
+@login_required
+@require_POST
+def mark_all_read(request):
+    """Отметить все уведомления прочитанными"""
+    count = request.user.notifications.filter(is_read=False).update(is_read=True)
+    NotificationState.mark_read(request.user.pk, count)
+    messages.success(request, 'Все уведомления прочитаны')
+    return redirect('notifications:list')
+
+
+@login_required
+@require_POST
+def toggle_watch(request, thread_id):
+    """Подписаться на тему или отписаться от нее"""
+    thread = get_object_or_404(Thread, pk=thread_id, is_active=True)
+    deleted, _ = ThreadSubscription.objects.filter(thread=thread, user=request.user).delete()
+    if deleted:
+        messages.success(request, 'Вы отписались от темы')
+    else:
+        ThreadSubscription.objects.get_or_create(thread=thread, user=request.user)
+        messages.success(request, 'Вы будете получать уведомления об ответах')
+    return redirect(thread.get_absolute_url())